@@ -1,10 +1,15 @@
+import argparse
 import json
 import logging
 import os
 import pprint
 
-from .api_sessions import create_api_sessions, get_actor_token
-from .automerge import automerge_pr
+from .api_sessions import create_api_sessions, get_actor_token, get_http_adapter
+from .async_automerge import DEFAULT_MAX_CONCURRENCY
+from .automerge import EVALUATION_MAX_WORKERS, PREFILTER_STATS
+from .events import _evaluate_event, _triage_event
+from .server import DEFAULT_WORKERS, AutomergeServer
+from .sweep import DEFAULT_SWEEP_CONCURRENCY, format_summary, sweep
 
 LOGGER = logging.getLogger(__name__)
 
@@ -12,43 +17,38 @@ LOGGER = logging.getLogger(__name__)
 def main():
     logging.basicConfig(level=logging.INFO)
 
-    LOGGER.info("making API clients")
-
-    gh = create_api_sessions(get_actor_token()[1])
-
     with open(os.environ["GITHUB_EVENT_PATH"]) as fp:
         event_data = json.load(fp)
     event_name = os.environ["GITHUB_EVENT_NAME"].lower()
 
     LOGGER.info("github event: %s", event_name)
 
-    raise_error = False
-    if event_name in ["status", "check_suite", "workflow_run"]:
-        if event_name == "status":
-            sha = event_data["sha"]
-        elif event_name == "check_suite":
-            sha = event_data["check_suite"]["head_sha"]
-        elif event_name == "workflow_run":
-            sha = event_data["workflow_run"]["head_sha"]
-        else:
-            raise NotImplementedError(f"Should never happen. {event_name=}")
-
-        repo = gh.get_repo(os.environ["GITHUB_REPOSITORY"])
-        for pr in repo.get_pulls():
-            if pr.head.sha == sha:
-                automerge_pr(repo, pr)
-
-    elif event_name in ["pull_request", "pull_request_review"]:
-        event_data = event_data["pull_request"]
-        repo_name = event_data["base"]["repo"]["full_name"]
-        pr_num = int(event_data["number"])
+    evaluate, reason = _triage_event(event_name, event_data)
+    if not evaluate:
+        LOGGER.info("skipping the %s event since %s", event_name, reason)
+        return
 
-        repo = gh.get_repo(repo_name)
-        pr = repo.get_pull(pr_num)
+    LOGGER.info("making API clients")
 
-        automerge_pr(repo, pr)
-    else:
-        raise_error = True
+    # each PR evaluated at once uses a few threads for its API calls
+    gh = create_api_sessions(
+        get_actor_token()[1],
+        pool_maxsize=DEFAULT_MAX_CONCURRENCY * EVALUATION_MAX_WORKERS,
+    )
+
+    supported = _evaluate_event(
+        gh, event_name, event_data, os.environ["GITHUB_REPOSITORY"]
+    )
+
+    LOGGER.info("PR pre-filter gates: %s", dict(PREFILTER_STATS))
+
+    adapter = get_http_adapter(gh)
+    if adapter is not None:
+        LOGGER.info(
+            "API requests saved: %d memoized, %d not modified (304)",
+            adapter.memo_hits,
+            adapter.hits,
+        )
 
     print(
         "\n\n===================================================================="
@@ -61,8 +61,136 @@ def main():
         flush=True,
     )
     print("::group::event data", flush=True)
+    if event_name in ["pull_request", "pull_request_review"]:
+        event_data = event_data["pull_request"]
     print("github event data:\n%s\n\n" % pprint.pformat(event_data), flush=True)
     print("::endgroup::", flush=True)
 
-    if raise_error:
+    if not supported:
         raise ValueError("GitHub event %s cannot be processed!" % event_name)
+
+
+def _get_serve_token():
+    """Get the token for `serve` from `AUTOMERGE_GITHUB_TOKEN_FILE` if set,
+    or else the same way as the action."""
+    path = os.environ.get("AUTOMERGE_GITHUB_TOKEN_FILE", "")
+    if path:
+        with open(path) as fp:
+            return fp.read().strip()
+    return get_actor_token()[1]
+
+
+def serve(host="127.0.0.1", port=8080, workers=None, window=None):
+    """Evaluate webhook deliveries in a long-running server.
+
+    The webhook secret is read from `AUTOMERGE_WEBHOOK_SECRET` and the
+    other inputs from the same `INPUT_*` variables as the action. The token
+    is read from `INPUT_GITHUB_TOKEN`, which must not expire, unless
+    `AUTOMERGE_GITHUB_TOKEN_FILE` points to a file that is kept up to date
+    with a current token (e.g., a GitHub App installation token). The file
+    is read again for new API sessions every
+    `server.SESSIONS_REFRESH_SECONDS` and whenever the API rejects the
+    token. See `server.AutomergeServer`.
+    """
+    logging.basicConfig(level=logging.INFO)
+
+    workers = workers or DEFAULT_WORKERS
+    pool_maxsize = workers * DEFAULT_MAX_CONCURRENCY * EVALUATION_MAX_WORKERS
+    gh = create_api_sessions(_get_serve_token(), pool_maxsize=pool_maxsize)
+
+    make_sessions = None
+    if os.environ.get("AUTOMERGE_GITHUB_TOKEN_FILE", ""):
+        # new sessions keep the HTTP cache and the rate limit budgets
+        adapter = get_http_adapter(gh)
+
+        def make_sessions():
+            return create_api_sessions(
+                _get_serve_token(),
+                http_cache=adapter.store,
+                pool_maxsize=pool_maxsize,
+                governor=adapter.governor,
+            )
+
+    server = AutomergeServer(
+        gh,
+        os.environ.get("AUTOMERGE_WEBHOOK_SECRET", ""),
+        host=host,
+        port=port,
+        workers=workers,
+        window=window,
+        make_sessions=make_sessions,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+def run_sweep(org="conda-forge", max_concurrency=None):
+    """Possibly automerge all open bot PRs of an org and print a summary.
+
+    See `sweep.sweep`.
+    """
+    logging.basicConfig(level=logging.INFO)
+
+    max_concurrency = max_concurrency or DEFAULT_SWEEP_CONCURRENCY
+    gh = create_api_sessions(
+        get_actor_token()[1],
+        pool_maxsize=max_concurrency * EVALUATION_MAX_WORKERS,
+    )
+    summary = sweep(gh, org=org, max_concurrency=max_concurrency)
+    LOGGER.info("PR pre-filter gates: %s", dict(PREFILTER_STATS))
+    print(format_summary(summary), flush=True)
+
+
+def cli(argv=None):
+    """The `run-automerge-action` command.
+
+    Without a subcommand, the event of the GitHub Actions run is processed.
+    """
+    parser = argparse.ArgumentParser(prog="run-automerge-action")
+    subparsers = parser.add_subparsers(dest="command")
+
+    serve_parser = subparsers.add_parser(
+        "serve", help="evaluate GitHub webhook deliveries in a long-running server"
+    )
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    serve_parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="the number of events evaluated at the same time",
+    )
+    serve_parser.add_argument(
+        "--debounce-window",
+        type=float,
+        default=None,
+        help="the seconds to wait for more events for the same repo and SHA",
+    )
+
+    sweep_parser = subparsers.add_parser(
+        "sweep", help="evaluate all open bot PRs of an org"
+    )
+    sweep_parser.add_argument("--org", default="conda-forge")
+    sweep_parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=None,
+        help="the number of PRs fetched and evaluated at the same time",
+    )
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        serve(
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            window=args.debounce_window,
+        )
+    elif args.command == "sweep":
+        run_sweep(org=args.org, max_concurrency=args.max_concurrency)
+    else:
+        main()
@@ -1,9 +1,39 @@
+import contextlib
+import contextvars
+import hashlib
+import json
+import logging
 import os
+import sqlite3
+import threading
 import time
+import urllib.parse
 
+import requests
 import urllib3.util.retry
 from github import Github
 
+from .cache import LRUCache
+
+LOGGER = logging.getLogger(__name__)
+
+# set by `fresh_requests` to skip the memoized responses
+_BYPASS_MEMO = contextvars.ContextVar("bypass_memo", default=False)
+
+
+@contextlib.contextmanager
+def fresh_requests():
+    """Make GET requests in this context skip the memoized responses.
+
+    Use this for data that must be current, e.g., the `mergeable` state of
+    a PR. The responses still refresh the memo.
+    """
+    token = _BYPASS_MEMO.set(True)
+    try:
+        yield
+    finally:
+        _BYPASS_MEMO.reset(token)
+
 
 def get_actor_token():
     # we use the token reset time as a proxy for when it expires
@@ -31,22 +61,465 @@ def get_actor_token():
         return "x-access-token", os.environ["INPUT_GITHUB_TOKEN"], False
 
 
-def create_api_sessions(github_token: str) -> Github:
+class SqliteResponseStore:
+    """A persistent store of cached HTTP responses in a sqlite database.
+
+    Parameters
+    ----------
+    path : str
+        The path to the database file.
+    max_entries : int, optional
+        The maximum number of responses to keep. The least recently stored
+        ones are removed first.
+    """
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+
+    def get(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return default
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, stored_at) "
+                "VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time()),
+            )
+            self._conn.execute(
+                "DELETE FROM responses WHERE key NOT IN "
+                "(SELECT key FROM responses ORDER BY stored_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class RateLimitGovernor:
+    """Tracks the GitHub API rate limits and paces the requests to them.
+
+    The budget of each rate limit resource (`core`, `search`, ...) is read
+    from the `X-RateLimit-*` headers of every response. Before a request,
+    `wait` delays the caller
+
+     - until the reset, if less than `reserve_fraction` of the budget is left,
+     - by the time to the reset divided by the requests left, if less than
+       `slow_fraction` of the budget is left, so the rest is spread out,
+     - until the time given by a `Retry-After` header of a secondary rate
+       limit response (or a minute if there was none).
+
+    Parameters
+    ----------
+    reserve_fraction : float, optional
+        The fraction of the limit kept in reserve.
+    slow_fraction : float, optional
+        The fraction of the limit below which requests are spread out.
+    max_wait : float, optional
+        The longest a single request is held back, in seconds.
+    clock : callable, optional
+        Returns the current time as a UNIX timestamp.
+    sleep : callable, optional
+        Sleeps for a number of seconds.
+
+    Attributes
+    ----------
+    waits : int
+        The number of requests held back.
+    waited : float
+        The total number of seconds the requests were held back.
+    rejections : int
+        The number of responses rejected for a rate limit.
+    """
+
+    def __init__(
+        self,
+        reserve_fraction=0.02,
+        slow_fraction=0.2,
+        max_wait=900,
+        clock=time.time,
+        sleep=time.sleep,
+    ):
+        self.reserve_fraction = reserve_fraction
+        self.slow_fraction = slow_fraction
+        self.max_wait = max_wait
+        self.clock = clock
+        self.sleep = sleep
+        self.waits = 0
+        self.waited = 0.0
+        self.rejections = 0
+        self._budgets = {}
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _resource(url):
+        path = urllib.parse.urlparse(url).path
+        if path.startswith("/search/code"):
+            return "code_search"
+        elif path.startswith("/search/"):
+            return "search"
+        elif path.startswith("/graphql"):
+            return "graphql"
+        else:
+            return "core"
+
+    def budget(self, resource=None):
+        """Get the last known budget of a rate limit resource.
+
+        Returns a dict with the `limit`, the requests `remaining` and the
+        `reset` time, or None if not known. Without a `resource`, a dict of
+        the budgets of all resources seen is returned.
+        """
+        with self._lock:
+            if resource is None:
+                return {k: dict(v) for k, v in self._budgets.items()}
+            budget = self._budgets.get(resource)
+            return dict(budget) if budget is not None else None
+
+    def delay(self, url):
+        """Get the seconds a request to `url` should wait."""
+        now = self.clock()
+        with self._lock:
+            delay = max(self._paused_until - now, 0)
+            budget = self._budgets.get(self._resource(url))
+            if budget is not None and budget["reset"] > now and budget["limit"] > 0:
+                to_reset = budget["reset"] - now
+                remaining = budget["remaining"]
+                if remaining <= budget["limit"] * self.reserve_fraction:
+                    delay = max(delay, to_reset + 1)
+                elif remaining < budget["limit"] * self.slow_fraction:
+                    delay = max(delay, to_reset / remaining)
+        return min(delay, self.max_wait)
+
+    def wait(self, url):
+        """Hold back a request to `url` as needed."""
+        delay = self.delay(url)
+        if delay > 0:
+            with self._lock:
+                self.waits += 1
+                self.waited += delay
+            self.sleep(delay)
+
+    def update(self, response):
+        """Record the rate limit headers of a response.
+
+        Returns
+        -------
+        rejected : bool
+            True if the request was rejected for a rate limit and can be
+            sent again after `wait`.
+        """
+        headers = response.headers
+        now = self.clock()
+        with self._lock:
+            if "X-RateLimit-Remaining" in headers:
+                resource = headers.get("X-RateLimit-Resource") or self._resource(
+                    response.url or ""
+                )
+                try:
+                    self._budgets[resource] = {
+                        "limit": int(headers.get("X-RateLimit-Limit", 0)),
+                        "remaining": int(headers["X-RateLimit-Remaining"]),
+                        "reset": float(headers.get("X-RateLimit-Reset", 0)),
+                    }
+                except ValueError:
+                    pass
+
+            if response.status_code not in (403, 429):
+                return False
+
+            if "Retry-After" in headers:
+                try:
+                    until = now + float(headers["Retry-After"])
+                except ValueError:
+                    until = now + 60
+            elif headers.get("X-RateLimit-Remaining") == "0":
+                until = float(headers.get("X-RateLimit-Reset", now + 60)) + 1
+            elif b"secondary rate limit" in (response.content or b"").lower():
+                # GitHub asks to wait at least a minute if there is no header
+                until = now + 60
+            else:
+                # some other 403, e.g., missing permissions
+                return False
+
+            self.rejections += 1
+            self._paused_until = max(self._paused_until, until)
+            LOGGER.warning(
+                "hit a GitHub API rate limit - pausing requests for %.0fs",
+                until - now,
+            )
+            return until - now <= self.max_wait
+
+
+class CachingHTTPAdapter(requests.adapters.HTTPAdapter):
+    """An HTTP adapter that makes conditional GET requests.
+
+    The `ETag` and `Last-Modified` headers of each successful GET response
+    are stored along with the response. Later GETs of the same URL send
+    `If-None-Match` / `If-Modified-Since` and a 304 response is answered
+    from the store. GitHub does not count 304 responses against the primary
+    rate limit.
+
+    Parameters
+    ----------
+    store : object, optional
+        An object with `get(key)` and `set(key, value)` methods for the
+        responses, e.g., a `LRUCache` or a `SqliteResponseStore`. Defaults to
+        an in-memory `LRUCache`.
+    memo_seconds : float, optional
+        The freshness window of the memo in seconds. Defaults to 0 (off).
+    governor : RateLimitGovernor, optional
+        Paces the requests sent to the API. Defaults to a new one.
+    **kwargs
+        Passed to `requests.adapters.HTTPAdapter`.
+    """
+
+    # the rate limit headers of a 304 are the current ones, so we keep them
+    _FRESH_HEADERS = [
+        "date",
+        "x-ratelimit-limit",
+        "x-ratelimit-remaining",
+        "x-ratelimit-reset",
+        "x-ratelimit-used",
+        "x-ratelimit-resource",
+    ]
+
+    # the times a request rejected for a rate limit is sent again
+    RATE_LIMIT_RETRIES = 2
+
+    def __init__(self, store=None, memo_seconds=0, governor=None, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store if store is not None else LRUCache(maxsize=1024)
+        self.memo_seconds = memo_seconds
+        self.governor = governor if governor is not None else RateLimitGovernor()
+        self.memo = LRUCache(maxsize=1024)
+        self.hits = 0
+        self.misses = 0
+        self.memo_hits = 0
+
+    @staticmethod
+    def _cache_key(request):
+        # responses differ by token (e.g., private data) and media type
+        auth = request.headers.get("Authorization", "")
+        return "|".join(
+            [
+                request.url,
+                request.headers.get("Accept", ""),
+                hashlib.sha256(auth.encode("utf-8")).hexdigest(),
+            ]
+        )
+
+    def _response_from_cache(self, request, cached, not_modified=None):
+        headers = requests.structures.CaseInsensitiveDict(cached["headers"])
+        if not_modified is not None:
+            for name in self._FRESH_HEADERS:
+                if name in not_modified.headers:
+                    headers[name] = not_modified.headers[name]
+
+        response = requests.Response()
+        response.status_code = cached["status"]
+        response.reason = "OK"
+        response.headers = headers
+        response._content = cached["content"].encode("utf-8")
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    @staticmethod
+    def _is_graphql_query(request):
+        # GraphQL reads are POSTs too, but only mutations write
+        if not urllib.parse.urlparse(request.url).path.endswith("/graphql"):
+            return False
+        body = request.body or b""
+        if isinstance(body, bytes):
+            body = body.decode("utf-8", errors="replace")
+        try:
+            query = json.loads(body).get("query", "")
+        except (ValueError, AttributeError):
+            return False
+        return isinstance(query, str) and "mutation" not in query
+
+    def send(self, request, **kwargs):
+        if request.method != "GET":
+            # writes can change anything we have seen
+            if not self._is_graphql_query(request):
+                self.memo.clear()
+            return self._send_governed(request, **kwargs)
+
+        key = self._cache_key(request)
+        if self.memo_seconds > 0 and not _BYPASS_MEMO.get():
+            memoized = self.memo.get(key)
+            if (
+                memoized is not None
+                and time.monotonic() - memoized[0] <= self.memo_seconds
+            ):
+                self.memo_hits += 1
+                return self._response_from_cache(request, memoized[1])
+
+        response = self._send_conditional(request, key, **kwargs)
+        if self.memo_seconds > 0 and response.status_code == 200:
+            self.memo.set(key, (time.monotonic(), self._to_cached(response)))
+        return response
+
+    @staticmethod
+    def _to_cached(response):
+        return {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "status": response.status_code,
+            "headers": dict(response.headers),
+            "content": response.content.decode("utf-8"),
+        }
+
+    def _send_governed(self, request, **kwargs):
+        for attempt in range(self.RATE_LIMIT_RETRIES + 1):
+            self.governor.wait(request.url)
+            response = super().send(request, **kwargs)
+            if not self.governor.update(response) or attempt == self.RATE_LIMIT_RETRIES:
+                return response
+            response.close()
+
+    def _send_conditional(self, request, key, **kwargs):
+        cached = self.store.get(key)
+        if cached is not None:
+            if cached.get("etag"):
+                request.headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                request.headers["If-Modified-Since"] = cached["last_modified"]
+
+        response = self._send_governed(request, **kwargs)
+
+        if response.status_code == 304 and cached is not None:
+            self.hits += 1
+            return self._response_from_cache(request, cached, response)
+
+        self.misses += 1
+        if response.status_code == 200 and (
+            response.headers.get("ETag") or response.headers.get("Last-Modified")
+        ):
+            self.store.set(key, self._to_cached(response))
+        return response
+
+
+def get_http_cache_store():
+    """Make the store for cached HTTP responses from the action inputs.
+
+    This is a sqlite database if `INPUT_HTTP_CACHE_PATH` is set and an
+    in-memory LRU cache otherwise.
+    """
+    path = os.environ.get("INPUT_HTTP_CACHE_PATH", "")
+    if path:
+        return SqliteResponseStore(path)
+    else:
+        return LRUCache(maxsize=1024)
+
+
+def get_memo_seconds():
+    """Get the freshness window of the request memo from the action inputs."""
+    return float(os.environ.get("INPUT_API_MEMO_SECONDS", "") or 0)
+
+
+def get_http_adapter(gh):
+    """Get the `CachingHTTPAdapter` mounted on a `Github` object, if any."""
+    connection = gh.requester._Requester__createConnection()
+    adapter = connection.session.get_adapter("https://")
+    return adapter if isinstance(adapter, CachingHTTPAdapter) else None
+
+
+def get_rate_limit_governor(gh):
+    """Get the `RateLimitGovernor` of a `Github` object, if any.
+
+    Schedulers can use its `budget` to decide how much work to start.
+    """
+    adapter = get_http_adapter(gh)
+    return adapter.governor if adapter is not None else None
+
+
+def _mount_adapter(gh, adapter):
+    # PyGithub does not expose its requests session, so we make its
+    # persistent connection here and swap in our adapter
+    connection = gh.requester._Requester__createConnection()
+    connection.session.mount("https://", adapter)
+    connection.session.mount("http://", adapter)
+    return connection
+
+
+def create_api_sessions(
+    github_token: str,
+    base_url=None,
+    http_cache=None,
+    pool_maxsize=None,
+    memo_seconds=None,
+    governor=None,
+) -> Github:
     """Create API sessions for GitHub.
 
     Parameters
     ----------
     github_token : str
         The GitHub access token.
+    base_url : str, optional
+        The URL of the GitHub API. Defaults to the public GitHub API.
+    http_cache : object, optional
+        The store for the conditional request cache. Defaults to the one from
+        `get_http_cache_store`.
+    pool_maxsize : int, optional
+        The number of keep-alive connections to keep per host. Set this to
+        at least the number of threads sharing the session.
+    memo_seconds : float, optional
+        Identical GETs within this many seconds are answered from memory.
+        Defaults to the one from `get_memo_seconds`. See `CachingHTTPAdapter`.
+    governor : RateLimitGovernor, optional
+        Paces the requests to the rate limits. Defaults to a new one. Pass
+        the same one to sessions that share a token.
 
     Returns
     -------
     gh : github.MainClass.Github
         A `Github` object from the PyGithub package.
     """
+    # the governor waits for the Retry-After of rate limit responses
+    retry = urllib3.util.retry.Retry(
+        total=10, backoff_factor=0.1, respect_retry_after_header=False
+    )
+
     # build a github object too
-    gh = Github(
-        github_token, retry=urllib3.util.retry.Retry(total=10, backoff_factor=0.1)
+    # PyGithub's fixed throttle is per requester, so it would serialize all the
+    # threads sharing the sessions - the `RateLimitGovernor` paces them instead
+    kwargs = {
+        "retry": retry,
+        "seconds_between_requests": None,
+        "seconds_between_writes": None,
+    }
+    if base_url is not None:
+        kwargs["base_url"] = base_url
+    gh = Github(github_token, **kwargs)
+
+    adapter = CachingHTTPAdapter(
+        store=http_cache if http_cache is not None else get_http_cache_store(),
+        memo_seconds=memo_seconds if memo_seconds is not None else get_memo_seconds(),
+        governor=governor,
+        max_retries=retry,
+        pool_maxsize=pool_maxsize or requests.adapters.DEFAULT_POOLSIZE,
     )
+    _mount_adapter(gh, adapter)
 
     return gh
@@ -0,0 +1,208 @@
+"""Evaluate several PRs concurrently on one event loop.
+
+The git work of each PR (cloning the base and fetching the head) runs as
+non-blocking subprocesses via `asyncio.create_subprocess_exec`. The GitHub
+API calls go through PyGithub in a bounded thread pool, sharing the
+keep-alive connections of its session, so the PRs of several repos (or
+several PRs for one SHA) are evaluated at the same time.
+
+PRs evaluated together that share a base and a head commit also share one
+git workspace, and their statuses, checks and required checks are computed
+only once. The workspace is removed as soon as the last of these PRs is
+done, so that long lists of PRs do not pile up clones on disk.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import functools
+import logging
+import subprocess
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from .automerge import (
+    _automerge_pr_with_workspace,
+    _log_merge_result,
+    _prefilter_pr_object,
+)
+from .cache import OnceCache
+from .git_utils import RepoWorkspace
+
+if TYPE_CHECKING:
+    from github.PullRequest import PullRequest
+    from github.Repository import Repository
+
+LOGGER = logging.getLogger(__name__)
+
+# the number of PRs evaluated at the same time by default
+DEFAULT_MAX_CONCURRENCY = 4
+
+
+async def automerge_pr_async(
+    repo: Repository,
+    pr: PullRequest,
+    executor=None,
+    workspace=None,
+    sha_cache=None,
+    prefiltered=False,
+) -> tuple[bool, str | None]:
+    """Possibly automerge a PR without blocking the event loop.
+
+    This is the `async` counterpart of `automerge.automerge_pr`.
+
+    Parameters
+    ----------
+    repo : github.Repository.Repository
+        A `Repository` object for the given repo from the PyGithub package.
+    pr : github.PullRequest.PullRequest
+        A `PullRequest` object for the given PR from the PyGithub package.
+    executor : concurrent.futures.Executor, optional
+        The executor for the blocking API calls. Defaults to the one of the
+        event loop.
+    workspace : RepoWorkspace, optional
+        A workspace for the PR base and head shared with other PRs. The
+        caller cleans it up. If not given, one is made for this PR.
+    sha_cache : OnceCache, optional
+        A cache of the statuses, checks and required checks shared with
+        other PRs.
+    prefiltered : bool, optional
+        If True, the PR already passed `_prefilter_pr` (e.g., on the event
+        payload or the search results), so it is not run again.
+
+    Returns
+    -------
+    did_merge : bool
+        If `True`, the merge was done, `False` if not.
+    reason : str
+        The reason the merge worked or did not work.
+    """
+    if not prefiltered:
+        allowed, reason = _prefilter_pr_object(pr)
+        if not allowed:
+            _log_merge_result(repo, pr, False, reason)
+            return False, reason
+
+    with contextlib.ExitStack() as stack:
+        if workspace is None:
+            workspace = stack.enter_context(RepoWorkspace(pr))
+            stack.callback(
+                lambda: LOGGER.info(
+                    "git transport stats: %s", workspace.transport.summary()
+                )
+            )
+
+        try:
+            await workspace.aprepare()
+        except (subprocess.CalledProcessError, RuntimeError):
+            # the workspace tries again (and raises) when it is used
+            LOGGER.warning(
+                "could not prepare the workspace for PR %s on %s",
+                pr.number,
+                repo.full_name,
+            )
+        did_merge, reason = await asyncio.get_running_loop().run_in_executor(
+            executor,
+            functools.partial(
+                _automerge_pr_with_workspace, repo, pr, workspace, sha_cache=sha_cache
+            ),
+        )
+
+    _log_merge_result(repo, pr, did_merge, reason)
+    return did_merge, reason
+
+
+async def automerge_prs_async(repo_prs, max_concurrency=None, prefiltered=False):
+    """Possibly automerge several PRs concurrently.
+
+    Parameters
+    ----------
+    repo_prs : iterable of tuple
+        The `(repo, pr)` pairs to evaluate. The PRs can be from the same or
+        from different repos.
+    max_concurrency : int, optional
+        The maximum number of PRs evaluated at the same time. Defaults to
+        `DEFAULT_MAX_CONCURRENCY`.
+    prefiltered : bool, optional
+        If True, the PRs already passed `_prefilter_pr` (e.g., on the event
+        payload or the search results), so it is not run again.
+
+    Returns
+    -------
+    results : list
+        For each PR in order, either the `(did_merge, reason)` tuple from
+        `automerge_pr_async` or the exception raised while evaluating it.
+    """
+    max_concurrency = max_concurrency or DEFAULT_MAX_CONCURRENCY
+    semaphore = asyncio.Semaphore(max_concurrency)
+    sha_cache = OnceCache()
+    repo_prs = list(repo_prs)
+
+    def _key(pr):
+        return (pr.base.repo.full_name, pr.base.ref, pr.head.sha)
+
+    # a workspace is cleaned up as soon as the last PR using it is done
+    workspaces = {}
+    remaining = Counter(_key(pr) for _, pr in repo_prs)
+
+    with contextlib.ExitStack() as stack, ThreadPoolExecutor(
+        max_workers=max_concurrency, thread_name_prefix="automerge-async"
+    ) as executor:
+
+        def _workspace(key, pr):
+            if key not in workspaces:
+                workspaces[key] = stack.enter_context(RepoWorkspace(pr))
+            return workspaces[key]
+
+        def _release(key):
+            remaining[key] -= 1
+            if remaining[key] == 0 and key in workspaces:
+                workspace = workspaces.pop(key)
+                LOGGER.info(
+                    "git transport stats for %s@%s: %s",
+                    key[0],
+                    key[2],
+                    workspace.transport.summary(),
+                )
+                workspace.cleanup()
+
+        async def _one(repo, pr):
+            async with semaphore:
+                key = _key(pr)
+                try:
+                    return await automerge_pr_async(
+                        repo,
+                        pr,
+                        executor=executor,
+                        workspace=_workspace(key, pr),
+                        sha_cache=sha_cache,
+                        prefiltered=prefiltered,
+                    )
+                finally:
+                    _release(key)
+
+        results = await asyncio.gather(
+            *[_one(repo, pr) for repo, pr in repo_prs], return_exceptions=True
+        )
+
+        LOGGER.info(
+            "per-SHA evaluations: %d computed, %d reused",
+            sha_cache.misses,
+            sha_cache.hits,
+        )
+
+    return results
+
+
+def automerge_prs(repo_prs, max_concurrency=None):
+    """Run `automerge_prs_async` to completion, raising the first error.
+
+    Returns the list of `(did_merge, reason)` tuples.
+    """
+    results = asyncio.run(automerge_prs_async(repo_prs, max_concurrency))
+    for res in results:
+        if isinstance(res, BaseException):
+            raise res
+    return results
@@ -1,18 +1,36 @@
 from __future__ import annotations
 
-import contextlib
 import datetime
+import json
 import logging
 import os
 import random
 import subprocess
 import tempfile
 import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from concurrent.futures import wait as wait_futures
 from typing import TYPE_CHECKING
 
+import requests
 from github import GithubException
+from github.CheckRun import CheckRun
+from github.CheckSuite import CheckSuite
+from github.PaginatedList import PaginatedList
 from ruamel.yaml import YAML
 
+from .api_sessions import fresh_requests
+from .cache import LRUCache, TieredCache
+from .pr_snapshot import _parse_time, get_pr_snapshot
+from .git_utils import (
+    GitTransport,
+    RepoWorkspace,
+    _fetch_file_at_ref,
+    get_git_transport,
+)
+
 if TYPE_CHECKING:
     from github.PullRequest import PullRequest
     from github.Repository import Repository
@@ -23,6 +41,55 @@ ALLOWED_USERS = ["regro-cf-autotick-bot"]
 
 IGNORED_CHECKS = []
 
+# parsed conda-forge.yml settings keyed by the git blob SHA of the file
+CONFIG_CACHE = TieredCache(
+    maxsize=256,
+    disk_path=os.environ.get("INPUT_CONFIG_CACHE_DIR", "") or None,
+    max_disk_entries=4096,
+)
+
+# the last PR head whose commits were all made by allowed users keyed by
+# the repo and PR number
+VERIFIED_PR_HEADS = LRUCache(maxsize=1024)
+
+# the number of PRs that stopped at (or passed) each gate of `_prefilter_pr`
+PREFILTER_STATS = Counter()
+
+# how long to wait for github to compute if a PR is mergeable and the first
+# and largest delays between polls, all in seconds
+MERGEABLE_DEADLINE = float(os.environ.get("INPUT_MERGEABLE_DEADLINE", "") or 30)
+MERGEABLE_BASE_DELAY = 1
+MERGEABLE_MAX_DELAY = 8
+
+# the statuses, checks and required checks are fetched concurrently with at
+# most this many threads and must all be done within this many seconds
+EVALUATION_MAX_WORKERS = 3
+EVALUATION_DEADLINE = float(os.environ.get("INPUT_EVALUATION_DEADLINE", "") or 600)
+
+# paths in a feedstock used to decide which CI services are required
+CI_PATHS = [
+    "appveyor.yml",
+    ".appveyor.yml",
+    ".drone.yml",
+    ".travis.yml",
+    "azure-pipelines.yml",
+    ".github/workflows/conda-build.yml",
+    ".circleci/config.yml",
+    ".circleci/checkout_merge_commit.sh",
+    ".circleci/fast_finish_ci_pr_build.sh",
+]
+
+# the names `_get_required_checks_and_statuses` can require (matched by substring)
+REQUIRED_CHECK_NAMES = [
+    "linter",
+    "appveyor",
+    "drone",
+    "travis",
+    "azure",
+    "github-actions",
+    "circle",
+]
+
 # sets of states that indicate good / bad / neutral in the github API
 NEUTRAL_STATES = ["pending"]
 BAD_STATES = [
@@ -38,42 +105,72 @@ BAD_STATES = [
 ]
 
 
-# https://stackoverflow.com/questions/6194499/pushd-through-os-system
-@contextlib.contextmanager
-def pushd(new_dir):
-    previous_dir = os.getcwd()
-    os.chdir(new_dir)
-    try:
-        yield
-    finally:
-        os.chdir(previous_dir)
-
-
-def _run_git_command(*args):
-    try:
-        c = subprocess.run(
-            ["git"] + list(args),
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-        )
-    except subprocess.CalledProcessError as e:
-        print(c.stdout)
-        raise e
-
-
-def _get_conda_forge_config(pr):
+def _get_conda_forge_config(pr, workspace=None):
     """get the conda-forge.yml from upstream master
 
     We always do this to make sure we use the maintainer settings and not
     any from a fork.
+
+    We first try to fetch only the file itself (or read it from the
+    `workspace` if one is given) and fall back to a full clone if that
+    fails (e.g., the server does not support partial clones).
     """
+    if workspace is not None:
+        try:
+            return _get_cached_conda_forge_config(workspace)
+        except subprocess.CalledProcessError:
+            LOGGER.warning(
+                "could not read conda-forge.yml from the workspace - "
+                "falling back to a clone"
+            )
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        try:
+            return YAML().load(
+                _fetch_file_at_ref(
+                    pr.base.repo.clone_url,
+                    pr.base.ref,
+                    "conda-forge.yml",
+                    tmpdir,
+                    transport=get_git_transport(),
+                )
+            )
+        except subprocess.CalledProcessError:
+            LOGGER.warning(
+                "could not fetch conda-forge.yml directly - falling back to a clone"
+            )
+
     with tempfile.TemporaryDirectory() as tmpdir:
-        _run_git_command("clone", pr.base.repo.clone_url, tmpdir)
-        with pushd(tmpdir):
-            _run_git_command("checkout", pr.base.ref)
-            with open("conda-forge.yml") as fp:
-                cfg = YAML().load(fp)
+        transport = GitTransport("full")
+        transport.clone(pr.base.repo.clone_url, tmpdir)
+        transport.checkout(tmpdir, pr.base.ref)
+        with open(os.path.join(tmpdir, "conda-forge.yml")) as fp:
+            cfg = YAML().load(fp)
+    return cfg
+
+
+def _get_automerge_settings(cfg):
+    """get the subset of the conda-forge.yml used by the action"""
+    bot = (cfg or {}).get("bot", None) or {}
+    settings = {k: bot[k] for k in ["automerge", "automerge_options"] if k in bot}
+    # round-trip through JSON to drop the ruamel types so this can be cached
+    return json.loads(json.dumps({"bot": settings} if settings else {}))
+
+
+def _get_cached_conda_forge_config(workspace):
+    """get the automerge settings from the conda-forge.yml in the workspace
+
+    The settings are cached by the blob SHA of the file, so a cache hit
+    neither fetches nor parses the file.
+    """
+    sha = workspace.blob_sha(workspace.base_sha, "conda-forge.yml")
+    cfg = CONFIG_CACHE.get(sha)
+    if cfg is None:
+        cfg = _get_automerge_settings(
+            YAML().load(workspace.read_file(workspace.base_sha, "conda-forge.yml"))
+        )
+        CONFIG_CACHE.set(sha, cfg)
+    LOGGER.info("conda-forge.yml cache stats: %s", CONFIG_CACHE.stats())
     return cfg
 
 
@@ -84,23 +181,52 @@ def _automerge_me(cfg):
 
 
 def _get_checks(repo, pr):
+    """Get the check suites of the PR head and the runs of the gha suites.
+
+    This makes one paginated call for the suites and, if needed, one for all
+    of the check runs of the commit, which are then grouped by suite. This
+    avoids listing the runs of each suite separately.
+    """
+    url = f"{repo.url}/commits/{pr.head.sha}"
+    suites = PaginatedList(
+        CheckSuite,
+        repo.requester,
+        f"{url}/check-suites",
+        None,
+        list_item="check_suites",
+    )
+
     checks = []
-    commit = repo.get_commit(pr.head.sha)
-    for check in commit.get_check_suites():
+    gha_suite_ids = {}
+    for check in suites:
         _check = {}
         _check["app"] = {"slug": check.app.slug}
         _check["status"] = check.status
         _check["conclusion"] = check.conclusion
         # for gha we check the runs to ensure we have the right check
         if check.status == "completed" and check.app.slug == "github-actions":
-            _check["runs"] = [run.name for run in check.get_check_runs()]
+            _check["runs"] = []
+            gha_suite_ids[check.id] = _check
         else:
             _check["runs"] = None
         checks.append(_check)
+
+    if gha_suite_ids:
+        runs = PaginatedList(
+            CheckRun,
+            repo.requester,
+            f"{url}/check-runs",
+            {"filter": "latest"},
+            list_item="check_runs",
+        )
+        for run in runs:
+            if run.check_suite.id in gha_suite_ids:
+                gha_suite_ids[run.check_suite.id]["runs"].append(run.name)
+
     return checks
 
 
-def _get_github_checks(repo, pr):
+def _get_github_checks(repo, pr, snapshot=None):
     """Get all of the github checks associated with a PR.
 
     Parameters
@@ -109,6 +235,9 @@ def _get_github_checks(repo, pr):
         A `Repository` object for the given repo from the PyGithub package.
     pr : github.PullRequest.PullRequest
         A `PullRequest` object for the given PR from the PyGithub package.
+    snapshot : dict, optional
+        A PR snapshot from `get_pr_snapshot`. If given, the checks are taken
+        from it instead of the API.
 
     Returns
     -------
@@ -117,7 +246,10 @@ def _get_github_checks(repo, pr):
     """
 
     check_states = {}
-    checks = _get_checks(repo, pr)
+    if snapshot is not None:
+        checks = snapshot["checks"]
+    else:
+        checks = _get_checks(repo, pr)
     for check in checks:
         name = check["app"]["slug"]
         if name not in IGNORED_CHECKS:
@@ -145,7 +277,38 @@ def _get_github_checks(repo, pr):
     return check_states
 
 
-def _get_github_statuses(repo, pr):
+def _status_state(state):
+    """Map a status state to True (good), False (bad) or None (neutral)."""
+    if state in NEUTRAL_STATES:
+        return None
+    elif state in BAD_STATES:
+        return False
+    else:
+        return True
+
+
+def _get_combined_statuses(repo, pr):
+    """Get the latest state of each status context of the PR head.
+
+    This uses the combined status endpoint, which only returns the latest
+    status for each context.
+    """
+    url = f"{repo.url}/commits/{pr.head.sha}/status"
+    states = {}
+    page = 1
+    while True:
+        _, data = repo.requester.requestJsonAndCheck(
+            "GET", url, parameters={"per_page": 100, "page": page}
+        )
+        for status in data["statuses"]:
+            states[status["context"]] = status["state"]
+        if not data["statuses"] or len(states) >= data["total_count"]:
+            break
+        page += 1
+    return states
+
+
+def _get_github_statuses(repo, pr, snapshot=None, combined=True):
     """Get all of the github statuses associated with a PR.
 
     Parameters
@@ -154,12 +317,44 @@ def _get_github_statuses(repo, pr):
         A `Repository` object for the given repo from the PyGithub package.
     pr : github.PullRequest.PullRequest
         A `PullRequest` object for the given PR from the PyGithub package.
+    snapshot : dict, optional
+        A PR snapshot from `get_pr_snapshot`. If given, the statuses are taken
+        from it instead of the API.
+    combined : bool, optional
+        If True (the default), use the combined status endpoint and fall
+        back to replaying the full status history if it fails.
 
     Returns
     -------
     status_states : dict of bool or None
         A dictionary mapping each status to its state.
     """
+    if snapshot is not None:
+        # the snapshot only has the latest state for each context
+        status_states = {
+            context: _status_state(state)
+            for context, state in snapshot["statuses"].items()
+        }
+        for context, val in status_states.items():
+            LOGGER.info("status: name|state = %s|%s", context, val)
+        return status_states
+
+    if combined:
+        try:
+            latest_states = _get_combined_statuses(repo, pr)
+        except GithubException:
+            LOGGER.exception(
+                "could not get the combined status - replaying the status history:"
+            )
+        else:
+            status_states = {
+                context: _status_state(state)
+                for context, state in latest_states.items()
+            }
+            for context, val in status_states.items():
+                LOGGER.info("status: name|state = %s|%s", context, val)
+            return status_states
+
     # github emits all of the statuses with a time stamp as events
     # you have to keep the latest one
     # so this is why we compare the times below
@@ -182,15 +377,11 @@ def _get_github_statuses(repo, pr):
             # init with really old time
             status_states[status.context] = (None, oldest_time)
 
-        if status.state in NEUTRAL_STATES:
-            if status.updated_at > status_states[status.context][1]:
-                status_states[status.context] = (None, status.updated_at)
-        elif status.state in BAD_STATES:
-            if status.updated_at > status_states[status.context][1]:
-                status_states[status.context] = (False, status.updated_at)
-        else:
-            if status.updated_at > status_states[status.context][1]:
-                status_states[status.context] = (True, status.updated_at)
+        if status.updated_at > status_states[status.context][1]:
+            status_states[status.context] = (
+                _status_state(status.state),
+                status.updated_at,
+            )
 
     for context, val in status_states.items():
         LOGGER.info("status: name|state = %s|%s", context, val[0])
@@ -198,31 +389,24 @@ def _get_github_statuses(repo, pr):
     return {k: v[0] for k, v in status_states.items()}
 
 
-def _circle_is_active():
-    """check if circle is active"""
-    if os.path.exists(".circleci/checkout_merge_commit.sh"):
-        return True
-
-    if os.path.exists(".circleci/fast_finish_ci_pr_build.sh"):
-        return True
-
+def _circle_config_is_active(lines):
+    """check if the lines of a circle config leave circle active"""
     # we now look for this sentinel text
     #      filters:
     #        branches:
     #          ignore:
     #            - /.*/
-    with open(".circleci/config.yml") as fp:
-        start = False
-        ind = 0
-        sentinels = ["filters:", "branches:", "ignore:", "- /.*/"]
-        found_sentinels = [False] * len(sentinels)
-        for line in fp.readlines():
-            if line.strip() == "filters:":
-                start = True
-            if start and ind < len(sentinels):
-                if line.strip() == sentinels[ind]:
-                    found_sentinels[ind] = True
-                ind += 1
+    start = False
+    ind = 0
+    sentinels = ["filters:", "branches:", "ignore:", "- /.*/"]
+    found_sentinels = [False] * len(sentinels)
+    for line in lines:
+        if line.strip() == "filters:":
+            start = True
+        if start and ind < len(sentinels):
+            if line.strip() == sentinels[ind]:
+                found_sentinels[ind] = True
+            ind += 1
 
     if all(found_sentinels):
         return False
@@ -230,37 +414,117 @@ def _circle_is_active():
         return True
 
 
-def _get_required_checks_and_statuses(pr, cfg):
-    """return a list of required statuses and checks"""
-    ignored_statuses = (
-        cfg.get("bot", {}).get("automerge_options", {}).get("ignored_statuses", [])
+def _circle_is_active(root="."):
+    """check if circle is active for the checkout at `root`"""
+    if os.path.exists(os.path.join(root, ".circleci/checkout_merge_commit.sh")):
+        return True
+
+    if os.path.exists(os.path.join(root, ".circleci/fast_finish_ci_pr_build.sh")):
+        return True
+
+    with open(os.path.join(root, ".circleci/config.yml")) as fp:
+        return _circle_config_is_active(fp.readlines())
+
+
+def _get_required_checks_from_paths(exists, circle_is_active):
+    """return a list of the CI services configured in a feedstock
+
+    Parameters
+    ----------
+    exists : callable
+        A function that returns True if a path exists in the feedstock.
+    circle_is_active : callable
+        A function with no arguments that returns True if circle is active.
+        It is only called if the circle config exists.
+
+    Returns
+    -------
+    required : list of str
+        The CI services that are configured.
+    """
+    required = []
+
+    if exists("appveyor.yml") or exists(".appveyor.yml"):
+        required.append("appveyor")
+
+    if exists(".drone.yml"):
+        required.append("drone")
+
+    if exists(".travis.yml"):
+        required.append("travis")
+
+    if exists("azure-pipelines.yml"):
+        required.append("azure")
+
+    if exists(".github/workflows/conda-build.yml"):
+        required.append("github-actions")
+
+    # smithy writes this config even if circle is off, but we can check
+    # for other things
+    if exists(".circleci/config.yml") and circle_is_active():
+        required.append("circle")
+
+    return required
+
+
+def _get_required_checks_from_checkout(root="."):
+    """return a list of the CI services configured in the checkout at `root`"""
+    return _get_required_checks_from_paths(
+        lambda path: os.path.exists(os.path.join(root, path)),
+        lambda: _circle_is_active(root),
     )
-    required = ["linter"]
 
-    with tempfile.TemporaryDirectory() as tmpdir:
-        _run_git_command("clone", pr.head.repo.clone_url, tmpdir)
-        with pushd(tmpdir):
-            _run_git_command("checkout", pr.head.sha)
 
-            if os.path.exists("appveyor.yml") or os.path.exists(".appveyor.yml"):
-                required.append("appveyor")
+def _get_required_checks_from_tree(workspace, rev):
+    """return a list of the CI services configured at `rev` in the workspace
+
+    Only the tree of `rev` is listed, so no blobs are transferred or checked
+    out except for the circle config (and only if it is needed).
+    """
+    paths = workspace.list_paths(rev, CI_PATHS)
+
+    def _circle_is_active_in_tree():
+        if (
+            ".circleci/checkout_merge_commit.sh" in paths
+            or ".circleci/fast_finish_ci_pr_build.sh" in paths
+        ):
+            return True
+        return _circle_config_is_active(
+            workspace.read_file(rev, ".circleci/config.yml").splitlines()
+        )
 
-            if os.path.exists(".drone.yml"):
-                required.append("drone")
+    return _get_required_checks_from_paths(
+        lambda path: path in paths, _circle_is_active_in_tree
+    )
 
-            if os.path.exists(".travis.yml"):
-                required.append("travis")
 
-            if os.path.exists("azure-pipelines.yml"):
-                required.append("azure")
+def _get_required_checks_and_statuses(pr, cfg, workspace=None):
+    """return a list of required statuses and checks
 
-            if os.path.exists(".github/workflows/conda-build.yml"):
-                required.append("github-actions")
+    If a `workspace` is given, the PR head is read from it instead of
+    cloning the head repo.
+    """
+    ignored_statuses = (
+        cfg.get("bot", {}).get("automerge_options", {}).get("ignored_statuses", [])
+    )
+    required = ["linter"]
 
-            # smithy writes this config even if circle is off, but we can check
-            # for other things
-            if os.path.exists(".circleci/config.yml") and _circle_is_active():
-                required.append("circle")
+    if workspace is not None:
+        if workspace.transport.mode == "partial":
+            required += _get_required_checks_from_tree(workspace, workspace.head_sha)
+        else:
+            required += _get_required_checks_from_checkout(
+                workspace.checkout(workspace.head_sha, paths=CI_PATHS)
+            )
+    else:
+        transport = get_git_transport()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            transport.clone(pr.head.repo.clone_url, tmpdir)
+            if transport.mode != "full":
+                # shallow clones only have the default branch
+                transport.fetch(tmpdir, "origin", pr.head.sha)
+            transport.checkout(tmpdir, pr.head.sha, paths=CI_PATHS)
+            required += _get_required_checks_from_checkout(tmpdir)
 
     return [
         r.lower()
@@ -296,55 +560,317 @@ def _all_statuses_and_checks_ok(status_states, check_states, req_checks_and_stat
     return all(v for v in final_states.values()), final_states
 
 
-def _comment_on_pr_with_race(pr, comment, check_slug, check_race=2):
-    # check for a PR comment with a given slug
-    # turn check_race > 1 to check more than once
-    last_comment = None
-    i = 0
-    while last_comment is None and i < check_race:
-        for cmnt in pr.get_issue_comments():
-            if check_slug in cmnt.body:
-                last_comment = cmnt
-        time.sleep(random.uniform(0.5, 1.5))
-        i += 1
-
-    if last_comment is None:
-        pr.create_issue_comment(comment)
-    else:
-        last_comment.edit(comment)
+def _get_states_concurrently(
+    repo, pr, cfg, snapshot=None, workspace=None, max_workers=None, deadline=None
+):
+    """get the statuses, checks and required checks of a PR concurrently
 
+    None of these depend on each other, so they are run in a thread pool
+    with at most `max_workers` threads. All of them must finish within
+    `deadline` seconds (shared by all three) or a `TimeoutError` is raised.
+    The work that has not started by then is cancelled, but the running work
+    is waited for so that it does not use the workspace after it is cleaned
+    up.
 
-def _no_extra_pr_commits(pr):
-    """check that no commits were made after a PR has the automerge label added"""
-    events = [e for e in pr.as_issue().get_timeline()]
-    dts = [e.created_at for e in events if e.created_at is not None]
-    if len(dts) > 1:
-        for i in range(1, len(dts)):
-            if dts[i] < dts[i - 1]:
+    Returns
+    -------
+    status_states : dict
+        The output of `_get_github_statuses`.
+    check_states : dict
+        The output of `_get_github_checks`.
+    req_checks_and_states : list of str
+        The output of `_get_required_checks_and_statuses`.
+    """
+    max_workers = max_workers or EVALUATION_MAX_WORKERS
+    deadline = deadline or EVALUATION_DEADLINE
+    end = time.monotonic() + deadline
+
+    executor = ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="automerge-eval"
+    )
+    try:
+        futures = [
+            executor.submit(_get_github_statuses, repo, pr, snapshot=snapshot),
+            executor.submit(_get_github_checks, repo, pr, snapshot=snapshot),
+            executor.submit(
+                _get_required_checks_and_statuses, pr, cfg, workspace=workspace
+            ),
+        ]
+        try:
+            return tuple(
+                fut.result(timeout=max(end - time.monotonic(), 0)) for fut in futures
+            )
+        except FuturesTimeoutError:
+            for fut in futures:
+                fut.cancel()
+            # git commands cannot be interrupted, so let them finish
+            wait_futures(futures)
+            raise TimeoutError(
+                "fetching the statuses and checks took more than %s seconds" % deadline
+            ) from None
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# a hidden marker at the end of the bot comments so that we can find them
+COMMENT_MARKER = "<!-- conda-forge-automerge-action: %s -->"
+
+
+def _upsert_pr_comment(pr, comment, kind, legacy_slug=None):
+    """make sure the PR has exactly one bot comment of `kind` with `comment`
+
+    The comment is found through a hidden HTML marker, searching the newest
+    comments first. It is edited only if its body changed. If there is no
+    comment yet, one is made and the comments are checked again. If other
+    runs made one at the same time, the oldest one is kept and the others
+    are deleted, so all runs agree without sleeping.
+
+    Parameters
+    ----------
+    pr : github.PullRequest.PullRequest
+        A `PullRequest` object for the given PR from the PyGithub package.
+    comment : str
+        The text of the comment.
+    kind : str
+        The kind of comment, used in the marker.
+    legacy_slug : str, optional
+        Text that identifies comments of this kind made before the markers.
+
+    Returns
+    -------
+    action : str
+        One of `created`, `edited` or `unchanged`.
+    """
+    marker = COMMENT_MARKER % kind
+    body = comment + "\n" + marker
+
+    def _is_ours(item):
+        text = item.get("body") or ""
+        return marker in text or (legacy_slug is not None and legacy_slug in text)
+
+    url = f"{pr.issue_url}/comments"
+    newest_id = None
+    for item in _iter_newest_first(pr.requester, url):
+        if newest_id is None:
+            newest_id = item["id"]
+        if _is_ours(item):
+            return _edit_comment(pr, item, body)
+
+    _, created = pr.requester.requestJsonAndCheck("POST", url, input={"body": body})
+
+    # any comment of ours newer than the ones we looked at is from a race
+    ours = [created]
+    for item in _iter_newest_first(pr.requester, url):
+        if newest_id is not None and item["id"] <= newest_id:
+            break
+        if item["id"] != created["id"] and _is_ours(item):
+            ours.append(item)
+    winner = min(ours, key=lambda item: item["id"])
+    if winner["id"] == created["id"]:
+        return "created"
+
+    LOGGER.info("another run commented at the same time - keeping its comment")
+    pr.requester.requestJsonAndCheck("DELETE", created["url"])
+    return _edit_comment(pr, winner, body)
+
+
+def _edit_comment(pr, item, body):
+    if item.get("body") == body:
+        return "unchanged"
+    pr.requester.requestJsonAndCheck("PATCH", item["url"], input={"body": body})
+    return "edited"
+
+
+def _iter_newest_first(requester, url):
+    """yield the items of a paginated list from the newest to the oldest
+
+    The pages are requested from the last one backwards and only one page is
+    held in memory at a time.
+    """
+    headers, data = requester.requestJsonAndCheck(
+        "GET", url, parameters={"per_page": 100}
+    )
+    links = _parse_links(headers)
+    if "last" in links:
+        headers, data = requester.requestJsonAndCheck("GET", links["last"])
+        links = _parse_links(headers)
+
+    while True:
+        yield from reversed(data)
+        if "prev" not in links:
+            break
+        headers, data = requester.requestJsonAndCheck("GET", links["prev"])
+        links = _parse_links(headers)
+
+
+def _iter_timeline_newest_first(pr):
+    """yield the compact (event, created_at, label) records of the PR
+    timeline from the newest to the oldest"""
+    for item in _iter_newest_first(pr.requester, f"{pr.issue_url}/timeline"):
+        event = item.get("event")
+        yield (
+            event,
+            _parse_time(item.get("created_at")),
+            (item.get("label") or {}).get("name") if event == "labeled" else None,
+        )
+
+
+def _parse_links(headers):
+    links = requests.utils.parse_header_links(headers.get("link", ""))
+    return {link["rel"]: link["url"] for link in links if "rel" in link}
+
+
+def _no_extra_pr_commits(pr, snapshot=None):
+    """check that no commits were made after a PR has the automerge label added
+
+    The timeline is scanned from the newest event backwards and the scan
+    stops at the last `automerge` label, so only the events since then are
+    looked at.
+    """
+    if snapshot is not None:
+        events = (
+            (e["event"], e["created_at"], e["label"])
+            for e in reversed(snapshot["timeline"])
+        )
+    else:
+        events = _iter_timeline_newest_first(pr)
+
+    newer_dt = None
+    commits_after_label = False
+    for event, created_at, label in events:
+        if created_at is not None:
+            if newer_dt is not None and created_at > newer_dt:
                 LOGGER.warning("events are out of order!")
                 return None
+            newer_dt = created_at
 
-    label_ind = None
-    for i, e in enumerate(events):
-        if e.event == "labeled" and e.raw_data["label"]["name"] == "automerge":
-            label_ind = i
+        if event == "labeled" and label == "automerge":
+            return not commits_after_label
 
-    if label_ind is None:
-        LOGGER.warning("could not find 'automerge' label in events!")
-        return None
+        if event == "committed":
+            commits_after_label = True
+
+    LOGGER.warning("could not find 'automerge' label in events!")
+    return None
+
+
+def _iter_unverified_commit_authors(pr):
+    """yield the logins of the authors of the PR commits not yet verified
 
-    return all(e.event != "committed" for e in events[label_ind + 1 :])
+    If an earlier head of the PR was verified and the current head only adds
+    commits to it, only the added commits are listed (via the compare API).
+    Otherwise all of the commits of the PR are listed.
+    """
+    verified_head = VERIFIED_PR_HEADS.get(_pr_key(pr))
+    if verified_head == pr.head.sha:
+        return
+
+    if verified_head is not None:
+        try:
+            comparison = pr.base.repo.compare(verified_head, pr.head.sha)
+            status = comparison.status
+        except GithubException:
+            LOGGER.warning("could not compare %s to the PR head", verified_head)
+            status = None
+        if status == "ahead":
+            for c in comparison.commits:
+                yield getattr(c.author, "login", None)
+            return
+
+    for c in pr.get_commits():
+        yield getattr(c.author, "login", None)
+
+
+def _pr_key(pr):
+    return f"{pr.base.repo.full_name}#{pr.number}"
 
 
-def _check_pr(pr: PullRequest, cfg) -> tuple[bool, str | None]:
-    """make sure a PR is ok to automerge"""
+def _only_allowed_committers(pr, snapshot=None):
+    """check that all commits of the PR were made by ALLOWED_USERS
+
+    This stops at the first commit made by anyone else. A PR head that
+    passes is remembered, so later checks of the same PR only look at the
+    commits added since. The commit authors are taken from the `snapshot`
+    unless it was fetched without them.
+    """
+    if snapshot is not None and snapshot["commit_authors"] is not None:
+        authors = snapshot["commit_authors"]
+    else:
+        authors = _iter_unverified_commit_authors(pr)
+
+    if not all(c in ALLOWED_USERS for c in authors):
+        return False
+
+    VERIFIED_PR_HEADS.set(_pr_key(pr), pr.head.sha)
+    return True
 
-    pr_has_automerge_label = any(label.name == "automerge" for label in pr.get_labels())
+
+def _prefilter_pr(login, title, labels):
+    """decide from the PR data alone if a PR could be automerged
+
+    This runs the gates of `_check_pr` that need no API calls or git work,
+    so that the rest is only done for PRs that could pass. The number of
+    PRs stopping at each gate is counted in `PREFILTER_STATS`.
+
+    Parameters
+    ----------
+    login : str
+        The login of the PR author.
+    title : str
+        The PR title.
+    labels : list of str
+        The names of the PR labels.
+
+    Returns
+    -------
+    allowed : bool
+        False if the PR cannot be automerged, True if it needs a full check.
+    reason : str or None
+        The reason the PR cannot be automerged.
+    """
+    if "automerge" in labels:
+        gate, allowed, reason = "label", True, None
+    elif login not in ALLOWED_USERS:
+        gate, allowed, reason = "user", False, "user %s cannot automerge" % login
+    elif "[bot-automerge]" not in title:
+        gate, allowed, reason = (
+            "title",
+            False,
+            "PR does not have the '[bot-automerge]' slug in the title",
+        )
+    else:
+        gate, allowed, reason = "title", True, None
+
+    PREFILTER_STATS["%s:%s" % ("passed" if allowed else "stopped", gate)] += 1
+    return allowed, reason
+
+
+def _prefilter_pr_object(pr):
+    """run `_prefilter_pr` on the data of a PyGithub `PullRequest`"""
+    return _prefilter_pr(pr.user.login, pr.title, [label.name for label in pr.labels])
+
+
+def _check_pr(pr: PullRequest, cfg, snapshot=None) -> tuple[bool, str | None]:
+    """make sure a PR is ok to automerge
+
+    If a PR `snapshot` from `get_pr_snapshot` is given, the PR data are
+    taken from it instead of the API.
+    """
+    if snapshot is not None:
+        labels = snapshot["labels"]
+        login = snapshot["author"]
+        title = snapshot["title"]
+    else:
+        labels = [label.name for label in pr.get_labels()]
+        login = pr.user.login
+        title = pr.title
+
+    pr_has_automerge_label = any(label == "automerge" for label in labels)
 
     # If the automerge label is present, then we can proceed as long as no commits
     # have since been added.
     if pr_has_automerge_label:
-        _no_commits = _no_extra_pr_commits(pr)
+        _no_commits = _no_extra_pr_commits(pr, snapshot=snapshot)
         if _no_commits is None:
             return False, "could not determine if extra commits were made to PR"
         else:
@@ -365,17 +891,16 @@ like to enable automerge again!
                 return False, "commits were made after the automerge label was added"
     else:  # The PR has no automerge label, so proceed only if titled "[bot-automerge]"
         # only allowed users
-        if pr.user.login not in ALLOWED_USERS:
-            return False, "user %s cannot automerge" % pr.user.login
+        if login not in ALLOWED_USERS:
+            return False, "user %s cannot automerge" % login
 
         # only if [bot-automerge] is in the pr title
-        if "[bot-automerge]" not in pr.title:
+        if "[bot-automerge]" not in title:
             return False, "PR does not have the '[bot-automerge]' slug in the title"
 
         # only if only ALLOWED_USERS have commits
-        committers = {getattr(c.author, "login", None) for c in pr.get_commits()}
-        if not all(c in ALLOWED_USERS for c in committers):
-            _comment_on_pr_with_race(
+        if not _only_allowed_committers(pr, snapshot=snapshot):
+            _upsert_pr_comment(
                 pr,
                 """\
 Hi! This is the friendly conda-forge automerge bot!
@@ -384,7 +909,8 @@ It appears that not all commits to this PR were made by the bot. Thus this PR is
 not being automatically merged. Please add the `automerge` label again (or ask a \
 maintainer to do so) if you'd like to enable automerge again!
 """,
-                "not all commits to this PR were made by the bot",
+                "non-bot-commits",
+                legacy_slug="not all commits to this PR were made by the bot",
             )
             return False, "non-bot commits on a bot PR with the automerge slug"
 
@@ -416,33 +942,117 @@ I considered the following status checks when analyzing this PR:
 
     comment = comment + "\n\nThus the PR was %s" % msg
 
-    # the times at which PR statuses return are correlated and so this code
-    # can race when posting failures
-    # thus we can turn up check_race to say 10
-    # in that case to try and randomize to avoid double posting comments
-    # I considered using app slugs (e.g. require the failed check to be triggered
-    # by the same app as a failed one in the final statuses). However, some apps
-    # post more than one message (e.g., circle) so that would not work if they both
-    # fail.
-    # I also thought about using timestamps, but github check events don't come
-    # with one.
+    # the times at which PR statuses return are correlated and so several runs
+    # can comment at the same time - `_upsert_pr_comment` settles this
     check_slug = "I considered the following status checks when analyzing this PR:"
-    _comment_on_pr_with_race(pr, comment, check_slug)
+    _upsert_pr_comment(pr, comment, "statuses", legacy_slug=check_slug)
+
+
+def _resolve_mergeable(repo, number, deadline=None, base_delay=None, max_delay=None):
+    """get a PR, polling until github has computed if it is mergeable
+
+    The PR is fetched fresh until `mergeable` is not None, the PR is merged,
+    or `deadline` seconds have passed. The delays between polls grow
+    exponentially from `base_delay` up to `max_delay` with random jitter.
+    The defaults come from `MERGEABLE_DEADLINE`, `MERGEABLE_BASE_DELAY`,
+    and `MERGEABLE_MAX_DELAY`.
+
+    Returns
+    -------
+    pr : github.PullRequest.PullRequest
+        The last version of the PR fetched. Its `mergeable` is None if it
+        was still unknown at the deadline.
+    """
+    deadline = MERGEABLE_DEADLINE if deadline is None else deadline
+    base_delay = base_delay or MERGEABLE_BASE_DELAY
+    max_delay = max_delay or MERGEABLE_MAX_DELAY
+    end = time.monotonic() + deadline
+
+    attempt = 0
+    while True:
+        with fresh_requests():
+            pr = repo.get_pull(number)
+        if pr.mergeable is not None or pr.merged:
+            return pr
+
+        remaining = end - time.monotonic()
+        if remaining <= 0:
+            LOGGER.warning(
+                "mergeable state of PR %s still unknown after %s seconds",
+                number,
+                deadline,
+            )
+            return pr
+
+        delay = min(base_delay * 2**attempt, max_delay)
+        delay = min(random.uniform(delay / 2, delay), remaining)
+        LOGGER.info("mergeable state of PR %s unknown - waiting %.1fs", number, delay)
+        time.sleep(delay)
+        attempt += 1
 
 
-def _automerge_pr(repo: Repository, pr: PullRequest) -> tuple[bool, str | None]:
-    cfg = _get_conda_forge_config(pr)
-    allowed, msg = _check_pr(pr, cfg)
+def _sha_cache_key(repo, pr, cfg):
+    # the required checks depend on the automerge settings too
+    return (
+        repo.full_name,
+        pr.head.sha,
+        json.dumps(_get_automerge_settings(cfg), sort_keys=True),
+    )
+
+
+def _automerge_pr(
+    repo: Repository, pr: PullRequest, prefiltered=False
+) -> tuple[bool, str | None]:
+    if not prefiltered:
+        allowed, msg = _prefilter_pr_object(pr)
+        if not allowed:
+            return False, msg
+
+    # the workspace is shared by the config read and the CI-file probes
+    with RepoWorkspace(pr) as workspace:
+        try:
+            return _automerge_pr_with_workspace(repo, pr, workspace)
+        finally:
+            LOGGER.info("git transport stats: %s", workspace.transport.summary())
+
+
+def _automerge_pr_with_workspace(
+    repo: Repository, pr: PullRequest, workspace: RepoWorkspace, sha_cache=None
+) -> tuple[bool, str | None]:
+    cfg = _get_conda_forge_config(pr, workspace=workspace)
+
+    # one GraphQL snapshot replaces most of the REST calls below - the commits
+    # of a PR with a verified head are checked via `VERIFIED_PR_HEADS` instead
+    snapshot = get_pr_snapshot(
+        repo,
+        pr,
+        with_commits=VERIFIED_PR_HEADS.get(_pr_key(pr)) is None,
+        allowed_users=ALLOWED_USERS,
+    )
+
+    allowed, msg = _check_pr(pr, cfg, snapshot=snapshot)
 
     if not allowed:
         return False, msg
 
-    # get checks and statuses
-    status_states = _get_github_statuses(repo, pr)
-    check_states = _get_github_checks(repo, pr)
+    # get checks and statuses and which ones are required
+    # PRs with the same head share these through the `sha_cache`
+    def _get_states():
+        return _get_states_concurrently(
+            repo, pr, cfg, snapshot=snapshot, workspace=workspace
+        )
+
+    try:
+        if sha_cache is not None:
+            status_states, check_states, req_checks_and_states = (
+                sha_cache.get_or_compute(_sha_cache_key(repo, pr, cfg), _get_states)
+            )
+        else:
+            status_states, check_states, req_checks_and_states = _get_states()
+    except TimeoutError as e:
+        LOGGER.warning(str(e))
+        return False, "Timed out getting the statuses/checks"
 
-    # get which ones are required
-    req_checks_and_states = _get_required_checks_and_statuses(pr, cfg)
     if len(req_checks_and_states) == 0:
         return False, "At least one status or check must be required"
 
@@ -455,12 +1065,21 @@ def _automerge_pr(repo: Repository, pr: PullRequest) -> tuple[bool, str | None]:
 
     # make sure PR is mergeable and not already merged
     # we have to get the PR again to ensure we have updated mergeable status
-    pr = repo.get_pull(pr.number)
+    # github computes mergeable lazily, so we may have to wait for it
+    pr = _resolve_mergeable(repo, pr.number)
+    with fresh_requests():
+        is_merged = pr.is_merged()
 
-    if pr.is_merged():
+    if is_merged:
         return False, "PR has already been merged"
 
-    if pr.mergeable is None or not pr.mergeable:
+    if pr.mergeable is None:
+        # we do not know yet - the next CI event will try again
+        return False, "PR merge issue: mergeable|mergeable_state = {}|{}".format(
+            pr.mergeable, pr.mergeable_state
+        )
+
+    if not pr.mergeable:
         _comment_on_pr(
             pr,
             final_statuses,
@@ -508,7 +1127,9 @@ def _automerge_pr(repo: Repository, pr: PullRequest) -> tuple[bool, str | None]:
         return True, "all is well :)"
 
 
-def automerge_pr(repo: Repository, pr: PullRequest) -> tuple[bool, str | None]:
+def automerge_pr(
+    repo: Repository, pr: PullRequest, prefiltered=False
+) -> tuple[bool, str | None]:
     """Possibly automerge a PR.
 
     Parameters
@@ -517,6 +1138,9 @@ def automerge_pr(repo: Repository, pr: PullRequest) -> tuple[bool, str | None]:
         A `Repository` object for the given repo from the PyGithub package.
     pr : github.PullRequest.PullRequest
         A `PullRequest` object for the given PR from the PyGithub package.
+    prefiltered : bool, optional
+        If True, the PR already passed `_prefilter_pr` (e.g., on the event
+        payload or the search results), so it is not run again.
 
     Returns
     -------
@@ -525,11 +1149,13 @@ def automerge_pr(repo: Repository, pr: PullRequest) -> tuple[bool, str | None]:
     reason : str
         The reason the merge worked or did not work.
     """
-    did_merge, reason = _automerge_pr(repo, pr)
+    did_merge, reason = _automerge_pr(repo, pr, prefiltered=prefiltered)
+    _log_merge_result(repo, pr, did_merge, reason)
+    return did_merge, reason
 
+
+def _log_merge_result(repo, pr, did_merge, reason):
     if did_merge:
         LOGGER.info("MERGED PR %s on %s: %s", pr.number, repo.full_name, reason)
     else:
         LOGGER.info("DID NOT MERGE PR %s on %s: %s", pr.number, repo.full_name, reason)
-
-    return did_merge, reason
@@ -0,0 +1,220 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+LOGGER = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """A thread-safe in-memory cache that evicts the least recently used entry.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        The maximum number of entries.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class DiskCache:
+    """A cache of JSON-serializable values stored as files in a directory.
+
+    When there are more than `max_entries` files, the least recently used
+    ones are removed.
+
+    Parameters
+    ----------
+    path : str
+        The directory for the cache. It is made if it does not exist.
+    max_entries : int, optional
+        The maximum number of entries.
+    """
+
+    def __init__(self, path, max_entries=1024):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.path, exist_ok=True)
+
+    def _fname(self, key):
+        return os.path.join(
+            self.path, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json"
+        )
+
+    def get(self, key, default=None):
+        fname = self._fname(key)
+        try:
+            with open(fname) as fp:
+                value = json.load(fp)
+        except (OSError, ValueError):
+            self.misses += 1
+            return default
+        try:
+            os.utime(fname)
+        except OSError:
+            pass
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        # write to a temporary file first so readers never see partial data
+        fd, tmpname = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "w") as fp:
+            json.dump(value, fp)
+        os.replace(tmpname, self._fname(key))
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for fname in os.listdir(self.path):
+            if not fname.endswith(".json"):
+                continue
+            fname = os.path.join(self.path, fname)
+            try:
+                entries.append((os.path.getmtime(fname), fname))
+            except OSError:
+                pass
+        entries.sort()
+        for _, fname in entries[: max(len(entries) - self.max_entries, 0)]:
+            try:
+                os.remove(fname)
+                self.evictions += 1
+            except OSError:
+                pass
+
+
+class TieredCache:
+    """An in-memory LRU cache backed by an optional on-disk cache.
+
+    Values found on disk are promoted to memory.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        The maximum number of entries in memory.
+    disk_path : str, optional
+        The directory for the on-disk cache. If not given, only memory is used.
+    max_disk_entries : int, optional
+        The maximum number of entries on disk.
+    """
+
+    def __init__(self, maxsize=128, disk_path=None, max_disk_entries=1024):
+        self.memory = LRUCache(maxsize=maxsize)
+        if disk_path is not None:
+            self.disk = DiskCache(disk_path, max_entries=max_disk_entries)
+        else:
+            self.disk = None
+
+    def get(self, key, default=None):
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+                return value
+
+        return default
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value)
+            except OSError:
+                LOGGER.warning("could not write %s to the disk cache", key)
+
+    def stats(self):
+        """Return the hit, miss and eviction counts of each tier."""
+        stats = {
+            "memory_hits": self.memory.hits,
+            "memory_evictions": self.memory.evictions,
+        }
+        if self.disk is not None:
+            stats["disk_hits"] = self.disk.hits
+            stats["disk_evictions"] = self.disk.evictions
+            stats["misses"] = self.disk.misses
+        else:
+            stats["misses"] = self.memory.misses
+        return stats
+
+
+class OnceCache:
+    """A thread-safe cache that computes the value of each key only once.
+
+    Threads asking for a key that is being computed wait for the result
+    instead of computing it again. If the computation raises, the next
+    caller tries again.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_compute(self, key, func):
+        """Return the value for `key`, calling `func()` to make it if needed."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = {"lock": threading.Lock(), "done": False, "value": None}
+                self._entries[key] = entry
+
+        with entry["lock"]:
+            if entry["done"]:
+                self.hits += 1
+            else:
+                entry["value"] = func()
+                entry["done"] = True
+                self.misses += 1
+            return entry["value"]
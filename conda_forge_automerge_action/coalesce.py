@@ -0,0 +1,163 @@
+"""A work queue that merges the pending events for the same key.
+
+A single commit to a feedstock fires a burst of `status`, `check_suite` and
+`workflow_run` events, all of which lead to the same evaluation of the same
+PRs. The `CoalescingQueue` keys the work by `(repo, head SHA)` so that the
+events of a burst end up in one evaluation.
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+LOGGER = logging.getLogger(__name__)
+
+# the seconds to wait after the first event for a key by default
+DEFAULT_DEBOUNCE_WINDOW = 5
+
+
+class CoalescingQueue:
+    """A debouncing work queue that runs at most one item per key at a time.
+
+    The first item submitted for a key is run `window` seconds later. Items
+    submitted for the key in the meantime replace it, so only the last one
+    is run. Items submitted while the item for the key is running are merged
+    into a single follow-up run, which is scheduled once the running one is
+    done. Runs for different keys are spread over a pool of worker threads.
+
+    Parameters
+    ----------
+    func : callable
+        Called as `func(item)` in a worker thread for each run.
+    window : float, optional
+        The debounce window in seconds. Defaults to `DEFAULT_DEBOUNCE_WINDOW`.
+    workers : int, optional
+        The number of worker threads.
+
+    Attributes
+    ----------
+    submitted : int
+        The number of items submitted.
+    coalesced : int
+        The number of items replaced by a later item for the same key.
+    runs : int
+        The number of items handed to the workers.
+    """
+
+    def __init__(self, func, window=None, workers=None):
+        self.func = func
+        self.window = DEFAULT_DEBOUNCE_WINDOW if window is None else window
+        self.submitted = 0
+        self.coalesced = 0
+        self.runs = 0
+        # key -> item, for the keys waiting for their window to pass
+        self._pending = {}
+        # the heap of (due time, sequence number, key) of the pending keys
+        self._due = []
+        self._seq = itertools.count()
+        self._running = set()
+        # key -> (item, time), for the keys to run again once they are done
+        self._followups = {}
+        self._closed = False
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="automerge-worker"
+        )
+        self._thread = threading.Thread(
+            target=self._schedule, name="automerge-scheduler", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def depth(self):
+        """The number of keys waiting to be run."""
+        with self._cond:
+            return len(self._pending) + len(self._followups)
+
+    @property
+    def coalesce_ratio(self):
+        """The fraction of the submitted items merged into another run."""
+        with self._cond:
+            return self.coalesced / self.submitted if self.submitted else 0.0
+
+    def stats(self):
+        """Return a dict of the queue metrics."""
+        with self._cond:
+            return {
+                "submitted": self.submitted,
+                "coalesced": self.coalesced,
+                "runs": self.runs,
+                "depth": len(self._pending) + len(self._followups),
+                "running": len(self._running),
+                "coalesce_ratio": (
+                    self.coalesced / self.submitted if self.submitted else 0.0
+                ),
+            }
+
+    def submit(self, key, item):
+        """Queue `item` to be run for `key`."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("cannot submit to a closed queue")
+            self.submitted += 1
+            if key in self._running:
+                if key in self._followups:
+                    self.coalesced += 1
+                    first_time = self._followups[key][1]
+                else:
+                    first_time = time.monotonic()
+                self._followups[key] = (item, first_time)
+            elif key in self._pending:
+                self.coalesced += 1
+                self._pending[key] = item
+            else:
+                self._push(key, item, time.monotonic())
+
+    def _push(self, key, item, first_time):
+        self._pending[key] = item
+        heapq.heappush(self._due, (first_time + self.window, next(self._seq), key))
+        self._cond.notify()
+
+    def _schedule(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                # when closing, the pending keys are run right away
+                while self._due and (self._closed or self._due[0][0] <= now):
+                    _, _, key = heapq.heappop(self._due)
+                    item = self._pending.pop(key)
+                    self._running.add(key)
+                    self.runs += 1
+                    self._executor.submit(self._run, key, item)
+
+                if self._closed and not self._running:
+                    return
+                self._cond.wait(self._due[0][0] - now if self._due else None)
+
+    def _run(self, key, item):
+        try:
+            self.func(item)
+        except Exception:
+            LOGGER.exception("could not run the queued work for %s", key)
+        finally:
+            with self._cond:
+                self._running.discard(key)
+                if key in self._followups:
+                    self._push(key, *self._followups.pop(key))
+                else:
+                    self._cond.notify()
+
+    def shutdown(self):
+        """Stop accepting items and wait until the queued ones are run.
+
+        The pending items are run without waiting for their window, and so
+        are the follow-ups of the running ones.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self._executor.shutdown()
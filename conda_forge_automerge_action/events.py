@@ -0,0 +1,170 @@
+"""Triage and evaluate the GitHub events that can lead to a merge.
+
+These are shared by the action (`__main__`) and the webhook server
+(`server`).
+"""
+
+import logging
+
+from github.PaginatedList import PaginatedList
+from github.PullRequest import PullRequest
+
+from .async_automerge import automerge_prs
+from .automerge import REQUIRED_CHECK_NAMES, _prefilter_pr, automerge_pr
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _can_be_required(name):
+    name = (name or "").lower()
+    return any(req in name for req in REQUIRED_CHECK_NAMES)
+
+
+# the events that cannot change an automerge decision, as rules of
+# (event name, description, predicate on the payload) - see the README
+EVENT_TRIAGE_RULES = [
+    ("status", "the status is pending", lambda data: data.get("state") == "pending"),
+    (
+        "status",
+        "the status context is not for a CI service we require",
+        lambda data: not _can_be_required(data.get("context")),
+    ),
+    (
+        "check_suite",
+        "the check suite is not completed",
+        lambda data: data["check_suite"].get("status") != "completed",
+    ),
+    (
+        "check_suite",
+        "the check suite app is not for a CI service we require",
+        lambda data: (
+            not _can_be_required((data["check_suite"].get("app") or {}).get("slug"))
+        ),
+    ),
+    (
+        "workflow_run",
+        "the workflow run is not completed",
+        lambda data: data["workflow_run"].get("status") != "completed",
+    ),
+    (
+        "pull_request",
+        "the PR is not open",
+        lambda data: data["pull_request"].get("state") != "open",
+    ),
+    (
+        "pull_request_review",
+        "the PR is not open",
+        lambda data: data["pull_request"].get("state") != "open",
+    ),
+]
+
+
+def _triage_event(event_name, event_data):
+    """Decide from the payload alone if an event needs to be evaluated.
+
+    Returns
+    -------
+    evaluate : bool
+        False if the event cannot change the automerge decision for any PR.
+    reason : str or None
+        The description of the rule that matched.
+    """
+    for rule_event, description, predicate in EVENT_TRIAGE_RULES:
+        if rule_event == event_name and predicate(event_data):
+            return False, description
+    return True, None
+
+
+def _get_prs_for_sha(repo, sha, event_name, event_data):
+    """Get the open PRs in `repo` whose head is `sha`.
+
+    The PRs are taken from the `pull_requests` of `check_suite` and
+    `workflow_run` payloads or from the commits/{sha}/pulls endpoint for
+    `status` events. If none are found that way (e.g., for PRs from forks),
+    we fall back to scanning all open PRs.
+    """
+    prs = []
+    if event_name in ["check_suite", "workflow_run"]:
+        for pr_data in event_data[event_name].get("pull_requests") or []:
+            if (
+                pr_data["head"]["sha"] == sha
+                and pr_data["base"]["repo"]["url"] == repo.url
+            ):
+                pr = repo.get_pull(int(pr_data["number"]))
+                # the payload lists the PRs when the run started
+                if pr.state == "open" and pr.head.sha == sha:
+                    prs.append(pr)
+    elif event_name == "status":
+        # this is Commit.get_pulls w/o fetching the commit first
+        commit_prs = PaginatedList(
+            PullRequest, repo.requester, f"{repo.url}/commits/{sha}/pulls", None
+        )
+        prs = [pr for pr in commit_prs if pr.state == "open" and pr.head.sha == sha]
+
+    if not prs:
+        LOGGER.info("no PRs found for %s in the event - scanning all open PRs", sha)
+        prs = [pr for pr in repo.get_pulls() if pr.head.sha == sha]
+
+    return prs
+
+
+def _get_event_sha(event_name, event_data):
+    """Get the head SHA an event is for, or None for other events."""
+    if event_name == "status":
+        return event_data["sha"]
+    elif event_name in ["check_suite", "workflow_run"]:
+        return event_data[event_name]["head_sha"]
+    elif event_name in ["pull_request", "pull_request_review"]:
+        return event_data["pull_request"]["head"]["sha"]
+    else:
+        return None
+
+
+def _evaluate_event(gh, event_name, event_data, repo_name):
+    """Possibly automerge the PRs of an event.
+
+    Parameters
+    ----------
+    gh : github.MainClass.Github
+        The API sessions.
+    event_name : str
+        The name of the GitHub event.
+    event_data : dict
+        The payload of the event.
+    repo_name : str
+        The full name of the repo the event is for.
+
+    Returns
+    -------
+    supported : bool
+        False if events of this kind cannot be processed.
+    """
+    if event_name in ["status", "check_suite", "workflow_run"]:
+        sha = _get_event_sha(event_name, event_data)
+        repo = gh.get_repo(repo_name)
+        prs = _get_prs_for_sha(repo, sha, event_name, event_data)
+        # several PRs can have the same head, so evaluate them concurrently
+        automerge_prs([(repo, pr) for pr in prs])
+
+    elif event_name in ["pull_request", "pull_request_review"]:
+        pr_data = event_data["pull_request"]
+        repo_name = pr_data["base"]["repo"]["full_name"]
+        pr_num = int(pr_data["number"])
+
+        allowed, reason = _prefilter_pr(
+            pr_data["user"]["login"],
+            pr_data["title"],
+            [label["name"] for label in pr_data.get("labels") or []],
+        )
+        if allowed:
+            repo = gh.get_repo(repo_name)
+            pr = repo.get_pull(pr_num)
+
+            # the pre-filter already ran (and was counted) on the payload
+            automerge_pr(repo, pr, prefiltered=True)
+        else:
+            LOGGER.info("DID NOT MERGE PR %s on %s: %s", pr_num, repo_name, reason)
+    else:
+        return False
+
+    return True
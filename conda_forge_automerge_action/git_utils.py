@@ -0,0 +1,481 @@
+import asyncio
+import contextlib
+import fcntl
+import logging
+import os
+import subprocess
+import tempfile
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+
+# https://stackoverflow.com/questions/6194499/pushd-through-os-system
+@contextlib.contextmanager
+def pushd(new_dir):
+    previous_dir = os.getcwd()
+    os.chdir(new_dir)
+    try:
+        yield
+    finally:
+        os.chdir(previous_dir)
+
+
+def _run_git_command(*args):
+    try:
+        c = subprocess.run(
+            ["git"] + list(args),
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+    except subprocess.CalledProcessError as e:
+        print(e.stdout)
+        print(e.stderr)
+        raise e
+    return c.stdout
+
+
+async def _run_git_command_async(*args):
+    """Run a git command without blocking the event loop.
+
+    This behaves like `_run_git_command`.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        "git",
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await proc.communicate()
+    stdout = stdout.decode("utf-8", errors="replace")
+    stderr = stderr.decode("utf-8", errors="replace")
+    if proc.returncode != 0:
+        print(stdout)
+        print(stderr)
+        raise subprocess.CalledProcessError(
+            proc.returncode, ["git"] + list(args), output=stdout, stderr=stderr
+        )
+    return stdout
+
+
+GIT_TRANSPORT_MODES = ["full", "partial", "sparse"]
+DEFAULT_GIT_TRANSPORT_MODE = "partial"
+
+
+def _dir_size(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        for fname in files:
+            try:
+                size += os.path.getsize(os.path.join(root, fname))
+            except OSError:
+                pass
+    return size
+
+
+class GitTransport:
+    """Run the git operations of the action in a given transport mode.
+
+    The modes are
+
+    - `full`: plain clones and fetches of the full history, with checkouts
+      of the full working tree
+    - `partial`: shallow (`--depth=1`), blobless (`--filter=blob:none`)
+      clones and fetches without a checkout, so that files are read from
+      the git trees and blobs are fetched only when they are read
+    - `sparse`: like `partial`, but checkouts are limited to the paths the
+      action inspects via sparse checkout
+
+    The `clone`, `fetch` and `git` methods have `async` counterparts
+    (`aclone`, `afetch` and `agit`) that run git without blocking the
+    event loop.
+
+    If a `mirror_dir` is given, clones that pass a `mirror_key` borrow the
+    objects of a local mirror of the repo (`git clone --mirror`) via
+    `--reference`. The mirror is made on first use and refreshed with
+    `git fetch` before each clone, so only new objects are transferred.
+    Clones that use a mirror are not shallow or blobless since all of
+    their objects are local already.
+
+    The elapsed time and the growth of the git object store of each
+    operation are recorded in `stats`.
+
+    Parameters
+    ----------
+    mode : str, optional
+        The transport mode. Defaults to `partial`.
+    mirror_dir : str, optional
+        The directory for the repo mirrors. If not given, no mirrors are used.
+    """
+
+    def __init__(self, mode=DEFAULT_GIT_TRANSPORT_MODE, mirror_dir=None):
+        if mode not in GIT_TRANSPORT_MODES:
+            raise ValueError(
+                "git transport mode %r is not one of %r" % (mode, GIT_TRANSPORT_MODES)
+            )
+        self.mode = mode
+        self.mirror_dir = mirror_dir
+        self.stats = []
+        self._mirrored_dests = set()
+
+    @staticmethod
+    def _objects_dir(dest):
+        if not os.path.exists(os.path.join(dest, ".git")) and os.path.exists(
+            os.path.join(dest, "objects")
+        ):
+            # a bare repo (i.e., a mirror)
+            return os.path.join(dest, "objects")
+        return os.path.join(dest, ".git", "objects")
+
+    def _record(self, op, dest, t0, size_before):
+        # the object store is looked up again, since a clone (e.g., a bare
+        # mirror) makes it
+        self.stats.append(
+            {
+                "op": op,
+                "mode": self.mode,
+                "seconds": time.monotonic() - t0,
+                "bytes": max(_dir_size(self._objects_dir(dest)) - size_before, 0),
+            }
+        )
+
+    def _run(self, op, dest, *args):
+        size_before = _dir_size(self._objects_dir(dest))
+        t0 = time.monotonic()
+        try:
+            return _run_git_command(*args)
+        finally:
+            self._record(op, dest, t0, size_before)
+
+    async def _arun(self, op, dest, *args):
+        size_before = _dir_size(self._objects_dir(dest))
+        t0 = time.monotonic()
+        try:
+            return await _run_git_command_async(*args)
+        finally:
+            self._record(op, dest, t0, size_before)
+
+    def git(self, dest, *args):
+        """Run `git -C dest *args`, recording its stats."""
+        return self._run(args[0], dest, "-C", dest, *args)
+
+    async def agit(self, dest, *args):
+        """Run `git -C dest *args` asynchronously, recording its stats."""
+        return await self._arun(args[0], dest, "-C", dest, *args)
+
+    def mirror(self, url, key):
+        """Make or refresh the mirror of `url` stored under `key`.
+
+        Returns the path to the mirror.
+        """
+        path = os.path.join(self.mirror_dir, key + ".git")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # other processes may be using the same mirror
+        with open(path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if os.path.exists(os.path.join(path, "HEAD")):
+                    self.git(path, "fetch", "--quiet", "--prune", "origin")
+                else:
+                    self._run("mirror", path, "clone", "--quiet", "--mirror", url, path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return path
+
+    def clone(self, url, dest, branch=None, mirror_key=None):
+        """Clone `url` into `dest`, optionally only the branch `branch`.
+
+        If `mirror_key` is given and the transport has a `mirror_dir`, the
+        mirror stored under that key is used as a reference.
+        """
+        reference = None
+        if self.mirror_dir and mirror_key:
+            try:
+                reference = self.mirror(url, mirror_key)
+            except subprocess.CalledProcessError:
+                LOGGER.warning("could not update the mirror for %s", mirror_key)
+        return self._run(
+            "clone", dest, *self._clone_args(dest, branch, reference), url, dest
+        )
+
+    async def aclone(self, url, dest, branch=None, mirror_key=None):
+        """Clone `url` into `dest` asynchronously. See `clone`."""
+        reference = None
+        if self.mirror_dir and mirror_key:
+            try:
+                # the mirror is guarded by a blocking file lock, so it is
+                # updated in a thread
+                reference = await asyncio.to_thread(self.mirror, url, mirror_key)
+            except subprocess.CalledProcessError:
+                LOGGER.warning("could not update the mirror for %s", mirror_key)
+        return await self._arun(
+            "clone", dest, *self._clone_args(dest, branch, reference), url, dest
+        )
+
+    def _clone_args(self, dest, branch, reference):
+        if reference is not None:
+            self._mirrored_dests.add(dest)
+            args = ["clone", "--quiet", "--reference", reference]
+            if self.mode != "full":
+                args += ["--no-checkout"]
+            if branch is not None:
+                args += ["--branch", branch]
+        elif self.mode == "full":
+            args = ["clone"]
+            if branch is not None:
+                args += ["--branch", branch]
+        else:
+            args = [
+                "clone",
+                "--quiet",
+                "--filter=blob:none",
+                "--depth=1",
+                "--no-checkout",
+            ]
+            if branch is not None:
+                args += ["--single-branch", "--branch", branch]
+        return args
+
+    def _fetch_args(self, dest):
+        args = ["fetch", "--quiet"]
+        if self.mode != "full" and dest not in self._mirrored_dests:
+            args += ["--depth=1", "--filter=blob:none"]
+        return args
+
+    def fetch(self, dest, remote, refspec):
+        """Fetch `refspec` from `remote` into the clone at `dest`."""
+        return self.git(dest, *self._fetch_args(dest), remote, refspec)
+
+    async def afetch(self, dest, remote, refspec):
+        """Fetch `refspec` from `remote` asynchronously. See `fetch`."""
+        return await self.agit(dest, *self._fetch_args(dest), remote, refspec)
+
+    def checkout(self, dest, rev, paths=None):
+        """Check out `rev` in the clone at `dest`.
+
+        If `paths` is given, only those paths are checked out with a sparse
+        checkout unless the mode is `full`. This includes the `partial` mode,
+        which normally reads files from the git trees without a checkout but
+        still needs one for the code paths without a `RepoWorkspace`.
+        """
+        if self.mode != "full" and paths:
+            self.git(dest, "sparse-checkout", "set", "--no-cone", *paths)
+        self.git(dest, "checkout", "--quiet", "--detach", rev)
+        return dest
+
+    def summary(self):
+        """Return the total number of operations, bytes, and seconds."""
+        return {
+            "mode": self.mode,
+            "ops": len(self.stats),
+            "bytes": sum(s["bytes"] for s in self.stats),
+            "seconds": sum(s["seconds"] for s in self.stats),
+        }
+
+
+def get_git_transport():
+    """Make a `GitTransport` with the mode and mirrors from the action inputs."""
+    mode = os.environ.get("INPUT_GIT_TRANSPORT", "") or DEFAULT_GIT_TRANSPORT_MODE
+    mirror_dir = os.environ.get("INPUT_GIT_MIRROR_DIR", "") or None
+    return GitTransport(mode.strip().lower(), mirror_dir=mirror_dir)
+
+
+def _fetch_file_at_ref(clone_url, ref, path, tmpdir, transport=None):
+    """get the contents of a single file at a branch without the history
+
+    In the `partial` and `sparse` transport modes, this does a shallow,
+    blobless clone so that only the tip commit and its trees are
+    transferred. The blob for `path` is then fetched lazily by `git show`.
+
+    Parameters
+    ----------
+    clone_url : str
+        The URL to clone from.
+    ref : str
+        The branch to read the file from.
+    path : str
+        The path of the file relative to the root of the repo.
+    tmpdir : str
+        An empty directory to use for the clone.
+    transport : GitTransport, optional
+        The transport to use. Defaults to a `partial` one.
+
+    Returns
+    -------
+    contents : str
+        The contents of the file.
+    """
+    transport = transport or GitTransport()
+    transport.clone(clone_url, tmpdir, branch=ref)
+    return transport.git(tmpdir, "show", f"HEAD:{path}")
+
+
+class RepoWorkspace:
+    """A per-run git workspace for a PR.
+
+    The base branch of the PR is cloned once and the PR head is fetched
+    into the same object store (via `refs/pull/<number>/head`), so that the
+    base and head share all of their common objects. Nothing is cloned until
+    the workspace is first used.
+
+    Use this object as a context manager so that the clone is cleaned up.
+    In async code, `await workspace.aprepare()` clones the base and fetches
+    the head without blocking the event loop, after which the rest of the
+    methods only use local git data.
+
+    Parameters
+    ----------
+    pr : github.PullRequest.PullRequest
+        A `PullRequest` object for the given PR from the PyGithub package.
+    transport : GitTransport, optional
+        The transport for the git operations. Defaults to the one from
+        `get_git_transport`.
+    """
+
+    def __init__(self, pr, transport=None):
+        self.pr = pr
+        self.transport = transport or get_git_transport()
+        self.path = None
+        self._tmpdir = None
+        self._base_sha = None
+        self._head_fetched = False
+        self._aprepare_lock = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.cleanup()
+
+    def cleanup(self):
+        if self._tmpdir is not None:
+            self._tmpdir.cleanup()
+        self._tmpdir = None
+        self.path = None
+        self._base_sha = None
+        self._head_fetched = False
+
+    def _git(self, *args):
+        return self.transport.git(self.path, *args)
+
+    def _base_clone_kwargs(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.path = self._tmpdir.name
+        return dict(
+            url=self.pr.base.repo.clone_url,
+            dest=self.path,
+            branch=self.pr.base.ref,
+            mirror_key=self.pr.base.repo.full_name,
+        )
+
+    def _head_sources(self):
+        # the PR ref lives in the base repo, so try that first, then the
+        # commit itself and finally the head repo (e.g., for a non-GitHub
+        # server)
+        return [
+            ("origin", f"refs/pull/{self.pr.number}/head"),
+            ("origin", self.pr.head.sha),
+            (self.pr.head.repo.clone_url, self.pr.head.sha),
+        ]
+
+    def _head_not_found(self):
+        return RuntimeError(f"could not fetch the head {self.pr.head.sha} of the PR!")
+
+    @property
+    def base_sha(self):
+        """The SHA of the tip of the PR base branch, cloning if needed."""
+        if self._base_sha is None:
+            self.transport.clone(**self._base_clone_kwargs())
+            self._base_sha = self._git("rev-parse", "HEAD").strip()
+        return self._base_sha
+
+    @property
+    def head_sha(self):
+        """The SHA of the PR head, fetching it into the workspace if needed."""
+        if not self._head_fetched:
+            self.base_sha  # make sure we have cloned
+            for remote, refspec in self._head_sources():
+                try:
+                    self.transport.fetch(self.path, remote, refspec)
+                except subprocess.CalledProcessError:
+                    LOGGER.warning("could not fetch %s from %s", refspec, remote)
+                    continue
+                if self._has_commit(self.pr.head.sha):
+                    break
+            else:
+                raise self._head_not_found()
+            self._head_fetched = True
+        return self.pr.head.sha
+
+    async def aprepare(self):
+        """Clone the base and fetch the head without blocking the event loop.
+
+        This is safe to call from several tasks at once and does nothing
+        if the workspace is ready already.
+        """
+        if self._aprepare_lock is None:
+            self._aprepare_lock = asyncio.Lock()
+        async with self._aprepare_lock:
+            await self._aprepare()
+
+    async def _aprepare(self):
+        if self._base_sha is None:
+            await self.transport.aclone(**self._base_clone_kwargs())
+            self._base_sha = (await self._agit("rev-parse", "HEAD")).strip()
+
+        if not self._head_fetched:
+            for remote, refspec in self._head_sources():
+                try:
+                    await self.transport.afetch(self.path, remote, refspec)
+                except subprocess.CalledProcessError:
+                    LOGGER.warning("could not fetch %s from %s", refspec, remote)
+                    continue
+                try:
+                    await self._agit("cat-file", "-e", f"{self.pr.head.sha}^{{commit}}")
+                except subprocess.CalledProcessError:
+                    continue
+                break
+            else:
+                raise self._head_not_found()
+            self._head_fetched = True
+
+    async def _agit(self, *args):
+        return await self.transport.agit(self.path, *args)
+
+    def _has_commit(self, sha):
+        try:
+            self._git("cat-file", "-e", f"{sha}^{{commit}}")
+        except subprocess.CalledProcessError:
+            return False
+        return True
+
+    def blob_sha(self, rev, path):
+        """Return the SHA of the blob at `path` in commit `rev`.
+
+        Only the trees are needed for this, so the blob is not fetched.
+        """
+        return self._git("rev-parse", f"{rev}:{path}").strip()
+
+    def read_file(self, rev, path):
+        """Read the contents of the file at `path` from commit `rev`."""
+        return self._git("show", f"{rev}:{path}")
+
+    def list_paths(self, rev, paths=None):
+        """List the files in commit `rev`, optionally limited to `paths`.
+
+        Only the trees are needed for this, so no blobs are fetched.
+        """
+        args = ["ls-tree", "-r", "--name-only", "-z", rev]
+        if paths:
+            args += ["--"] + list(paths)
+        return {p for p in self._git(*args).split("\0") if p}
+
+    def checkout(self, rev, paths=None):
+        """Check out commit `rev` into the workspace and return its path.
+
+        If `paths` is given, the checkout is limited to them in the `sparse`
+        and `partial` transport modes.
+        """
+        return self.transport.checkout(self.path, rev, paths=paths)
@@ -0,0 +1,253 @@
+import datetime
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+PR_SNAPSHOT_QUERY = """\
+query(
+  $owner: String!,
+  $name: String!,
+  $number: Int!,
+  $commitsCursor: String,
+  $timelineCursor: String,
+  $withCommits: Boolean!,
+  $withTimeline: Boolean!,
+  $withHead: Boolean!
+) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      title
+      mergeable
+      mergeStateStatus
+      author { login }
+      labels(first: 100) { nodes { name } }
+      commits(first: 100, after: $commitsCursor) @include(if: $withCommits) {
+        pageInfo { hasNextPage endCursor }
+        nodes { commit { oid author { user { login } } } }
+      }
+      timelineItems(
+        last: 100,
+        before: $timelineCursor,
+        itemTypes: [LABELED_EVENT, PULL_REQUEST_COMMIT]
+      ) @include(if: $withTimeline) {
+        pageInfo { hasPreviousPage startCursor }
+        nodes {
+          __typename
+          ... on LabeledEvent { createdAt label { name } }
+          ... on PullRequestCommit { commit { oid } }
+        }
+      }
+      headCommit: commits(last: 1) @include(if: $withHead) {
+        nodes {
+          commit {
+            oid
+            status { contexts { context state } }
+            checkSuites(first: 100) {
+              pageInfo { hasNextPage }
+              nodes {
+                status
+                conclusion
+                app { slug }
+                checkRuns(first: 100, filterBy: {checkType: LATEST}) {
+                  pageInfo { hasNextPage }
+                  nodes { name }
+                }
+              }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+# the GraphQL API has an extra status state that means pending for us
+_STATUS_STATES = {"expected": "pending"}
+
+_MERGEABLE = {"MERGEABLE": True, "CONFLICTING": False}
+
+
+def _parse_time(value):
+    if value is None:
+        return None
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _lower(value):
+    return value.lower() if value is not None else None
+
+
+def _parse_head_commit(snapshot, head):
+    snapshot["head_sha"] = head["oid"]
+
+    snapshot["statuses"] = {}
+    for ctx in (head.get("status") or {}).get("contexts", []):
+        state = ctx["state"].lower()
+        snapshot["statuses"][ctx["context"]] = _STATUS_STATES.get(state, state)
+
+    # the check suites and runs are not paged, so more than one page of them
+    # makes the snapshot unusable
+    snapshot["checks_complete"] = not head["checkSuites"]["pageInfo"]["hasNextPage"]
+    snapshot["checks"] = []
+    for suite in head["checkSuites"]["nodes"]:
+        check = {
+            "app": {"slug": (suite.get("app") or {}).get("slug")},
+            "status": _lower(suite["status"]),
+            "conclusion": _lower(suite["conclusion"]),
+        }
+        # same as the REST code, we only need the runs for completed gha suites
+        if check["status"] == "completed" and check["app"]["slug"] == "github-actions":
+            check["runs"] = [run["name"] for run in suite["checkRuns"]["nodes"]]
+            if suite["checkRuns"]["pageInfo"]["hasNextPage"]:
+                snapshot["checks_complete"] = False
+        else:
+            check["runs"] = None
+        snapshot["checks"].append(check)
+
+
+def fetch_pr_snapshot(repo, pr, with_commits=True, allowed_users=None):
+    """Fetch everything needed to evaluate a PR with paginated GraphQL queries.
+
+    The timeline is paged from the newest events backwards and the paging
+    stops at the last `automerge` label, since only the events after it are
+    needed by `_no_extra_pr_commits`.
+
+    Parameters
+    ----------
+    repo : github.Repository.Repository
+        A `Repository` object for the given repo from the PyGithub package.
+    pr : github.PullRequest.PullRequest
+        A `PullRequest` object for the given PR from the PyGithub package.
+    with_commits : bool, optional
+        If False, the commits of the PR are not paged through, e.g., because
+        an earlier head of the PR was already verified.
+    allowed_users : collection of str, optional
+        If given, the commits are only paged through up to the first one
+        whose author is not in it.
+
+    Returns
+    -------
+    snapshot : dict
+        A dictionary with the keys
+
+        - `title`, `author`, `labels`: the PR title, author login and
+          label names
+        - `commit_authors`: the GitHub login (or None) of the author of each
+          commit, or None if `with_commits` is False. The list ends at the
+          first author not in `allowed_users`.
+        - `timeline`: a list of dicts with keys `event` (`labeled` or
+          `committed`), `created_at` and `label`, in order, starting at the
+          page with the last `automerge` label
+        - `head_sha`: the SHA of the PR head
+        - `statuses`: a dict mapping each status context to its latest state
+        - `checks`: a list of dicts in the same format as `_get_checks`
+        - `checks_complete`: False if there are more check suites or runs
+          than fit in one page, in which case `checks` is incomplete
+        - `mergeable`, `merge_state_status`: the merge state of the PR
+        - `queries`: the number of GraphQL queries made
+    """
+    owner, name = repo.full_name.split("/")
+    variables = {
+        "owner": owner,
+        "name": name,
+        "number": pr.number,
+        "commitsCursor": None,
+        "timelineCursor": None,
+        "withCommits": with_commits,
+        "withTimeline": True,
+        "withHead": True,
+    }
+
+    snapshot = {
+        "commit_authors": [] if with_commits else None,
+        "timeline": [],
+        "queries": 0,
+    }
+    while True:
+        _, data = repo.requester.graphql_query(PR_SNAPSHOT_QUERY, variables)
+        snapshot["queries"] += 1
+        data = data["data"]["repository"]["pullRequest"]
+
+        if variables["withHead"]:
+            snapshot["title"] = data["title"]
+            snapshot["author"] = (data.get("author") or {}).get("login")
+            snapshot["labels"] = [lb["name"] for lb in data["labels"]["nodes"]]
+            snapshot["mergeable"] = _MERGEABLE.get(data["mergeable"])
+            snapshot["merge_state_status"] = _lower(data["mergeStateStatus"])
+            _parse_head_commit(snapshot, data["headCommit"]["nodes"][0]["commit"])
+
+        if variables["withCommits"]:
+            disallowed = False
+            for node in data["commits"]["nodes"]:
+                user = (node["commit"].get("author") or {}).get("user") or {}
+                snapshot["commit_authors"].append(user.get("login"))
+                if allowed_users is not None and user.get("login") not in allowed_users:
+                    # the head fails with this author, so the rest is not needed
+                    disallowed = True
+                    break
+            page = data["commits"]["pageInfo"]
+            variables["withCommits"] = page["hasNextPage"] and not disallowed
+            variables["commitsCursor"] = page["endCursor"]
+
+        if variables["withTimeline"]:
+            events = []
+            for node in data["timelineItems"]["nodes"]:
+                if node["__typename"] == "LabeledEvent":
+                    events.append(
+                        {
+                            "event": "labeled",
+                            "created_at": _parse_time(node["createdAt"]),
+                            "label": node["label"]["name"],
+                        }
+                    )
+                else:
+                    events.append(
+                        {"event": "committed", "created_at": None, "label": None}
+                    )
+            # the pages come newest first
+            snapshot["timeline"][:0] = events
+            page = data["timelineItems"]["pageInfo"]
+            variables["withTimeline"] = page["hasPreviousPage"] and not any(
+                e["event"] == "labeled" and e["label"] == "automerge" for e in events
+            )
+            variables["timelineCursor"] = page["startCursor"]
+
+        variables["withHead"] = False
+        if not (variables["withCommits"] or variables["withTimeline"]):
+            break
+
+    return snapshot
+
+
+def get_pr_snapshot(repo, pr, with_commits=True, allowed_users=None):
+    """Get a snapshot of a PR via `fetch_pr_snapshot` or None on any error.
+
+    The snapshot is also discarded if its head does not match `pr.head.sha`
+    or if its checks are incomplete.
+    """
+    try:
+        snapshot = fetch_pr_snapshot(
+            repo, pr, with_commits=with_commits, allowed_users=allowed_users
+        )
+    except Exception:
+        LOGGER.exception("could not fetch the PR snapshot - falling back to REST:")
+        return None
+
+    if snapshot["head_sha"] != pr.head.sha:
+        LOGGER.warning(
+            "PR snapshot head %s does not match the PR head %s - falling back to REST",
+            snapshot["head_sha"],
+            pr.head.sha,
+        )
+        return None
+
+    if not snapshot["checks_complete"]:
+        LOGGER.warning(
+            "PR snapshot has more check suites or runs than fit in a page - "
+            "falling back to REST"
+        )
+        return None
+
+    LOGGER.info("fetched PR snapshot in %d GraphQL queries", snapshot["queries"])
+    return snapshot
@@ -0,0 +1,312 @@
+"""A long-running server that evaluates PRs from GitHub webhook deliveries.
+
+Instead of starting a container per event, `run-automerge-action serve`
+accepts the deliveries over HTTP, checks their `X-Hub-Signature-256`
+signature and triages them like the action does. Events that need to be
+evaluated are queued and the delivery is answered right away with a
+`202 Accepted`. The queue merges the events for the same repo and head SHA
+that arrive within a debounce window (see `coalesce.CoalescingQueue`) and
+evaluates them in a pool of worker threads.
+
+All workers share one set of API sessions (with the HTTP cache and the
+memo, which is cleared at the start of each evaluation), the cache of parsed `conda-forge.yml` files and the git mirrors in
+`INPUT_GIT_MIRROR_DIR`, so that these are only built once per process. The
+other action inputs are read from the same `INPUT_*` environment variables.
+
+Tokens that expire (e.g., GitHub App installation tokens) need a way to make
+new API sessions with a fresh token. These are then made every
+`refresh_seconds` and when the API rejects the token of the current ones.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from github import BadCredentialsException
+
+from .api_sessions import get_http_adapter, get_rate_limit_governor
+from .coalesce import CoalescingQueue
+from .events import _evaluate_event, _get_event_sha, _triage_event
+
+LOGGER = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = "X-Hub-Signature-256"
+EVENT_HEADER = "X-GitHub-Event"
+DELIVERY_HEADER = "X-GitHub-Delivery"
+
+# the number of events evaluated at the same time by default
+DEFAULT_WORKERS = 4
+
+# deliveries larger than this are rejected (GitHub caps payloads at 25 MB)
+MAX_PAYLOAD_BYTES = 25 * 1024 * 1024
+
+# API sessions that can be refreshed are made again after this many seconds,
+# well before a GitHub App installation token expires (after an hour)
+SESSIONS_REFRESH_SECONDS = 30 * 60
+
+
+def sign_payload(secret, body):
+    """Compute the `X-Hub-Signature-256` header value for a payload."""
+    if isinstance(secret, str):
+        secret = secret.encode("utf-8")
+    return "sha256=" + hmac.new(secret, body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(secret, body, signature):
+    """Check the `X-Hub-Signature-256` header of a delivery.
+
+    Parameters
+    ----------
+    secret : str or bytes
+        The secret of the webhook.
+    body : bytes
+        The raw body of the delivery.
+    signature : str or None
+        The value of the `X-Hub-Signature-256` header.
+
+    Returns
+    -------
+    valid : bool
+        True if the signature matches.
+    """
+    if not signature:
+        return False
+    return hmac.compare_digest(sign_payload(secret, body), signature)
+
+
+class AutomergeServer:
+    """An HTTP server for webhook deliveries with a pool of workers.
+
+    Parameters
+    ----------
+    gh : github.MainClass.Github
+        The API sessions shared by all workers.
+    secret : str or bytes
+        The secret of the webhook used to verify the deliveries.
+    host : str, optional
+        The address to listen on.
+    port : int, optional
+        The port to listen on. Use 0 for any free port.
+    workers : int, optional
+        The number of events evaluated at the same time. Defaults to
+        `DEFAULT_WORKERS`.
+    window : float, optional
+        The debounce window in seconds for the events of a repo and head SHA.
+        Defaults to `coalesce.DEFAULT_DEBOUNCE_WINDOW`.
+    make_sessions : callable, optional
+        Makes new API sessions with a fresh token. If given, it replaces `gh`
+        when the API rejects its token (the evaluation is then run again)
+        and every `refresh_seconds`.
+    refresh_seconds : float, optional
+        The lifetime of the API sessions when `make_sessions` is given.
+        Defaults to `SESSIONS_REFRESH_SECONDS`.
+
+    Attributes
+    ----------
+    stats : collections.Counter
+        Counts of the deliveries by outcome (e.g., "accepted", "skipped",
+        "evaluated", "failed" or "bad_signature").
+    queue : coalesce.CoalescingQueue
+        The queue of the accepted events.
+    """
+
+    def __init__(
+        self,
+        gh,
+        secret,
+        host="127.0.0.1",
+        port=8080,
+        workers=None,
+        window=None,
+        make_sessions=None,
+        refresh_seconds=None,
+    ):
+        if not secret:
+            raise ValueError("a webhook secret is required")
+        self.gh = gh
+        self.secret = secret
+        self.make_sessions = make_sessions
+        self.refresh_seconds = (
+            SESSIONS_REFRESH_SECONDS if refresh_seconds is None else refresh_seconds
+        )
+        self._sessions_time = time.monotonic()
+        self._sessions_lock = threading.Lock()
+        self.stats = Counter()
+        self._stats_lock = threading.Lock()
+        self.queue = CoalescingQueue(
+            self._evaluate, window=window, workers=workers or DEFAULT_WORKERS
+        )
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return "http://%s:%d" % (host, port)
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def handle_delivery(self, event_name, body, signature, delivery=None):
+        """Verify, triage and possibly queue a delivery.
+
+        Returns
+        -------
+        status : int
+            The HTTP status for the response.
+        message : str
+            A short message for the response.
+        """
+        if not verify_signature(self.secret, body, signature):
+            self._count("bad_signature")
+            return 401, "bad signature"
+
+        event_name = (event_name or "").lower()
+        if event_name == "ping":
+            self._count("ping")
+            return 200, "pong"
+
+        try:
+            event_data = json.loads(body)
+        except ValueError:
+            self._count("bad_payload")
+            return 400, "the payload is not valid JSON"
+
+        evaluate, reason = _triage_event(event_name, event_data)
+        if not evaluate:
+            self._count("skipped")
+            return 200, "skipped since " + reason
+
+        try:
+            repo_name = event_data["repository"]["full_name"]
+        except (KeyError, TypeError):
+            self._count("bad_payload")
+            return 400, "the payload has no repository"
+
+        self._count("accepted")
+        self.queue.submit(
+            (repo_name, _get_event_sha(event_name, event_data)),
+            (event_name, event_data, repo_name, delivery),
+        )
+        return 202, "accepted"
+
+    def _get_sessions(self, rejected=None):
+        """Get the API sessions, making new ones if they are too old or if
+        the token of `rejected` was not accepted."""
+        with self._sessions_lock:
+            if self.make_sessions is not None and (
+                self.gh is rejected
+                or time.monotonic() - self._sessions_time >= self.refresh_seconds
+            ):
+                LOGGER.info("making new API sessions")
+                self.gh = self.make_sessions()
+                self._sessions_time = time.monotonic()
+                self._count("sessions_refreshed")
+            return self.gh
+
+    def _evaluate(self, item):
+        event_name, event_data, repo_name, delivery = item
+        t0 = time.monotonic()
+        try:
+            gh = self._get_sessions()
+            # the memo is for the requests of one run, like in the action
+            adapter = get_http_adapter(gh)
+            if adapter is not None:
+                adapter.memo.clear()
+            try:
+                supported = _evaluate_event(gh, event_name, event_data, repo_name)
+            except BadCredentialsException:
+                if self.make_sessions is None:
+                    raise
+                LOGGER.warning("the API token was rejected - retrying with a new one")
+                gh = self._get_sessions(rejected=gh)
+                supported = _evaluate_event(gh, event_name, event_data, repo_name)
+        except Exception:
+            self._count("failed")
+            LOGGER.exception(
+                "could not evaluate the %s event %s for %s",
+                event_name,
+                delivery,
+                repo_name,
+            )
+            return
+        self._count("evaluated" if supported else "unsupported")
+        LOGGER.info(
+            "evaluated the %s event %s for %s in %.2fs",
+            event_name,
+            delivery,
+            repo_name,
+            time.monotonic() - t0,
+        )
+
+    def serve_forever(self):
+        LOGGER.info("listening for webhook deliveries on %s", self.url)
+        self.httpd.serve_forever()
+
+    def shutdown(self):
+        """Stop accepting deliveries and finish the queued ones."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.queue.shutdown()
+        LOGGER.info("webhook delivery stats: %s", dict(self.stats))
+        LOGGER.info("event queue stats: %s", self.queue.stats())
+
+    def __enter__(self):
+        threading.Thread(
+            target=self.serve_forever, name="automerge-server", daemon=True
+        ).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+
+def _make_handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        # keep-alive, and no waiting for delayed ACKs between the headers and body
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, fmt, *args):
+            LOGGER.debug(fmt, *args)
+
+        def _reply(self, status, body, content_type="text/plain; charset=utf-8"):
+            data = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            # a health check with the stats so far
+            with server._stats_lock:
+                stats = {"deliveries": dict(server.stats)}
+            stats["queue"] = server.queue.stats()
+            governor = get_rate_limit_governor(server.gh)
+            if governor is not None:
+                stats["rate_limit"] = governor.budget()
+            self._reply(200, json.dumps(stats), "application/json")
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0) or 0)
+            if length > MAX_PAYLOAD_BYTES:
+                self.close_connection = True
+                self._reply(413, "payload too large")
+                return
+            body = self.rfile.read(length)
+            status, message = server.handle_delivery(
+                self.headers.get(EVENT_HEADER),
+                body,
+                self.headers.get(SIGNATURE_HEADER),
+                delivery=self.headers.get(DELIVERY_HEADER),
+            )
+            self._reply(status, message)
+
+    return Handler
@@ -0,0 +1,224 @@
+"""Evaluate all open bot PRs across the feedstocks of an org.
+
+Events get lost, so PRs that are ready to merge can sit there until the
+next event for them. `run-automerge-action sweep` finds the candidate PRs
+with the search API (by their `[bot-automerge]` title or `automerge` label),
+runs the pre-filter on the search results and then evaluates the rest with
+`async_automerge.automerge_prs_async`. PRs of a repo with the same head SHA
+share one evaluation of the statuses and checks and one git workspace.
+All requests are paced to the rate limit by the `RateLimitGovernor` of the
+API sessions.
+"""
+
+import asyncio
+import datetime
+import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from github.PullRequest import PullRequest
+
+from .api_sessions import get_rate_limit_governor
+from .async_automerge import automerge_prs_async
+from .automerge import _parse_links, _prefilter_pr
+
+LOGGER = logging.getLogger(__name__)
+
+# the searches for candidate PRs, which are combined
+SWEEP_QUERIES = [
+    'org:{org} is:pr is:open archived:false in:title "[bot-automerge]"',
+    "org:{org} is:pr is:open archived:false label:automerge",
+]
+
+# the search API returns at most this many results per query, so larger
+# searches are split into ranges of the PR creation time
+SEARCH_MAX_RESULTS = 1000
+
+# the PRs were all created after this
+SEARCH_START = datetime.datetime(2008, 1, 1, tzinfo=datetime.timezone.utc)
+
+# the number of PRs fetched and evaluated at the same time by default
+DEFAULT_SWEEP_CONCURRENCY = 16
+
+# a rough number of API requests to evaluate a PR
+REQUESTS_PER_PR = 10
+
+
+def _format_time(dt):
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _iter_search_items(requester, query, start=None, end=None):
+    """Yield all results of an issue search.
+
+    If the search has more than `SEARCH_MAX_RESULTS` results, it is split in
+    two halves of the creation time range (`start` to `end`, both included)
+    until each part fits.
+    """
+    q = query
+    if start is not None:
+        q += " created:%s..%s" % (_format_time(start), _format_time(end))
+    headers, data = requester.requestJsonAndCheck(
+        "GET", "/search/issues", parameters={"q": q, "per_page": 100}
+    )
+
+    if data.get("total_count", 0) > SEARCH_MAX_RESULTS:
+        if start is None:
+            start = SEARCH_START
+            end = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        if end > start:
+            mid = start + datetime.timedelta(seconds=(end - start).total_seconds() // 2)
+            yield from _iter_search_items(requester, query, start, mid)
+            yield from _iter_search_items(
+                requester, query, mid + datetime.timedelta(seconds=1), end
+            )
+            return
+        LOGGER.warning(
+            "the search %r has %d results - only the first %d are swept",
+            q,
+            data["total_count"],
+            SEARCH_MAX_RESULTS,
+        )
+
+    while True:
+        yield from data.get("items", [])
+        links = _parse_links(headers)
+        if "next" not in links:
+            break
+        headers, data = requester.requestJsonAndCheck("GET", links["next"])
+
+
+def _search_candidates(requester, org):
+    """Search for the open PRs that could be automerged.
+
+    Returns a list of `(repo full name, PR number)` in the order found, with
+    the PRs stopped by `_prefilter_pr` left out.
+    """
+    candidates = {}
+    for query in SWEEP_QUERIES:
+        for item in _iter_search_items(requester, query.format(org=org)):
+            repo_name = item["repository_url"].split("/repos/", 1)[1]
+            key = (repo_name, item["number"])
+            if key in candidates:
+                continue
+            candidates[key], _ = _prefilter_pr(
+                item["user"]["login"],
+                item["title"],
+                [label["name"] for label in item.get("labels") or []],
+            )
+
+    return [key for key, allowed in candidates.items() if allowed]
+
+
+def _get_repo_pr(gh, repo_name, number):
+    """Get a PR and its repo with a single API request.
+
+    The PR is built on the requester of `gh` (unlike `gh.get_repo(...,
+    lazy=True)`, which makes a new one) so that the requests for it go through
+    the shared HTTP adapter and rate limit governor.
+    """
+    headers, data = gh.requester.requestJsonAndCheck(
+        "GET", "/repos/%s/pulls/%d" % (repo_name, number)
+    )
+    pr = gh.create_from_raw_data(PullRequest, data, headers)
+    return pr.base.repo, pr
+
+
+def sweep(gh, org="conda-forge", max_concurrency=None):
+    """Possibly automerge all open bot PRs of an org.
+
+    Parameters
+    ----------
+    gh : github.MainClass.Github
+        The API sessions.
+    org : str, optional
+        The org to sweep.
+    max_concurrency : int, optional
+        The number of PRs fetched and evaluated at the same time. Defaults to
+        `DEFAULT_SWEEP_CONCURRENCY`.
+
+    Returns
+    -------
+    summary : dict
+        The counts of the PRs found, evaluated, merged and failed, the number
+        of repos and head SHAs, the API requests used and the time taken.
+    """
+    max_concurrency = max_concurrency or DEFAULT_SWEEP_CONCURRENCY
+    t0 = time.monotonic()
+
+    candidates = _search_candidates(gh.requester, org)
+    LOGGER.info("found %d candidate PRs in %s", len(candidates), org)
+
+    # the search has its own rate limit, so get the core one (for free)
+    start_remaining = gh.get_rate_limit().resources.core.remaining
+    if start_remaining < len(candidates) * REQUESTS_PER_PR:
+        LOGGER.warning(
+            "%d API requests left for %d PRs - the sweep will be paced to the "
+            "rate limit",
+            start_remaining,
+            len(candidates),
+        )
+    governor = get_rate_limit_governor(gh)
+    start_waited = governor.waited if governor is not None else 0.0
+
+    with ThreadPoolExecutor(
+        max_workers=max_concurrency, thread_name_prefix="automerge-sweep"
+    ) as pool:
+        futures = [
+            pool.submit(_get_repo_pr, gh, repo_name, number)
+            for repo_name, number in candidates
+        ]
+    repo_prs = []
+    outcomes = Counter()
+    for (repo_name, number), future in zip(candidates, futures):
+        try:
+            repo_prs.append(future.result())
+        except Exception:
+            LOGGER.exception("could not get PR %s on %s", number, repo_name)
+            outcomes["failed"] += 1
+
+    # the pre-filter already ran on the search results
+    results = asyncio.run(
+        automerge_prs_async(repo_prs, max_concurrency, prefiltered=True)
+    )
+    for (repo, pr), res in zip(repo_prs, results):
+        if isinstance(res, BaseException):
+            LOGGER.error(
+                "could not evaluate PR %s on %s",
+                pr.number,
+                repo.full_name,
+                exc_info=res,
+            )
+            outcomes["failed"] += 1
+        else:
+            outcomes["merged" if res[0] else "not merged"] += 1
+
+    seconds = time.monotonic() - t0
+    return {
+        "org": org,
+        "candidates": len(candidates),
+        "evaluated": len(repo_prs),
+        "merged": outcomes["merged"],
+        "not merged": outcomes["not merged"],
+        "failed": outcomes["failed"],
+        "repos": len({repo.full_name for repo, _ in repo_prs}),
+        "head SHAs": len({(repo.full_name, pr.head.sha) for repo, pr in repo_prs}),
+        "API requests": start_remaining - gh.get_rate_limit().resources.core.remaining,
+        "rate limit wait seconds": (
+            governor.waited - start_waited if governor is not None else 0.0
+        ),
+        "seconds": seconds,
+        "PRs per minute": 60 * len(repo_prs) / seconds if seconds > 0 else 0.0,
+    }
+
+
+def format_summary(summary):
+    """Format the summary from `sweep` for printing."""
+    width = max(len(key) for key in summary)
+    lines = ["sweep summary:"]
+    for key, value in summary.items():
+        if isinstance(value, float):
+            value = "%.1f" % value
+        lines.append("  %s: %s" % (key.ljust(width), value))
+    return "\n".join(lines)
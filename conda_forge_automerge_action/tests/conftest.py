@@ -0,0 +1,74 @@
+import os
+import subprocess
+
+import pytest
+
+
+def _git(*args, cwd=None):
+    return subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@test.com"] + list(args),
+        cwd=cwd,
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    ).stdout.strip()
+
+
+@pytest.fixture
+def feedstock_repo(tmp_path):
+    """a local bare feedstock repo with some history and a PR ref
+
+    The bare repo is configured like GitHub w.r.t. partial clones. The
+    fixture returns a dict with the clone URL and the SHAs of interest.
+    """
+    src = tmp_path / "src"
+    src.mkdir()
+    _git("init", "--quiet", "--initial-branch=main", str(src))
+
+    shas = []
+    for i in range(3):
+        with open(src / "conda-forge.yml", "w") as fp:
+            fp.write("bot:\n  automerge: true\n# version %d\n" % i)
+        with open(src / "big.bin", "wb") as fp:
+            fp.write(os.urandom(50_000))
+        _git("add", "-A", cwd=src)
+        _git("commit", "--quiet", "-m", "commit %d" % i, cwd=src)
+        shas.append(_git("rev-parse", "HEAD", cwd=src))
+
+    # the PR adds some CI files on a branch
+    _git("checkout", "--quiet", "-b", "pr-branch", cwd=src)
+    os.makedirs(src / ".circleci")
+    with open(src / ".circleci" / "config.yml", "w") as fp:
+        fp.write("dummy\n")
+    with open(src / "azure-pipelines.yml", "w") as fp:
+        fp.write("dummy azure\n")
+    _git("add", "-A", cwd=src)
+    _git("commit", "--quiet", "-m", "pr commit", cwd=src)
+    head_sha = _git("rev-parse", "HEAD", cwd=src)
+    _git("checkout", "--quiet", "main", cwd=src)
+
+    bare = tmp_path / "feedstock.git"
+    _git("clone", "--quiet", "--bare", str(src), str(bare))
+    _git("config", "uploadpack.allowFilter", "true", cwd=bare)
+    _git("config", "uploadpack.allowAnySHA1InWant", "true", cwd=bare)
+    _git("update-ref", "refs/pull/1/head", head_sha, cwd=bare)
+    _git("branch", "-D", "pr-branch", cwd=bare)
+
+    return {
+        "clone_url": "file://" + str(bare),
+        "base_shas": shas,
+        "head_sha": head_sha,
+    }
+
+
+@pytest.fixture
+def fake_github():
+    """a local fake of the GitHub REST API"""
+    from .fake_github import FakeGitHub
+
+    fake = FakeGitHub()
+    try:
+        yield fake
+    finally:
+        fake.close()
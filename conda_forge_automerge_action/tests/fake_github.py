@@ -0,0 +1,208 @@
+"""A small fake of the GitHub REST API for tests.
+
+Routes map a method and a path (without the query string) to a JSON body,
+a callable returning a JSON body, or a callable returning a tuple of
+`(status, headers, body)`. GET responses carry an ETag and a 304 is returned
+if the request has a matching `If-None-Match` header.
+"""
+
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+
+class FakeGitHub:
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        self.rate_limit_remaining = 5000
+        self.rate_limit_reset = 2000000000
+        self._lock = threading.Lock()
+
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _handle(self, method):
+                length = int(self.headers.get("Content-Length", 0) or 0)
+                body = self.rfile.read(length) if length else None
+                fake._respond(self, method, body)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def do_PUT(self):
+                self._handle("PUT")
+
+            def do_PATCH(self):
+                self._handle("PATCH")
+
+            def do_DELETE(self):
+                self._handle("DELETE")
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:%d" % self.server.server_address[1]
+        self._thread = threading.Thread(
+            target=self.server.serve_forever,
+            kwargs={"poll_interval": 0.05},
+            daemon=True,
+        )
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, method=None, path=None, status=None):
+        """Count the requests made, optionally filtered."""
+        with self._lock:
+            return sum(
+                1
+                for r in self.requests
+                if (method is None or r["method"] == method)
+                and (path is None or r["path"] == path)
+                and (status is None or r["status"] == status)
+            )
+
+    def _respond(self, handler, method, body):
+        parsed = urlparse(handler.path)
+        route = self.routes.get((method, parsed.path))
+        headers = {}
+        if route is None:
+            status, out = 404, {"message": "Not Found"}
+        elif callable(route):
+            out = route(
+                {
+                    "path": parsed.path,
+                    "query": parsed.query,
+                    "headers": handler.headers,
+                    "json": json.loads(body) if body else None,
+                }
+            )
+            if isinstance(out, tuple):
+                status, headers, out = out
+            else:
+                status = 200
+        else:
+            status, out = 200, route
+
+        data = json.dumps(out).encode("utf-8")
+        if method == "GET" and status == 200:
+            etag = '"%s"' % hashlib.sha1(data).hexdigest()
+            headers.setdefault("ETag", etag)
+            if handler.headers.get("If-None-Match") == etag:
+                status, data = 304, b""
+
+        with self._lock:
+            # like GitHub, 304s and /rate_limit do not count
+            if status != 304 and parsed.path != "/rate_limit":
+                self.rate_limit_remaining -= 1
+            self.requests.append(
+                {
+                    "method": method,
+                    "path": parsed.path,
+                    "query": parsed.query,
+                    "status": status,
+                    "headers": dict(handler.headers),
+                }
+            )
+            remaining = self.rate_limit_remaining
+
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json; charset=utf-8")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.send_header("X-RateLimit-Limit", "5000")
+        handler.send_header("X-RateLimit-Remaining", str(remaining))
+        handler.send_header("X-RateLimit-Reset", str(self.rate_limit_reset))
+        for k, v in headers.items():
+            handler.send_header(k, v)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+
+def repo_json(fake, full_name="conda-forge/blah-feedstock"):
+    """the JSON for a repo in the fake"""
+    return {
+        "id": 1,
+        "name": full_name.split("/")[1],
+        "full_name": full_name,
+        "url": fake.url + "/repos/" + full_name,
+        "clone_url": "https://github.com/" + full_name + ".git",
+    }
+
+
+def pr_json(
+    fake,
+    number,
+    sha,
+    full_name="conda-forge/blah-feedstock",
+    state="open",
+    user="regro-cf-autotick-bot",
+    title="[bot-automerge] blah v1.0",
+    labels=(),
+):
+    """the JSON for a PR in the fake"""
+    repo = repo_json(fake, full_name=full_name)
+    return {
+        "id": number,
+        "number": number,
+        "state": state,
+        "title": title,
+        "user": {"login": user},
+        "labels": [{"name": name} for name in labels],
+        "url": repo["url"] + "/pulls/%d" % number,
+        "issue_url": repo["url"] + "/issues/%d" % number,
+        "head": {"sha": sha, "ref": "branch-%d" % number, "repo": repo},
+        "base": {"sha": "base", "ref": "main", "repo": repo},
+    }
+
+
+def paginated_route(fake, get_items):
+    """a route for a list paginated with `page` / `per_page` and Link headers
+
+    `get_items` is called for each request to get the full list.
+    """
+
+    def _route(req):
+        items = get_items()
+        query = parse_qs(req["query"])
+        page = int(query.get("page", ["1"])[0])
+        per_page = int(query.get("per_page", ["30"])[0])
+        nlast = max((len(items) + per_page - 1) // per_page, 1)
+
+        # the other query parameters are kept in the links, like GitHub does
+        other = urlencode(
+            [
+                (k, v)
+                for k, vs in query.items()
+                if k not in ("page", "per_page")
+                for v in vs
+            ]
+        )
+
+        def _link(p, rel):
+            return '<%s%s?%sper_page=%d&page=%d>; rel="%s"' % (
+                fake.url,
+                req["path"],
+                other + "&" if other else "",
+                per_page,
+                p,
+                rel,
+            )
+
+        links = []
+        if page < nlast:
+            links += [_link(page + 1, "next"), _link(nlast, "last")]
+        if page > 1:
+            links += [_link(page - 1, "prev"), _link(1, "first")]
+        headers = {"Link": ", ".join(links)} if links else {}
+        return 200, headers, items[(page - 1) * per_page : page * per_page]
+
+    return _route
@@ -0,0 +1,317 @@
+import time
+
+import github
+import pytest
+import requests
+
+from ..api_sessions import (
+    RateLimitGovernor,
+    SqliteResponseStore,
+    create_api_sessions,
+    fresh_requests,
+    get_http_adapter,
+    get_rate_limit_governor,
+)
+from ..cache import LRUCache
+
+
+def _repo_data(fake, name="blah-feedstock"):
+    return {
+        "id": 1,
+        "name": name,
+        "full_name": "conda-forge/" + name,
+        "url": fake.url + "/repos/conda-forge/" + name,
+    }
+
+
+@pytest.mark.parametrize("store_kind", ["memory", "sqlite"])
+def test_create_api_sessions_etag_cache(fake_github, tmp_path, store_kind):
+    fake_github.routes[("GET", "/repos/conda-forge/blah-feedstock")] = _repo_data(
+        fake_github
+    )
+    if store_kind == "memory":
+        store = LRUCache()
+    else:
+        store = SqliteResponseStore(str(tmp_path / "cache.sqlite"))
+
+    gh = create_api_sessions("token", base_url=fake_github.url, http_cache=store)
+    for _ in range(3):
+        repo = gh.get_repo("conda-forge/blah-feedstock")
+        assert repo.full_name == "conda-forge/blah-feedstock"
+
+    path = "/repos/conda-forge/blah-feedstock"
+    assert fake_github.count("GET", path, status=200) == 1
+    assert fake_github.count("GET", path, status=304) == 2
+    # the rate limit is only charged once
+    assert gh.rate_limiting[0] == 4999
+
+    # a new session with the same persistent store starts warm
+    if store_kind == "sqlite":
+        store = SqliteResponseStore(str(tmp_path / "cache.sqlite"))
+        gh = create_api_sessions("token", base_url=fake_github.url, http_cache=store)
+        assert gh.get_repo("conda-forge/blah-feedstock").name == "blah-feedstock"
+        assert fake_github.count("GET", path, status=304) == 3
+
+
+def test_etag_cache_refreshes_on_change(fake_github):
+    path = "/repos/conda-forge/blah-feedstock"
+    fake_github.routes[("GET", path)] = _repo_data(fake_github)
+    gh = create_api_sessions("token", base_url=fake_github.url, http_cache=LRUCache())
+    assert gh.get_repo("conda-forge/blah-feedstock").name == "blah-feedstock"
+
+    fake_github.routes[("GET", path)] = _repo_data(fake_github, name="other")
+    assert gh.get_repo("conda-forge/blah-feedstock").name == "other"
+    assert gh.get_repo("conda-forge/blah-feedstock").name == "other"
+    assert fake_github.count("GET", path, status=200) == 2
+    assert fake_github.count("GET", path, status=304) == 1
+
+
+def test_etag_cache_keyed_by_token(fake_github):
+    path = "/repos/conda-forge/blah-feedstock"
+    fake_github.routes[("GET", path)] = _repo_data(fake_github)
+    store = LRUCache()
+    create_api_sessions("t1", base_url=fake_github.url, http_cache=store).get_repo(
+        "conda-forge/blah-feedstock"
+    )
+    create_api_sessions("t2", base_url=fake_github.url, http_cache=store).get_repo(
+        "conda-forge/blah-feedstock"
+    )
+    assert fake_github.count("GET", path, status=200) == 2
+    assert "If-None-Match" not in fake_github.requests[-1]["headers"]
+
+
+def test_sqlite_store_eviction(tmp_path):
+    store = SqliteResponseStore(str(tmp_path / "cache.sqlite"), max_entries=2)
+    for i in range(3):
+        store.set(str(i), {"i": i})
+    assert len(store) == 2
+    assert store.get("0") is None
+    assert store.get("2") == {"i": 2}
+
+
+def test_memo_dedupes_gets(fake_github):
+    path = "/repos/conda-forge/blah-feedstock"
+    fake_github.routes[("GET", path)] = _repo_data(fake_github)
+    gh = create_api_sessions(
+        "token", base_url=fake_github.url, http_cache=LRUCache(), memo_seconds=0.5
+    )
+    for _ in range(3):
+        assert gh.get_repo("conda-forge/blah-feedstock").name == "blah-feedstock"
+    assert fake_github.count("GET", path) == 1
+    assert get_http_adapter(gh).memo_hits == 2
+
+    # fresh data is always requested
+    with fresh_requests():
+        gh.get_repo("conda-forge/blah-feedstock")
+    assert fake_github.count("GET", path) == 2
+
+    # as is stale data
+    time.sleep(0.6)
+    gh.get_repo("conda-forge/blah-feedstock")
+    assert fake_github.count("GET", path) == 3
+    assert get_http_adapter(gh).memo_hits == 2
+
+
+def test_memo_cleared_by_writes(fake_github):
+    path = "/repos/conda-forge/blah-feedstock"
+    fake_github.routes[("GET", path)] = _repo_data(fake_github)
+    fake_github.routes[("PATCH", path)] = _repo_data(fake_github)
+    gh = create_api_sessions(
+        "token", base_url=fake_github.url, http_cache=LRUCache(), memo_seconds=60
+    )
+    repo = gh.get_repo("conda-forge/blah-feedstock")
+    repo.edit(description="blah")
+    gh.get_repo("conda-forge/blah-feedstock")
+    assert fake_github.count("GET", path) == 2
+    assert get_http_adapter(gh).memo_hits == 0
+
+
+def test_memo_kept_by_graphql_queries(fake_github):
+    path = "/repos/conda-forge/blah-feedstock"
+    fake_github.routes[("GET", path)] = _repo_data(fake_github)
+    fake_github.routes[("POST", "/graphql")] = {"data": {"viewer": {"login": "x"}}}
+    gh = create_api_sessions(
+        "token", base_url=fake_github.url, http_cache=LRUCache(), memo_seconds=60
+    )
+    gh.get_repo("conda-forge/blah-feedstock")
+    gh.requester.graphql_query("query { viewer { login } }", {})
+    gh.get_repo("conda-forge/blah-feedstock")
+    assert fake_github.count("GET", path) == 1
+    assert get_http_adapter(gh).memo_hits == 1
+
+    # mutations clear the memo
+    gh.requester.graphql_query("mutation { blah }", {})
+    gh.get_repo("conda-forge/blah-feedstock")
+    assert fake_github.count("GET", path) == 2
+
+
+def test_memo_off_by_default(fake_github, monkeypatch):
+    monkeypatch.delenv("INPUT_API_MEMO_SECONDS", raising=False)
+    path = "/repos/conda-forge/blah-feedstock"
+    fake_github.routes[("GET", path)] = _repo_data(fake_github)
+    gh = create_api_sessions("token", base_url=fake_github.url, http_cache=LRUCache())
+    gh.get_repo("conda-forge/blah-feedstock")
+    gh.get_repo("conda-forge/blah-feedstock")
+    assert fake_github.count("GET", path) == 2
+
+    monkeypatch.setenv("INPUT_API_MEMO_SECONDS", "30")
+    gh = create_api_sessions("token", base_url=fake_github.url, http_cache=LRUCache())
+    assert get_http_adapter(gh).memo_seconds == 30
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def _response(status=200, url="https://api.github.com/repos/a/b", content=b"", **hdrs):
+    response = requests.Response()
+    response.status_code = status
+    response.url = url
+    response.headers = requests.structures.CaseInsensitiveDict(hdrs)
+    response._content = content
+    return response
+
+
+def _limits(remaining, limit=5000, reset=4600, resource="core"):
+    return {
+        "X-RateLimit-Limit": str(limit),
+        "X-RateLimit-Remaining": str(remaining),
+        "X-RateLimit-Reset": str(reset),
+        "X-RateLimit-Resource": resource,
+    }
+
+
+def test_rate_limit_governor_pacing():
+    clock = _Clock()
+    gov = RateLimitGovernor(clock=clock, sleep=clock.sleep, max_wait=7200)
+    url = "https://api.github.com/repos/a/b"
+    assert gov.budget("core") is None
+    assert gov.delay(url) == 0
+
+    # plenty left
+    assert not gov.update(_response(**_limits(4000)))
+    assert gov.budget("core") == {"limit": 5000, "remaining": 4000, "reset": 4600}
+    assert gov.delay(url) == 0
+
+    # the rest is spread over the time to the reset
+    gov.update(_response(**_limits(900)))
+    assert gov.delay(url) == pytest.approx(3600 / 900)
+
+    # the reserve is kept until the reset
+    gov.update(_response(**_limits(50)))
+    assert gov.delay(url) == 3601
+    gov.wait(url)
+    assert clock.slept == [3601]
+    assert gov.waits == 1
+    assert gov.delay(url) == 0
+
+    # the budgets are per resource
+    gov.update(_response(**_limits(50, reset=clock.now + 60)))
+    search_url = "https://api.github.com/search/issues?q=blah"
+    assert gov.delay(search_url) == 0
+    gov.update(
+        _response(
+            url=search_url, **_limits(0, limit=30, reset=clock.now + 30, resource="")
+        )
+    )
+    assert gov.delay(search_url) == 31
+    assert gov.delay(url) == 61
+    assert set(gov.budget()) == {"core", "search"}
+
+
+def test_rate_limit_governor_max_wait():
+    clock = _Clock()
+    gov = RateLimitGovernor(clock=clock, sleep=clock.sleep, max_wait=10)
+    gov.update(_response(**_limits(1)))
+    assert gov.delay("https://api.github.com/repos/a/b") == 10
+
+
+@pytest.mark.parametrize(
+    "status,headers,content,pause",
+    [
+        (429, {"Retry-After": "30"}, b"", 30),
+        (403, {"Retry-After": "5"}, b"", 5),
+        (403, _limits(0, reset=1200), b"", 201),
+        (403, {}, b"You have exceeded a secondary rate limit.", 60),
+        (403, {}, b"Resource not accessible by integration", None),
+        (404, {"Retry-After": "30"}, b"", None),
+    ],
+)
+def test_rate_limit_governor_rejections(status, headers, content, pause):
+    clock = _Clock()
+    gov = RateLimitGovernor(clock=clock, sleep=clock.sleep)
+    rejected = gov.update(_response(status=status, content=content, **headers))
+    assert rejected is (pause is not None)
+    assert gov.rejections == (1 if rejected else 0)
+    assert gov.delay("https://api.github.com/repos/a/b") == (pause or 0)
+
+
+def test_rate_limit_governor_retries(fake_github):
+    path = "/repos/conda-forge/blah-feedstock"
+    calls = []
+
+    def _route(req):
+        calls.append(1)
+        if len(calls) == 1:
+            return 403, {"Retry-After": "2"}, {"message": "secondary rate limit"}
+        return _repo_data(fake_github)
+
+    fake_github.routes[("GET", path)] = _route
+    slept = []
+    gov = RateLimitGovernor(sleep=slept.append)
+    gh = create_api_sessions(
+        "token", base_url=fake_github.url, http_cache=LRUCache(), governor=gov
+    )
+    assert get_rate_limit_governor(gh) is gov
+
+    assert gh.get_repo("conda-forge/blah-feedstock").name == "blah-feedstock"
+    assert fake_github.count("GET", path) == 2
+    assert gov.rejections == 1
+    assert len(slept) == 1 and 1 < slept[0] <= 2
+    assert gov.budget("core")["remaining"] == fake_github.rate_limit_remaining
+
+
+def test_rate_limit_governor_gives_up(fake_github):
+    path = "/repos/conda-forge/blah-feedstock"
+    fake_github.routes[("GET", path)] = lambda req: (
+        429,
+        {"Retry-After": "1"},
+        {"message": "slow down"},
+    )
+    slept = []
+    gh = create_api_sessions(
+        "token",
+        base_url=fake_github.url,
+        http_cache=LRUCache(),
+        governor=RateLimitGovernor(sleep=slept.append),
+    )
+
+    with pytest.raises(github.GithubException):
+        gh.get_repo("conda-forge/blah-feedstock")
+    # the first try and two more
+    assert fake_github.count("GET", path) == 3
+    assert len(slept) == 2
+
+
+def test_create_api_sessions_not_throttled(fake_github):
+    path = "/repos/conda-forge/blah-feedstock"
+    fake_github.routes[("GET", path)] = _repo_data(fake_github)
+    gh = create_api_sessions(
+        "token", base_url=fake_github.url, http_cache=LRUCache(), memo_seconds=0
+    )
+
+    # PyGithub would wait 0.25s between these
+    t0 = time.monotonic()
+    for _ in range(8):
+        gh.get_repo("conda-forge/blah-feedstock")
+    assert time.monotonic() - t0 < 1
+    assert fake_github.count("GET", path) == 8
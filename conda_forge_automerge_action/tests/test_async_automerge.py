@@ -0,0 +1,159 @@
+import asyncio
+import subprocess
+import unittest.mock
+
+import pytest
+
+from ..api_sessions import create_api_sessions
+from ..async_automerge import automerge_prs, automerge_prs_async
+from ..cache import LRUCache
+from ..git_utils import GitTransport, RepoWorkspace, _run_git_command_async
+from .fake_github import pr_json, repo_json
+
+
+def _fake_feedstock(fake_github, full_name, feedstock_repo, numbers=(1,)):
+    path = "/repos/" + full_name
+    sha = feedstock_repo["head_sha"]
+
+    repo = repo_json(fake_github, full_name=full_name)
+    repo["clone_url"] = feedstock_repo["clone_url"]
+    fake_github.routes[("GET", path)] = repo
+
+    for number in numbers:
+        pr = pr_json(fake_github, number, sha, full_name=full_name)
+        pr["base"]["repo"] = repo
+        pr["head"]["repo"] = repo
+        pr["mergeable"] = True
+        pr["mergeable_state"] = "clean"
+        fake_github.routes[("GET", path + "/pulls/%d" % number)] = pr
+        fake_github.routes[("GET", path + "/issues/%d/labels" % number)] = []
+        fake_github.routes[("GET", path + "/pulls/%d/commits" % number)] = [
+            {"sha": sha, "author": {"login": "regro-cf-autotick-bot"}}
+        ]
+        fake_github.routes[("PUT", path + "/pulls/%d/merge" % number)] = {
+            "merged": True,
+            "message": "merged",
+            "sha": sha,
+        }
+    fake_github.routes[("GET", path + "/commits/%s/status" % sha)] = {
+        "total_count": 2,
+        "statuses": [
+            {"context": "conda-forge-linter", "state": "success"},
+            {"context": "ci/circleci: build", "state": "success"},
+        ],
+    }
+    fake_github.routes[("GET", path + "/commits/%s/check-suites" % sha)] = {
+        "total_count": 1,
+        "check_suites": [
+            {
+                "id": 1,
+                "status": "completed",
+                "conclusion": "success",
+                "app": {"slug": "azure-pipelines"},
+            }
+        ],
+    }
+
+
+@unittest.mock.patch("conda_forge_automerge_action.automerge._upsert_pr_comment")
+def test_automerge_prs_async(comment_mock, fake_github, feedstock_repo, monkeypatch):
+    monkeypatch.setenv("INPUT_GIT_TRANSPORT", "partial")
+    names = ["conda-forge/a-feedstock", "conda-forge/b-feedstock"]
+    for name in names:
+        _fake_feedstock(fake_github, name, feedstock_repo)
+
+    gh = create_api_sessions(
+        "token", base_url=fake_github.url, http_cache=LRUCache(), pool_maxsize=8
+    )
+    repo_prs = []
+    for name in names:
+        repo = gh.get_repo(name)
+        repo_prs.append((repo, repo.get_pull(1)))
+
+    results = automerge_prs(repo_prs, max_concurrency=2)
+
+    assert results == [(True, "all is well :)")] * 2
+    for name in names:
+        assert fake_github.count("PUT", "/repos/%s/pulls/1/merge" % name) == 1
+    assert comment_mock.call_count == 2
+
+
+@unittest.mock.patch("conda_forge_automerge_action.automerge._upsert_pr_comment")
+def test_automerge_prs_async_same_sha(
+    comment_mock, fake_github, feedstock_repo, monkeypatch
+):
+    monkeypatch.setenv("INPUT_GIT_TRANSPORT", "partial")
+    name = "conda-forge/a-feedstock"
+    _fake_feedstock(fake_github, name, feedstock_repo, numbers=(1, 2, 3))
+
+    gh = create_api_sessions(
+        "token", base_url=fake_github.url, http_cache=LRUCache(), pool_maxsize=8
+    )
+    repo = gh.get_repo(name)
+    repo_prs = [(repo, repo.get_pull(i)) for i in (1, 2, 3)]
+
+    with unittest.mock.patch(
+        "conda_forge_automerge_action.git_utils.GitTransport.aclone",
+        side_effect=GitTransport.aclone,
+        autospec=True,
+    ) as clone_mock:
+        results = automerge_prs(repo_prs, max_concurrency=3)
+
+    assert results == [(True, "all is well :)")] * 3
+    # one clone, one set of status and check calls
+    assert clone_mock.call_count == 1
+    sha = feedstock_repo["head_sha"]
+    path = "/repos/%s/commits/%s" % (name, sha)
+    assert fake_github.count("GET", path + "/status") == 1
+    assert fake_github.count("GET", path + "/check-suites") == 1
+    # while the per-PR gates ran for each PR
+    for i in (1, 2, 3):
+        assert fake_github.count("GET", "/repos/%s/pulls/%d/commits" % (name, i)) == 1
+        assert fake_github.count("PUT", "/repos/%s/pulls/%d/merge" % (name, i)) == 1
+
+
+def test_automerge_prs_async_errors():
+    repo = unittest.mock.MagicMock()
+    pr = unittest.mock.MagicMock()
+    bad = unittest.mock.MagicMock()
+
+    with unittest.mock.patch(
+        "conda_forge_automerge_action.async_automerge.automerge_pr_async"
+    ) as am_mock:
+
+        async def _am(repo, pr, **kwargs):
+            if pr is bad:
+                raise ValueError("blah")
+            return True, "ok"
+
+        am_mock.side_effect = _am
+        results = asyncio.run(automerge_prs_async([(repo, pr), (repo, bad)]))
+        assert results[0] == (True, "ok")
+        assert isinstance(results[1], ValueError)
+
+        with pytest.raises(ValueError):
+            automerge_prs([(repo, pr), (repo, bad)])
+
+
+def test_run_git_command_async(tmp_path):
+    out = asyncio.run(_run_git_command_async("init", "--quiet", str(tmp_path)))
+    assert out == ""
+    with pytest.raises(subprocess.CalledProcessError):
+        asyncio.run(_run_git_command_async("-C", str(tmp_path), "rev-parse", "HEAD"))
+
+
+def test_workspace_aprepare(feedstock_repo):
+    pr = unittest.mock.MagicMock()
+    pr.number = 1
+    pr.base.repo.clone_url = feedstock_repo["clone_url"]
+    pr.base.ref = "main"
+    pr.head.sha = feedstock_repo["head_sha"]
+
+    with RepoWorkspace(pr) as ws:
+        asyncio.run(ws.aprepare())
+        nops = len(ws.transport.stats)
+        assert ws.base_sha == feedstock_repo["base_shas"][-1]
+        assert ws.head_sha == feedstock_repo["head_sha"]
+        # nothing else was cloned or fetched
+        assert len(ws.transport.stats) == nops
+        assert "azure-pipelines.yml" in ws.list_paths(ws.head_sha)
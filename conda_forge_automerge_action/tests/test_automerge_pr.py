@@ -3,9 +3,13 @@ from unittest.mock import MagicMock
 
 import pytest
 
-from ..automerge import automerge_pr
+from ..automerge import PREFILTER_STATS, _prefilter_pr, automerge_pr
 
 
+@unittest.mock.patch(
+    "conda_forge_automerge_action.automerge.get_pr_snapshot",
+    new=MagicMock(return_value=None),
+)
 @unittest.mock.patch("conda_forge_automerge_action.automerge._get_conda_forge_config")
 def test_automerge_pr_bad_user(get_cfg_mock):
     get_cfg_mock.return_value = {}
@@ -19,9 +23,14 @@ def test_automerge_pr_bad_user(get_cfg_mock):
 
     assert not did_merge
     assert "user blah" in reason
-    get_cfg_mock.assert_called_once_with(pr)
+    # rejected from the PR data w/o reading the config
+    get_cfg_mock.assert_not_called()
 
 
+@unittest.mock.patch(
+    "conda_forge_automerge_action.automerge.get_pr_snapshot",
+    new=MagicMock(return_value=None),
+)
 @unittest.mock.patch("conda_forge_automerge_action.automerge._get_conda_forge_config")
 def test_automerge_pr_no_title_slug(get_cfg_mock):
     get_cfg_mock.return_value = {}
@@ -36,7 +45,8 @@ def test_automerge_pr_no_title_slug(get_cfg_mock):
 
     assert not did_merge
     assert "slug in the title" in reason
-    get_cfg_mock.assert_called_once_with(pr)
+    # rejected from the PR data w/o reading the config
+    get_cfg_mock.assert_not_called()
 
 
 @pytest.mark.parametrize(
@@ -47,6 +57,10 @@ def test_automerge_pr_no_title_slug(get_cfg_mock):
         {"bot": {"automerge": False}},
     ],
 )
+@unittest.mock.patch(
+    "conda_forge_automerge_action.automerge.get_pr_snapshot",
+    new=MagicMock(return_value=None),
+)
 @unittest.mock.patch("conda_forge_automerge_action.automerge._get_conda_forge_config")
 def test_automerge_pr_feedstock_off(get_cfg_mock, cfg):
     get_cfg_mock.return_value = cfg
@@ -61,10 +75,15 @@ def test_automerge_pr_feedstock_off(get_cfg_mock, cfg):
 
     assert not did_merge
     assert "off for this feedstock" in reason
-    get_cfg_mock.assert_called_once_with(pr)
+    get_cfg_mock.assert_called_once_with(pr, workspace=unittest.mock.ANY)
 
 
 @pytest.mark.parametrize("fail", ["check", "status"])
+@unittest.mock.patch("conda_forge_automerge_action.automerge._upsert_pr_comment")
+@unittest.mock.patch(
+    "conda_forge_automerge_action.automerge.get_pr_snapshot",
+    new=MagicMock(return_value=None),
+)
 @unittest.mock.patch("conda_forge_automerge_action.automerge._get_conda_forge_config")
 @unittest.mock.patch(
     "conda_forge_automerge_action.automerge._get_required_checks_and_statuses"
@@ -72,7 +91,7 @@ def test_automerge_pr_feedstock_off(get_cfg_mock, cfg):
 @unittest.mock.patch("conda_forge_automerge_action.automerge._get_github_checks")
 @unittest.mock.patch("conda_forge_automerge_action.automerge._get_github_statuses")
 def test_automerge_pr_feedstock_status_or_check_fail(
-    stat_mock, check_mock, req_mock, get_cfg_mock, fail
+    stat_mock, check_mock, req_mock, get_cfg_mock, comment_mock, fail
 ):
     check_mock.return_value = {"check1": True, "check2": True, "check3": False}
     stat_mock.return_value = {"status1": True, "status2": True, "status3": True}
@@ -95,12 +114,20 @@ def test_automerge_pr_feedstock_status_or_check_fail(
 
     assert not did_merge
     assert "pending statuses" in reason
-    get_cfg_mock.assert_called_once_with(pr)
-    check_mock.assert_called_once_with(repo, pr)
-    stat_mock.assert_called_once_with(repo, pr)
-    req_mock.assert_called_once_with(pr, get_cfg_mock.return_value)
+    get_cfg_mock.assert_called_once_with(pr, workspace=unittest.mock.ANY)
+    check_mock.assert_called_once_with(repo, pr, snapshot=None)
+    stat_mock.assert_called_once_with(repo, pr, snapshot=None)
+    req_mock.assert_called_once_with(
+        pr, get_cfg_mock.return_value, workspace=unittest.mock.ANY
+    )
+    comment_mock.assert_called_once()
+    assert comment_mock.call_args.args[2] == "statuses"
 
 
+@unittest.mock.patch(
+    "conda_forge_automerge_action.automerge.get_pr_snapshot",
+    new=MagicMock(return_value=None),
+)
 @unittest.mock.patch("conda_forge_automerge_action.automerge._get_conda_forge_config")
 @unittest.mock.patch(
     "conda_forge_automerge_action.automerge._get_required_checks_and_statuses"
@@ -126,7 +153,69 @@ def test_automerge_pr_feedstock_no_statuses_or_checks(
 
     assert not did_merge
     assert "At least one status or check must be required" in reason
-    get_cfg_mock.assert_called_once_with(pr)
-    check_mock.assert_called_once_with(repo, pr)
-    stat_mock.assert_called_once_with(repo, pr)
-    req_mock.assert_called_once_with(pr, get_cfg_mock.return_value)
+    get_cfg_mock.assert_called_once_with(pr, workspace=unittest.mock.ANY)
+    check_mock.assert_called_once_with(repo, pr, snapshot=None)
+    stat_mock.assert_called_once_with(repo, pr, snapshot=None)
+    req_mock.assert_called_once_with(
+        pr, get_cfg_mock.return_value, workspace=unittest.mock.ANY
+    )
+
+
+@pytest.mark.parametrize(
+    "login,title,labels,allowed,gate",
+    [
+        ("blah", "[bot-automerge] blah", [], False, "stopped:user"),
+        ("regro-cf-autotick-bot", "blah", [], False, "stopped:title"),
+        ("regro-cf-autotick-bot", "[bot-automerge] blah", [], True, "passed:title"),
+        ("blah", "blah", ["automerge"], True, "passed:label"),
+    ],
+)
+def test_prefilter_pr(login, title, labels, allowed, gate):
+    PREFILTER_STATS.clear()
+    assert _prefilter_pr(login, title, labels)[0] is allowed
+    assert PREFILTER_STATS == {gate: 1}
+
+
+@pytest.mark.parametrize("mergeable", [None, False])
+@unittest.mock.patch("conda_forge_automerge_action.automerge._upsert_pr_comment")
+@unittest.mock.patch(
+    "conda_forge_automerge_action.automerge.get_pr_snapshot",
+    new=MagicMock(return_value=None),
+)
+@unittest.mock.patch("conda_forge_automerge_action.automerge._get_conda_forge_config")
+@unittest.mock.patch(
+    "conda_forge_automerge_action.automerge._get_required_checks_and_statuses"
+)
+@unittest.mock.patch("conda_forge_automerge_action.automerge._get_github_checks")
+@unittest.mock.patch("conda_forge_automerge_action.automerge._get_github_statuses")
+def test_automerge_pr_not_mergeable(
+    stat_mock, check_mock, req_mock, get_cfg_mock, comment_mock, mergeable
+):
+    check_mock.return_value = {"check1": True}
+    stat_mock.return_value = {"status1": True}
+    req_mock.return_value = ["check1", "status1"]
+    get_cfg_mock.return_value = {"bot": {"automerge": True}}
+
+    repo = MagicMock()
+    repo.full_name = "go"
+    repo.get_pull.return_value.mergeable = mergeable
+    repo.get_pull.return_value.merged = False
+    repo.get_pull.return_value.is_merged.return_value = False
+
+    pr = MagicMock()
+    pr.user.login = "regro-cf-autotick-bot"
+    pr.title = "[bot-automerge] blah"
+
+    with unittest.mock.patch(
+        "conda_forge_automerge_action.automerge.MERGEABLE_DEADLINE", 0.05
+    ):
+        did_merge, reason = automerge_pr(repo, pr)
+
+    assert not did_merge
+    assert "mergeable|mergeable_state = %s" % mergeable in reason
+    repo.get_pull.return_value.merge.assert_not_called()
+    # we only comment if we know it is not mergeable
+    if mergeable is None:
+        comment_mock.assert_not_called()
+    else:
+        comment_mock.assert_called_once()
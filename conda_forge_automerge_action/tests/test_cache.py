@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+
+import pytest
+
+from ..cache import DiskCache, LRUCache, OnceCache, TieredCache
+
+
+def test_lru_cache():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    # b is now the least recently used
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+    assert cache.hits == 2
+    assert cache.misses == 1
+    assert cache.evictions == 1
+
+
+def test_disk_cache(tmp_path):
+    cache = DiskCache(str(tmp_path), max_entries=2)
+    cache.set("a", {"x": 1})
+    os.utime(cache._fname("a"), (1, 1))
+    cache.set("b", {"x": 2})
+    cache.set("c", {"x": 3})
+    assert cache.get("a") is None
+    assert cache.get("b") == {"x": 2}
+    assert cache.get("c") == {"x": 3}
+    assert cache.hits == 2
+    assert cache.misses == 1
+    assert cache.evictions == 1
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_tiered_cache(tmp_path):
+    cache = TieredCache(maxsize=1, disk_path=str(tmp_path))
+    cache.set("a", {"x": 1})
+    cache.set("b", {"x": 2})
+    assert "a" not in cache.memory
+
+    # comes from disk and is promoted
+    assert cache.get("a") == {"x": 1}
+    assert "a" in cache.memory
+    assert cache.get("a") == {"x": 1}
+    assert cache.get("c") is None
+
+    stats = cache.stats()
+    assert stats["memory_hits"] == 1
+    assert stats["disk_hits"] == 1
+    assert stats["misses"] == 1
+
+    # a new cache with the same directory sees the entries
+    cache = TieredCache(maxsize=1, disk_path=str(tmp_path))
+    assert cache.get("b") == {"x": 2}
+
+
+def test_once_cache():
+    cache = OnceCache()
+    calls = []
+
+    def _slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return "value"
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(cache.get_or_compute("a", _slow))
+        )
+        for _ in range(4)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == ["value"] * 4
+    assert len(calls) == 1
+    assert cache.misses == 1
+    assert cache.hits == 3
+
+
+def test_once_cache_retries_errors():
+    cache = OnceCache()
+
+    def _fail():
+        raise ValueError("blah")
+
+    with pytest.raises(ValueError):
+        cache.get_or_compute("a", _fail)
+    assert cache.get_or_compute("a", lambda: 1) == 1
@@ -2,7 +2,8 @@ import os
 
 import pytest
 
-from ..automerge import _circle_is_active, pushd
+from ..automerge import _circle_is_active
+from ..git_utils import pushd
 
 
 @pytest.mark.parametrize(
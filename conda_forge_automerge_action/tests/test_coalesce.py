@@ -0,0 +1,120 @@
+import threading
+import time
+
+import pytest
+
+from ..coalesce import CoalescingQueue
+
+
+def _wait_for(pred, timeout=5):
+    t0 = time.monotonic()
+    while not pred():
+        assert time.monotonic() - t0 < timeout
+        time.sleep(0.005)
+
+
+def test_coalescing_queue_debounce():
+    runs = []
+    queue = CoalescingQueue(runs.append, window=0.2, workers=2)
+    for i in range(5):
+        queue.submit(("a", "sha"), i)
+    queue.submit(("b", "sha"), 10)
+    assert queue.depth == 2
+    assert runs == []
+
+    _wait_for(lambda: len(runs) == 2)
+    assert sorted(runs) == [4, 10]
+    assert queue.depth == 0
+    assert queue.coalesce_ratio == 4 / 6
+    queue.shutdown()
+    assert queue.stats() == {
+        "submitted": 6,
+        "coalesced": 4,
+        "runs": 2,
+        "depth": 0,
+        "running": 0,
+        "coalesce_ratio": 4 / 6,
+    }
+
+
+def test_coalescing_queue_followup():
+    runs = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def _func(item):
+        runs.append(item)
+        started.set()
+        assert release.wait(timeout=5)
+
+    queue = CoalescingQueue(_func, window=0, workers=2)
+    queue.submit("key", 0)
+    assert started.wait(timeout=5)
+
+    # the events while running are merged into one follow-up
+    for i in range(1, 4):
+        queue.submit("key", i)
+    assert queue.depth == 1
+    assert queue.stats()["running"] == 1
+    release.set()
+
+    queue.shutdown()
+    assert runs == [0, 3]
+    assert queue.runs == 2
+    assert queue.coalesced == 2
+
+
+def test_coalescing_queue_one_run_per_key():
+    active = set()
+    overlaps = []
+    lock = threading.Lock()
+
+    def _func(item):
+        key, _ = item
+        with lock:
+            if key in active:
+                overlaps.append(key)
+            active.add(key)
+        time.sleep(0.01)
+        with lock:
+            active.discard(key)
+
+    queue = CoalescingQueue(_func, window=0, workers=8)
+    for i in range(200):
+        key = i % 4
+        queue.submit(key, (key, i))
+        time.sleep(0.0005)
+    queue.shutdown()
+
+    assert overlaps == []
+    assert queue.runs + queue.coalesced == 200
+
+
+def test_coalescing_queue_shutdown_flushes():
+    runs = []
+    queue = CoalescingQueue(runs.append, window=60)
+    queue.submit("key", 1)
+
+    t0 = time.monotonic()
+    queue.shutdown()
+    assert time.monotonic() - t0 < 5
+    assert runs == [1]
+
+    with pytest.raises(RuntimeError):
+        queue.submit("key", 2)
+
+
+def test_coalescing_queue_errors():
+    runs = []
+
+    def _func(item):
+        if item == "bad":
+            raise ValueError("blah")
+        runs.append(item)
+
+    queue = CoalescingQueue(_func, window=0)
+    queue.submit("a", "bad")
+    _wait_for(lambda: queue.runs == 1 and queue.stats()["running"] == 0)
+    queue.submit("a", "good")
+    queue.shutdown()
+    assert runs == ["good"]
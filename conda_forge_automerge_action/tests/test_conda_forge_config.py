@@ -0,0 +1,95 @@
+import subprocess
+import unittest.mock
+
+from ..automerge import _get_automerge_settings, _get_conda_forge_config
+from ..cache import TieredCache
+from ..git_utils import RepoWorkspace, _fetch_file_at_ref
+
+
+def test_fetch_file_at_ref_no_history(tmp_path, feedstock_repo):
+    workdir = str(tmp_path / "work")
+    txt = _fetch_file_at_ref(
+        feedstock_repo["clone_url"], "main", "conda-forge.yml", workdir
+    )
+    assert "# version 2" in txt
+
+    # only the tip commit is present
+    commits = subprocess.run(
+        ["git", "-C", workdir, "rev-list", "--all"],
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True,
+    ).stdout.split()
+    assert commits == [feedstock_repo["base_shas"][-1]]
+
+    # and the other blobs were never transferred
+    objs = subprocess.run(
+        ["git", "-C", workdir, "rev-list", "--objects", "--all", "--missing=print"],
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True,
+    ).stdout.splitlines()
+    missing = [o for o in objs if o.startswith("?")]
+    assert len(missing) == 1
+
+
+def test_get_conda_forge_config(feedstock_repo):
+    pr = unittest.mock.MagicMock()
+    pr.base.repo.clone_url = feedstock_repo["clone_url"]
+    pr.base.ref = "main"
+    cfg = _get_conda_forge_config(pr)
+    assert cfg["bot"]["automerge"] is True
+
+
+@unittest.mock.patch("conda_forge_automerge_action.automerge._fetch_file_at_ref")
+def test_get_conda_forge_config_fallback(fetch_mock, feedstock_repo):
+    fetch_mock.side_effect = subprocess.CalledProcessError(1, "git")
+    pr = unittest.mock.MagicMock()
+    pr.base.repo.clone_url = feedstock_repo["clone_url"]
+    pr.base.ref = "main"
+    cfg = _get_conda_forge_config(pr)
+    assert cfg["bot"]["automerge"] is True
+    fetch_mock.assert_called_once()
+
+
+@unittest.mock.patch("conda_forge_automerge_action.automerge.CONFIG_CACHE")
+def test_get_conda_forge_config_cached(cache_mock, feedstock_repo):
+    cache = TieredCache()
+    cache_mock.get.side_effect = cache.get
+    cache_mock.set.side_effect = cache.set
+
+    pr = unittest.mock.MagicMock()
+    pr.number = 1
+    pr.base.repo.clone_url = feedstock_repo["clone_url"]
+    pr.base.ref = "main"
+    with RepoWorkspace(pr) as ws:
+        cfg = _get_conda_forge_config(pr, workspace=ws)
+    assert cfg == {"bot": {"automerge": True}}
+    assert cache.stats()["misses"] == 1
+
+    with RepoWorkspace(pr) as ws:
+        with unittest.mock.patch.object(ws, "read_file") as read_mock:
+            cfg = _get_conda_forge_config(pr, workspace=ws)
+        read_mock.assert_not_called()
+    assert cfg == {"bot": {"automerge": True}}
+    assert cache.stats()["memory_hits"] == 1
+
+
+def test_get_automerge_settings():
+    assert _get_automerge_settings(None) == {}
+    assert _get_automerge_settings({"bot": None}) == {}
+    assert _get_automerge_settings(
+        {
+            "bot": {
+                "automerge": True,
+                "automerge_options": {"ignored_statuses": ["linter"]},
+                "other": 1,
+            },
+            "provider": {"linux": "azure"},
+        }
+    ) == {
+        "bot": {
+            "automerge": True,
+            "automerge_options": {"ignored_statuses": ["linter"]},
+        }
+    }
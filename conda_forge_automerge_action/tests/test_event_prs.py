@@ -0,0 +1,127 @@
+import json
+import os
+import unittest.mock
+
+import pytest
+
+from ..api_sessions import create_api_sessions
+from ..automerge import PREFILTER_STATS
+from ..cache import LRUCache
+from ..events import _evaluate_event, _get_prs_for_sha
+from .fake_github import pr_json, repo_json
+
+REPO = "/repos/conda-forge/blah-feedstock"
+
+
+@pytest.fixture
+def repo(fake_github):
+    fake_github.routes[("GET", REPO)] = repo_json(fake_github)
+    fake_github.routes[("GET", REPO + "/pulls")] = [
+        pr_json(fake_github, i, "sha%d" % i) for i in range(1, 31)
+    ]
+    for i in range(1, 31):
+        fake_github.routes[("GET", REPO + "/pulls/%d" % i)] = pr_json(
+            fake_github, i, "sha%d" % i
+        )
+    gh = create_api_sessions("token", base_url=fake_github.url, http_cache=LRUCache())
+    repo = gh.get_repo("conda-forge/blah-feedstock")
+    fake_github.requests.clear()
+    return repo
+
+
+def _payload_prs(fake, number, sha):
+    pr = pr_json(fake, number, sha)
+    return [{k: pr[k] for k in ["url", "id", "number", "head", "base"]}]
+
+
+@pytest.mark.parametrize("event_name", ["check_suite", "workflow_run"])
+def test_get_prs_for_sha_payload(fake_github, repo, event_name):
+    event_data = {
+        event_name: {
+            "head_sha": "sha5",
+            "pull_requests": _payload_prs(fake_github, 5, "sha5"),
+        }
+    }
+    prs = _get_prs_for_sha(repo, "sha5", event_name, event_data)
+    assert [pr.number for pr in prs] == [5]
+    assert fake_github.count() == 1
+    assert fake_github.count("GET", REPO + "/pulls/5") == 1
+
+
+def test_get_prs_for_sha_status(fake_github, repo):
+    fake_github.routes[("GET", REPO + "/commits/sha5/pulls")] = [
+        pr_json(fake_github, 5, "sha5"),
+        # a closed PR and one that only contains the commit are skipped
+        pr_json(fake_github, 4, "sha5", state="closed"),
+        pr_json(fake_github, 6, "sha6"),
+    ]
+    prs = _get_prs_for_sha(repo, "sha5", "status", {"sha": "sha5"})
+    assert [pr.number for pr in prs] == [5]
+    assert fake_github.count() == 1
+    assert fake_github.count("GET", REPO + "/commits/sha5/pulls") == 1
+
+
+@pytest.mark.parametrize("event_name", ["check_suite", "workflow_run", "status"])
+def test_get_prs_for_sha_fallback(fake_github, repo, event_name):
+    # e.g., a PR from a fork is not in the payload or the commit's PRs
+    fake_github.routes[("GET", REPO + "/commits/sha7/pulls")] = []
+    event_data = {event_name: {"head_sha": "sha7", "pull_requests": []}}
+    prs = _get_prs_for_sha(repo, "sha7", event_name, event_data)
+    assert [pr.number for pr in prs] == [7]
+    assert fake_github.count("GET", REPO + "/pulls") == 1
+    if event_name == "status":
+        assert fake_github.count() == 2
+    else:
+        assert fake_github.count() == 1
+
+
+@pytest.mark.parametrize("event_name", ["check_suite", "workflow_run"])
+def test_get_prs_for_sha_payload_closed(fake_github, repo, event_name):
+    # the PR was closed after the run started
+    fake_github.routes[("GET", REPO + "/pulls/5")] = pr_json(
+        fake_github, 5, "sha5", state="closed"
+    )
+    fake_github.routes[("GET", REPO + "/pulls")] = [
+        pr_json(fake_github, i, "sha%d" % i) for i in range(1, 31) if i != 5
+    ]
+    event_data = {
+        event_name: {
+            "head_sha": "sha5",
+            "pull_requests": _payload_prs(fake_github, 5, "sha5"),
+        }
+    }
+    prs = _get_prs_for_sha(repo, "sha5", event_name, event_data)
+    assert prs == []
+    assert fake_github.count("GET", REPO + "/pulls/5") == 1
+
+
+def test_get_prs_for_sha_payload_other_repo(fake_github, repo):
+    payload_prs = _payload_prs(fake_github, 5, "sha5")
+    payload_prs[0]["base"]["repo"]["url"] = fake_github.url + "/repos/other/repo"
+    event_data = {"check_suite": {"head_sha": "sha5", "pull_requests": payload_prs}}
+    prs = _get_prs_for_sha(repo, "sha5", "check_suite", event_data)
+    assert [pr.number for pr in prs] == [5]
+    # we had to scan the open PRs
+    assert fake_github.count("GET", REPO + "/pulls") == 1
+    assert fake_github.count("GET", REPO + "/pulls/5") == 0
+
+
+@unittest.mock.patch("conda_forge_automerge_action.automerge.RepoWorkspace")
+@unittest.mock.patch(
+    "conda_forge_automerge_action.automerge._automerge_pr_with_workspace",
+    return_value=(False, "blah"),
+)
+def test_evaluate_event_prefilters_once(eval_mock, workspace_mock):
+    path = os.path.join(
+        os.path.dirname(__file__), "payloads", "pull_request_labeled.json"
+    )
+    with open(path) as fp:
+        event_data = json.load(fp)
+    PREFILTER_STATS.clear()
+
+    assert _evaluate_event(
+        unittest.mock.MagicMock(), "pull_request", event_data, "conda-forge/blah"
+    )
+
+    eval_mock.assert_called_once()
+    assert PREFILTER_STATS == {"passed:label": 1}
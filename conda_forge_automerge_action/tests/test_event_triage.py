@@ -0,0 +1,73 @@
+import json
+import os
+import time
+import unittest.mock
+
+import pytest
+
+from ..__main__ import main
+from ..events import _triage_event
+
+PAYLOADS = os.path.join(os.path.dirname(__file__), "payloads")
+
+
+@pytest.mark.parametrize(
+    "event_name,payload,evaluate",
+    [
+        ("status", "status_pending.json", False),
+        ("status", "status_other_context.json", False),
+        ("status", "status_success.json", True),
+        ("status", "status_failure_circle.json", True),
+        ("check_suite", "check_suite_in_progress.json", False),
+        ("check_suite", "check_suite_other_app.json", False),
+        ("check_suite", "check_suite_completed.json", True),
+        ("workflow_run", "workflow_run_in_progress.json", False),
+        ("workflow_run", "workflow_run_completed.json", True),
+        ("pull_request", "pull_request_closed.json", False),
+        ("pull_request", "pull_request_labeled.json", True),
+    ],
+)
+def test_triage_event(event_name, payload, evaluate):
+    with open(os.path.join(PAYLOADS, payload)) as fp:
+        event_data = json.load(fp)
+    res, reason = _triage_event(event_name, event_data)
+    assert res is evaluate
+    assert (reason is None) is evaluate
+
+
+@unittest.mock.patch("conda_forge_automerge_action.__main__.get_actor_token")
+@unittest.mock.patch("conda_forge_automerge_action.__main__.create_api_sessions")
+def test_main_skips_noop_events(session_mock, token_mock, monkeypatch):
+    monkeypatch.setenv(
+        "GITHUB_EVENT_PATH", os.path.join(PAYLOADS, "status_pending.json")
+    )
+    monkeypatch.setenv("GITHUB_EVENT_NAME", "status")
+
+    t0 = time.monotonic()
+    main()
+    assert time.monotonic() - t0 < 0.1
+
+    token_mock.assert_not_called()
+    session_mock.assert_not_called()
+
+
+@unittest.mock.patch("conda_forge_automerge_action.events.automerge_prs")
+@unittest.mock.patch("conda_forge_automerge_action.events._get_prs_for_sha")
+@unittest.mock.patch("conda_forge_automerge_action.__main__.get_actor_token")
+@unittest.mock.patch("conda_forge_automerge_action.__main__.create_api_sessions")
+def test_main_evaluates_events(
+    session_mock, token_mock, prs_mock, am_mock, monkeypatch
+):
+    monkeypatch.setenv(
+        "GITHUB_EVENT_PATH", os.path.join(PAYLOADS, "status_success.json")
+    )
+    monkeypatch.setenv("GITHUB_EVENT_NAME", "status")
+    monkeypatch.setenv("GITHUB_REPOSITORY", "conda-forge/blah-feedstock")
+    prs_mock.return_value = ["pr"]
+
+    main()
+
+    token_mock.assert_called_once()
+    session_mock.assert_called_once()
+    repo = session_mock.return_value.get_repo.return_value
+    am_mock.assert_called_once_with([(repo, "pr")])
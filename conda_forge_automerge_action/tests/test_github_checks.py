@@ -1,6 +1,8 @@
-import unittest
+import unittest.mock
 
-from ..automerge import _get_github_checks
+from ..api_sessions import create_api_sessions
+from ..automerge import _get_checks, _get_github_checks
+from ..cache import LRUCache
 
 
 @unittest.mock.patch("conda_forge_automerge_action.automerge._get_checks")
@@ -162,3 +164,115 @@ def test_check_github_checks_pending_plus_success_plus_fail(get_mock):
     stat = _get_github_checks(1, 2)
     get_mock.assert_called_once_with(1, 2)
     assert stat == {"c1": False, "c2": False, "c3": None, "c4": True}
+
+
+def _fake_checks(fake_github, nsuites):
+    from .fake_github import repo_json
+
+    repo_path = "/repos/conda-forge/blah-feedstock"
+    fake_github.routes[("GET", repo_path)] = repo_json(fake_github)
+
+    suites = [
+        {
+            "id": i,
+            "status": "completed",
+            "conclusion": "success",
+            "app": {"slug": "github-actions"},
+            "url": fake_github.url + repo_path + "/check-suites/%d" % i,
+        }
+        for i in range(nsuites)
+    ]
+    suites.append(
+        {
+            "id": 100,
+            "status": "in_progress",
+            "conclusion": None,
+            "app": {"slug": "azure-pipelines"},
+            "url": fake_github.url + repo_path + "/check-suites/100",
+        }
+    )
+    runs = [
+        {
+            "id": 1000 + i,
+            "name": "automerge" if i == 0 else "build-%d" % i,
+            "status": "completed",
+            "conclusion": "success",
+            "check_suite": {"id": i},
+        }
+        for i in range(nsuites)
+    ]
+    runs.append(
+        {
+            "id": 2000,
+            "name": "linux",
+            "status": "in_progress",
+            "conclusion": None,
+            "check_suite": {"id": 100},
+        }
+    )
+    fake_github.routes[("GET", repo_path + "/commits/abc")] = {
+        "sha": "abc",
+        "url": fake_github.url + repo_path + "/commits/abc",
+    }
+    fake_github.routes[("GET", repo_path + "/commits/abc/check-suites")] = {
+        "total_count": len(suites),
+        "check_suites": suites,
+    }
+    fake_github.routes[("GET", repo_path + "/commits/abc/check-runs")] = {
+        "total_count": len(runs),
+        "check_runs": runs,
+    }
+    for suite in suites:
+        suite_runs = [r for r in runs if r["check_suite"]["id"] == suite["id"]]
+        fake_github.routes[
+            ("GET", repo_path + "/check-suites/%d/check-runs" % suite["id"])
+        ] = {"total_count": len(suite_runs), "check_runs": suite_runs}
+
+
+def _get_checks_per_suite(repo, pr):
+    # the old way of getting the runs with one call per suite
+    checks = []
+    for check in repo.get_commit(pr.head.sha).get_check_suites():
+        _check = {
+            "app": {"slug": check.app.slug},
+            "status": check.status,
+            "conclusion": check.conclusion,
+        }
+        if check.status == "completed" and check.app.slug == "github-actions":
+            _check["runs"] = [run.name for run in check.get_check_runs()]
+        else:
+            _check["runs"] = None
+        checks.append(_check)
+    return checks
+
+
+def test_get_checks_runs_for_ref(fake_github):
+    _fake_checks(fake_github, 5)
+    gh = create_api_sessions("token", base_url=fake_github.url, http_cache=LRUCache())
+    repo = gh.get_repo("conda-forge/blah-feedstock")
+    pr = unittest.mock.MagicMock()
+    pr.head.sha = "abc"
+
+    fake_github.requests.clear()
+    checks = _get_checks(repo, pr)
+    nreq = fake_github.count()
+
+    fake_github.requests.clear()
+    old_checks = _get_checks_per_suite(repo, pr)
+    old_nreq = fake_github.count()
+
+    assert checks == old_checks
+    assert nreq == 2
+    assert old_nreq >= 6
+    assert checks[0]["runs"] == ["automerge"]
+    assert checks[1]["runs"] == ["build-1"]
+    assert checks[-1]["runs"] is None
+
+    with unittest.mock.patch(
+        "conda_forge_automerge_action.automerge._get_checks"
+    ) as get_mock:
+        get_mock.return_value = checks
+        new_states = _get_github_checks(repo, pr)
+        get_mock.return_value = old_checks
+        old_states = _get_github_checks(repo, pr)
+    assert new_states == old_states
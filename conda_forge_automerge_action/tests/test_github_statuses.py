@@ -1,9 +1,13 @@
 import datetime
-import unittest
+import unittest.mock
+from urllib.parse import parse_qs
 
 import pytest
+from github import GithubException
 
+from ..api_sessions import create_api_sessions
 from ..automerge import _get_github_statuses
+from ..cache import LRUCache
 
 
 class DummyStatus:
@@ -89,6 +93,125 @@ def test_get_github_statuses(stats, ret):
     repo = unittest.mock.MagicMock()
     pr = unittest.mock.MagicMock()
     repo.get_commit.return_value.get_statuses.return_value = stats
-    stat = _get_github_statuses(repo, pr)
+    stat = _get_github_statuses(repo, pr, combined=False)
     assert stat == ret
     repo.get_commit.assert_called_once_with(pr.head.sha)
+
+
+def test_get_github_statuses_combined():
+    repo = unittest.mock.MagicMock()
+    repo.url = "https://api.github.com/repos/conda-forge/blah-feedstock"
+    pr = unittest.mock.MagicMock()
+    pr.head.sha = "abc"
+    pages = [
+        {
+            "total_count": 3,
+            "statuses": [
+                {"context": "blah", "state": "success"},
+                {"context": "blah1", "state": "error"},
+            ],
+        },
+        {"total_count": 3, "statuses": [{"context": "blah2", "state": "pending"}]},
+    ]
+    repo.requester.requestJsonAndCheck.side_effect = [({}, page) for page in pages]
+
+    stat = _get_github_statuses(repo, pr)
+
+    assert stat == {"blah": True, "blah1": False, "blah2": None}
+    assert repo.requester.requestJsonAndCheck.call_count == 2
+    assert repo.requester.requestJsonAndCheck.call_args.args == (
+        "GET",
+        repo.url + "/commits/abc/status",
+    )
+    repo.get_commit.assert_not_called()
+
+
+def test_get_github_statuses_combined_fallback():
+    repo = unittest.mock.MagicMock()
+    pr = unittest.mock.MagicMock()
+    repo.requester.requestJsonAndCheck.side_effect = GithubException(500)
+    repo.get_commit.return_value.get_statuses.return_value = [
+        DummyStatus("blah", "pending", datetime.datetime(2024, 1, 1)),
+        DummyStatus("blah", "success", datetime.datetime(2024, 1, 2)),
+    ]
+
+    assert _get_github_statuses(repo, pr) == {"blah": True}
+    repo.get_commit.assert_called_once_with(pr.head.sha)
+
+
+def _fake_statuses(fake_github, nstatuses, ncontexts):
+    from .fake_github import repo_json
+
+    repo_path = "/repos/conda-forge/blah-feedstock"
+    fake_github.routes[("GET", repo_path)] = repo_json(fake_github)
+    fake_github.routes[("GET", repo_path + "/commits/abc")] = {
+        "sha": "abc",
+        "url": fake_github.url + repo_path + "/commits/abc",
+    }
+
+    # the history is newest first, like the API
+    states = ["pending", "failure", "error", "success"]
+    history = []
+    for i in range(nstatuses):
+        ts = datetime.datetime(2024, 1, 1) + datetime.timedelta(seconds=i)
+        history.append(
+            {
+                "id": i,
+                "context": "ctx-%d" % (i % ncontexts),
+                "state": states[(i // ncontexts) % len(states)],
+                "updated_at": ts.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "created_at": ts.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            }
+        )
+    history = history[::-1]
+    latest = {}
+    for status in history:
+        latest.setdefault(status["context"], status)
+    latest = list(latest.values())
+
+    def _paginate(items, key=None):
+        def _route(req):
+            query = parse_qs(req["query"])
+            page = int(query.get("page", ["1"])[0])
+            per_page = int(query.get("per_page", ["30"])[0])
+            chunk = items[(page - 1) * per_page : page * per_page]
+            headers = {}
+            if page * per_page < len(items):
+                headers["Link"] = '<%s%s?per_page=%d&page=%d>; rel="next"' % (
+                    fake_github.url,
+                    req["path"],
+                    per_page,
+                    page + 1,
+                )
+            if key is None:
+                return 200, headers, chunk
+            return 200, headers, {"total_count": len(items), key: chunk}
+
+        return _route
+
+    fake_github.routes[("GET", repo_path + "/statuses/abc")] = _paginate(history)
+    fake_github.routes[("GET", repo_path + "/commits/abc/status")] = _paginate(
+        latest, key="statuses"
+    )
+
+
+def test_get_github_statuses_combined_vs_history(fake_github):
+    _fake_statuses(fake_github, 1200, 40)
+    gh = create_api_sessions("token", base_url=fake_github.url, http_cache=LRUCache())
+    gh.per_page = 100
+    repo = gh.get_repo("conda-forge/blah-feedstock")
+    pr = unittest.mock.MagicMock()
+    pr.head.sha = "abc"
+
+    fake_github.requests.clear()
+    combined = _get_github_statuses(repo, pr)
+    combined_nreq = fake_github.count()
+
+    fake_github.requests.clear()
+    history = _get_github_statuses(repo, pr, combined=False)
+    history_nreq = fake_github.count()
+
+    assert combined == history
+    assert len(combined) == 40
+    assert combined_nreq == 1
+    assert history_nreq >= 12
@@ -0,0 +1,71 @@
+import datetime
+import unittest.mock
+
+import pytest
+
+from ..api_sessions import create_api_sessions
+from ..automerge import _no_extra_pr_commits
+from ..cache import LRUCache
+from .fake_github import paginated_route
+
+
+def _timeline(nevents, label_at, commit_after=None):
+    """a timeline of comments with the automerge label at index `label_at`"""
+    t0 = datetime.datetime(2024, 1, 1)
+    events = []
+    for i in range(nevents):
+        ts = (t0 + datetime.timedelta(minutes=i)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        if i == label_at:
+            events.append(
+                {"event": "labeled", "created_at": ts, "label": {"name": "automerge"}}
+            )
+        elif i == commit_after:
+            events.append({"event": "committed", "sha": "abc"})
+        else:
+            events.append({"event": "commented", "created_at": ts, "body": "x" * 100})
+    return events
+
+
+def _fake_timeline(fake_github, events):
+    path = "/repos/conda-forge/blah-feedstock/issues/1/timeline"
+    fake_github.routes[("GET", path)] = paginated_route(fake_github, lambda: events)
+    return path
+
+
+@pytest.mark.parametrize(
+    "label_at,commit_after,ret",
+    [
+        (950, None, True),
+        (950, 990, False),
+        (950, 10, True),
+        (5, 990, False),
+        (None, None, None),
+    ],
+)
+def test_no_extra_pr_commits_streams(fake_github, label_at, commit_after, ret):
+    path = _fake_timeline(fake_github, _timeline(1000, label_at, commit_after))
+    gh = create_api_sessions("token", base_url=fake_github.url, http_cache=LRUCache())
+    pr = unittest.mock.MagicMock()
+    pr.requester = gh.requester
+    pr.issue_url = fake_github.url + "/repos/conda-forge/blah-feedstock/issues/1"
+
+    assert _no_extra_pr_commits(pr) is ret
+
+    if label_at == 950:
+        # the first page (for the links) and then the last page only
+        assert fake_github.count("GET", path) == 2
+    else:
+        assert fake_github.count("GET", path) == 11
+
+
+def test_no_extra_pr_commits_out_of_order():
+    events = [
+        {
+            "event": "labeled",
+            "created_at": datetime.datetime(2024, 1, 2),
+            "label": "automerge",
+        },
+        {"event": "commented", "created_at": datetime.datetime(2024, 1, 1)},
+    ]
+    snapshot = {"timeline": [dict(e, label=e.get("label")) for e in events]}
+    assert _no_extra_pr_commits(None, snapshot=snapshot) is None
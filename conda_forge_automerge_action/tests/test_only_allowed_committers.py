@@ -0,0 +1,88 @@
+import unittest.mock
+
+from ..automerge import VERIFIED_PR_HEADS, _only_allowed_committers
+
+
+class DummyCommit:
+    def __init__(self, login):
+        self.author = unittest.mock.MagicMock()
+        self.author.login = login
+
+
+def _make_pr(commits, sha="abc"):
+    pr = unittest.mock.MagicMock()
+    pr.number = 1
+    pr.head.sha = sha
+    pr.base.repo.full_name = "conda-forge/blah-feedstock"
+
+    seen = []
+
+    def _get_commits():
+        for c in commits:
+            seen.append(c)
+            yield c
+
+    pr.get_commits.side_effect = _get_commits
+    return pr, seen
+
+
+def test_only_allowed_committers_short_circuits():
+    VERIFIED_PR_HEADS.clear()
+    commits = [DummyCommit("blah")] + [DummyCommit("regro-cf-autotick-bot")] * 10
+    pr, seen = _make_pr(commits)
+
+    assert not _only_allowed_committers(pr)
+    assert len(seen) == 1
+    assert VERIFIED_PR_HEADS.get("conda-forge/blah-feedstock#1") is None
+
+
+def test_only_allowed_committers_caches_heads():
+    VERIFIED_PR_HEADS.clear()
+    pr, seen = _make_pr([DummyCommit("regro-cf-autotick-bot")] * 3)
+
+    assert _only_allowed_committers(pr)
+    assert len(seen) == 3
+    assert VERIFIED_PR_HEADS.get("conda-forge/blah-feedstock#1") == "abc"
+
+    # same head is not checked again
+    assert _only_allowed_committers(pr)
+    assert len(seen) == 3
+
+    # new commits on top are checked via compare
+    pr.head.sha = "def"
+    comparison = pr.base.repo.compare.return_value
+    comparison.status = "ahead"
+    comparison.commits = [DummyCommit("regro-cf-autotick-bot")]
+    assert _only_allowed_committers(pr)
+    pr.base.repo.compare.assert_called_once_with("abc", "def")
+    assert len(seen) == 3
+    assert VERIFIED_PR_HEADS.get("conda-forge/blah-feedstock#1") == "def"
+
+    # and a new commit by someone else is caught
+    pr.head.sha = "ghi"
+    comparison.commits = [DummyCommit(None)]
+    assert not _only_allowed_committers(pr)
+    assert len(seen) == 3
+    assert VERIFIED_PR_HEADS.get("conda-forge/blah-feedstock#1") == "def"
+
+
+def test_only_allowed_committers_force_push():
+    VERIFIED_PR_HEADS.clear()
+    VERIFIED_PR_HEADS.set("conda-forge/blah-feedstock#1", "abc")
+    pr, seen = _make_pr([DummyCommit("regro-cf-autotick-bot"), DummyCommit("blah")])
+    pr.head.sha = "def"
+    pr.base.repo.compare.return_value.status = "diverged"
+
+    assert not _only_allowed_committers(pr)
+    assert len(seen) == 2
+
+
+def test_only_allowed_committers_snapshot():
+    pr = unittest.mock.MagicMock()
+    assert _only_allowed_committers(
+        pr, snapshot={"commit_authors": ["regro-cf-autotick-bot"]}
+    )
+    assert not _only_allowed_committers(
+        pr, snapshot={"commit_authors": ["regro-cf-autotick-bot", None]}
+    )
+    pr.get_commits.assert_not_called()
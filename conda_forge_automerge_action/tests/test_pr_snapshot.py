@@ -0,0 +1,310 @@
+import datetime
+import unittest.mock
+
+import pytest
+
+from ..automerge import (
+    ALLOWED_USERS,
+    VERIFIED_PR_HEADS,
+    _check_pr,
+    _get_github_checks,
+    _get_github_statuses,
+    _no_extra_pr_commits,
+    _only_allowed_committers,
+)
+from ..pr_snapshot import fetch_pr_snapshot, get_pr_snapshot
+
+
+def _page(variables, commits, timeline, has_next, has_previous=False):
+    pr = {
+        "title": "[bot-automerge] blah",
+        "mergeable": "MERGEABLE",
+        "mergeStateStatus": "CLEAN",
+        "author": {"login": "regro-cf-autotick-bot"},
+        "labels": {"nodes": [{"name": "automerge"}]},
+        "headCommit": {
+            "nodes": [
+                {
+                    "commit": {
+                        "oid": "abc",
+                        "status": {
+                            "contexts": [
+                                {"context": "linter", "state": "SUCCESS"},
+                                {"context": "travis", "state": "EXPECTED"},
+                                {"context": "drone", "state": "FAILURE"},
+                            ]
+                        },
+                        "checkSuites": {
+                            "pageInfo": {"hasNextPage": False},
+                            "nodes": [
+                                {
+                                    "status": "COMPLETED",
+                                    "conclusion": "SUCCESS",
+                                    "app": {"slug": "github-actions"},
+                                    "checkRuns": {
+                                        "pageInfo": {"hasNextPage": False},
+                                        "nodes": [{"name": "build"}],
+                                    },
+                                },
+                                {
+                                    "status": "IN_PROGRESS",
+                                    "conclusion": None,
+                                    "app": {"slug": "azure-pipelines"},
+                                    "checkRuns": {
+                                        "pageInfo": {"hasNextPage": False},
+                                        "nodes": [{"name": "linux"}],
+                                    },
+                                },
+                            ],
+                        },
+                    }
+                }
+            ]
+        },
+    }
+    page_info = {"hasNextPage": has_next, "endCursor": "c1" if has_next else None}
+    if variables["withCommits"]:
+        pr["commits"] = {
+            "pageInfo": page_info,
+            "nodes": [
+                {"commit": {"oid": "x", "author": {"user": {"login": c}}}}
+                for c in commits
+            ],
+        }
+    if variables["withTimeline"]:
+        pr["timelineItems"] = {
+            "pageInfo": {
+                "hasPreviousPage": has_previous,
+                "startCursor": "t1" if has_previous else None,
+            },
+            "nodes": timeline,
+        }
+    return {}, {"data": {"repository": {"pullRequest": pr}}}
+
+
+_COMMIT = {"__typename": "PullRequestCommit", "commit": {"oid": "x"}}
+_LABEL = {
+    "__typename": "LabeledEvent",
+    "createdAt": "2024-01-01T00:00:00Z",
+    "label": {"name": "automerge"},
+}
+
+
+def _make_repo():
+    def _query(query, variables):
+        if variables["commitsCursor"] is None:
+            # the label is on the newest page, so the older ones are not needed
+            return _page(
+                variables, ["regro-cf-autotick-bot"], [_COMMIT, _LABEL], True, True
+            )
+        else:
+            assert not variables["withHead"]
+            assert not variables["withTimeline"]
+            return _page(variables, [None], [], False)
+
+    repo = unittest.mock.MagicMock()
+    repo.full_name = "conda-forge/blah-feedstock"
+    repo.requester.graphql_query.side_effect = _query
+    return repo
+
+
+def test_fetch_pr_snapshot():
+    repo = _make_repo()
+    pr = unittest.mock.MagicMock()
+    pr.number = 5
+
+    snapshot = fetch_pr_snapshot(repo, pr)
+
+    assert snapshot["queries"] == 2
+    assert snapshot["title"] == "[bot-automerge] blah"
+    assert snapshot["author"] == "regro-cf-autotick-bot"
+    assert snapshot["labels"] == ["automerge"]
+    assert snapshot["mergeable"] is True
+    assert snapshot["merge_state_status"] == "clean"
+    assert snapshot["head_sha"] == "abc"
+    assert snapshot["commit_authors"] == ["regro-cf-autotick-bot", None]
+    assert snapshot["timeline"] == [
+        {"event": "committed", "created_at": None, "label": None},
+        {
+            "event": "labeled",
+            "created_at": datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc),
+            "label": "automerge",
+        },
+    ]
+    assert snapshot["statuses"] == {
+        "linter": "success",
+        "travis": "pending",
+        "drone": "failure",
+    }
+    assert snapshot["checks"] == [
+        {
+            "app": {"slug": "github-actions"},
+            "status": "completed",
+            "conclusion": "success",
+            "runs": ["build"],
+        },
+        {
+            "app": {"slug": "azure-pipelines"},
+            "status": "in_progress",
+            "conclusion": None,
+            "runs": None,
+        },
+    ]
+
+    variables = repo.requester.graphql_query.call_args_list[0].args[1]
+    assert variables["owner"] == "conda-forge"
+    assert variables["name"] == "blah-feedstock"
+    assert variables["number"] == 5
+
+
+def test_fetch_pr_snapshot_timeline_backwards():
+    def _query(query, variables):
+        if variables["timelineCursor"] is None:
+            return _page(variables, [], [_COMMIT], False, True)
+        elif variables["timelineCursor"] == "t1":
+            return _page(variables, [], [_COMMIT, _LABEL], False, True)
+        raise AssertionError("paged past the automerge label")
+
+    repo = unittest.mock.MagicMock()
+    repo.full_name = "conda-forge/blah-feedstock"
+    repo.requester.graphql_query.side_effect = _query
+    pr = unittest.mock.MagicMock()
+
+    snapshot = fetch_pr_snapshot(repo, pr)
+
+    assert snapshot["queries"] == 2
+    assert [e["event"] for e in snapshot["timeline"]] == [
+        "committed",
+        "labeled",
+        "committed",
+    ]
+    assert _no_extra_pr_commits(pr, snapshot=snapshot) is False
+
+
+def test_fetch_pr_snapshot_stops_at_disallowed_author():
+    def _query(query, variables):
+        assert variables["commitsCursor"] is None, "paged past a disallowed author"
+        return _page(variables, ["blah", "regro-cf-autotick-bot"], [_LABEL], True)
+
+    repo = unittest.mock.MagicMock()
+    repo.full_name = "conda-forge/blah-feedstock"
+    repo.requester.graphql_query.side_effect = _query
+    pr = unittest.mock.MagicMock()
+
+    snapshot = fetch_pr_snapshot(repo, pr, allowed_users=ALLOWED_USERS)
+
+    assert snapshot["queries"] == 1
+    assert snapshot["commit_authors"] == ["blah"]
+    assert not _only_allowed_committers(pr, snapshot=snapshot)
+
+
+def test_fetch_pr_snapshot_without_commits():
+    repo = unittest.mock.MagicMock()
+    repo.full_name = "conda-forge/blah-feedstock"
+    repo.requester.graphql_query.side_effect = lambda query, variables: _page(
+        variables, [], [], False
+    )
+    pr = unittest.mock.MagicMock()
+
+    snapshot = fetch_pr_snapshot(repo, pr, with_commits=False)
+
+    assert snapshot["queries"] == 1
+    assert snapshot["commit_authors"] is None
+    variables = repo.requester.graphql_query.call_args.args[1]
+    assert not variables["withCommits"]
+
+
+def test_get_pr_snapshot_mismatch_or_error():
+    repo = _make_repo()
+    pr = unittest.mock.MagicMock()
+    pr.head.sha = "abc"
+    assert get_pr_snapshot(repo, pr) is not None
+
+    pr.head.sha = "def"
+    assert get_pr_snapshot(repo, pr) is None
+
+    repo.requester.graphql_query.side_effect = RuntimeError("blah")
+    assert get_pr_snapshot(repo, pr) is None
+
+
+@pytest.mark.parametrize("connection", ["checkSuites", "checkRuns"])
+def test_get_pr_snapshot_too_many_checks(connection):
+    repo = _make_repo()
+    query = repo.requester.graphql_query.side_effect
+
+    def _query(*args):
+        headers, data = query(*args)
+        pr = data["data"]["repository"]["pullRequest"]
+        suites = pr["headCommit"]["nodes"][0]["commit"]["checkSuites"]
+        if connection == "checkSuites":
+            suites["pageInfo"]["hasNextPage"] = True
+        else:
+            suites["nodes"][0]["checkRuns"]["pageInfo"]["hasNextPage"] = True
+        return headers, data
+
+    repo.requester.graphql_query.side_effect = _query
+    pr = unittest.mock.MagicMock()
+    pr.head.sha = "abc"
+
+    assert not fetch_pr_snapshot(repo, pr)["checks_complete"]
+    # the REST calls are used instead
+    assert get_pr_snapshot(repo, pr) is None
+
+
+def test_snapshot_feeds_evaluation():
+    repo = _make_repo()
+    pr = unittest.mock.MagicMock()
+    pr.head.sha = "abc"
+    snapshot = get_pr_snapshot(repo, pr)
+
+    assert _get_github_statuses(repo, pr, snapshot=snapshot) == {
+        "linter": True,
+        "travis": None,
+        "drone": False,
+    }
+    assert _get_github_checks(repo, pr, snapshot=snapshot) == {
+        "github-actions": True,
+        "azure-pipelines": None,
+    }
+    assert _no_extra_pr_commits(pr, snapshot=snapshot)
+    assert _check_pr(pr, {}, snapshot=snapshot) == (True, None)
+
+    repo.get_commit.assert_not_called()
+    pr.get_labels.assert_not_called()
+    pr.get_commits.assert_not_called()
+    pr.as_issue.assert_not_called()
+
+    # bot PR w/o the label but with a non-bot commit
+    snapshot["labels"] = []
+    with unittest.mock.patch(
+        "conda_forge_automerge_action.automerge._upsert_pr_comment"
+    ) as comment_mock:
+        allowed, msg = _check_pr(pr, {}, snapshot=snapshot)
+    assert not allowed
+    assert "non-bot commits" in msg
+    comment_mock.assert_called_once()
+
+
+def test_snapshot_verified_heads():
+    VERIFIED_PR_HEADS.clear()
+    repo = _make_repo()
+    pr = unittest.mock.MagicMock()
+    pr.number = 5
+    pr.head.sha = "abc"
+    pr.base.repo.full_name = "conda-forge/blah-feedstock"
+    snapshot = get_pr_snapshot(repo, pr)
+    snapshot["labels"] = []
+    snapshot["commit_authors"] = ["regro-cf-autotick-bot"]
+
+    # a head that passes with the commits of the snapshot is remembered
+    with unittest.mock.patch(
+        "conda_forge_automerge_action.automerge._automerge_me", return_value=True
+    ):
+        assert _check_pr(pr, {}, snapshot=snapshot) == (True, None)
+        assert VERIFIED_PR_HEADS.get("conda-forge/blah-feedstock#5") == "abc"
+
+        # so a snapshot w/o the commits needs no requests for them
+        snapshot["commit_authors"] = None
+        assert _check_pr(pr, {}, snapshot=snapshot) == (True, None)
+    pr.get_commits.assert_not_called()
+    pr.base.repo.compare.assert_not_called()
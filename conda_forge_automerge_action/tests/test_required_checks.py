@@ -4,10 +4,11 @@ import unittest
 import pytest
 
 from ..automerge import (
+    CI_PATHS,
     _all_statuses_and_checks_ok,
     _get_required_checks_and_statuses,
-    pushd,
 )
+from ..git_utils import pushd
 
 
 @pytest.mark.parametrize("val", [True, False])
@@ -48,11 +49,13 @@ def test_all_statuses_and_checks_ok(val):
     ],
 )
 @pytest.mark.parametrize("ignore_linter", ["conda-forge-linter", "linter", None])
-@unittest.mock.patch("conda_forge_automerge_action.automerge._run_git_command")
+@pytest.mark.parametrize("mode", ["full", "partial"])
+@unittest.mock.patch("conda_forge_automerge_action.git_utils._run_git_command")
 @unittest.mock.patch("conda_forge_automerge_action.automerge.tempfile")
 def test_get_required_checks_and_statuses(
-    tmpmock, submock, tmpdir, fname, ignore_linter
+    tmpmock, submock, tmpdir, fname, ignore_linter, mode, monkeypatch
 ):
+    monkeypatch.setenv("INPUT_GIT_TRANSPORT", mode)
     tmpmock.TemporaryDirectory.return_value.__enter__.return_value = str(tmpdir)
 
     pr = unittest.mock.MagicMock()
@@ -87,5 +90,21 @@ def test_get_required_checks_and_statuses(
         assert "linter" not in req
         assert len(req) == 1, req
 
-    submock.assert_any_call("clone", pr.head.repo.clone_url, str(tmpdir))
-    submock.assert_any_call("checkout", pr.head.sha)
+    if mode == "full":
+        submock.assert_any_call("clone", pr.head.repo.clone_url, str(tmpdir))
+    else:
+        submock.assert_any_call(
+            "clone",
+            "--quiet",
+            "--filter=blob:none",
+            "--depth=1",
+            "--no-checkout",
+            pr.head.repo.clone_url,
+            str(tmpdir),
+        )
+        submock.assert_any_call(
+            "-C", str(tmpdir), "sparse-checkout", "set", "--no-cone", *CI_PATHS
+        )
+    submock.assert_any_call(
+        "-C", str(tmpdir), "checkout", "--quiet", "--detach", pr.head.sha
+    )
@@ -0,0 +1,64 @@
+import time
+import unittest.mock
+
+from ..api_sessions import _BYPASS_MEMO
+from ..automerge import _resolve_mergeable
+
+
+def _pr(mergeable, merged=False):
+    pr = unittest.mock.MagicMock()
+    pr.mergeable = mergeable
+    pr.merged = merged
+    return pr
+
+
+def test_resolve_mergeable_polls():
+    repo = unittest.mock.MagicMock()
+    prs = [_pr(None), _pr(None), _pr(True), _pr(False)]
+    repo.get_pull.side_effect = prs
+
+    t0 = time.monotonic()
+    pr = _resolve_mergeable(repo, 5, deadline=5, base_delay=0.01, max_delay=0.02)
+    assert time.monotonic() - t0 < 1
+
+    assert pr is prs[2]
+    assert repo.get_pull.call_count == 3
+    repo.get_pull.assert_called_with(5)
+
+
+def test_resolve_mergeable_merged():
+    repo = unittest.mock.MagicMock()
+    repo.get_pull.return_value = _pr(None, merged=True)
+    _resolve_mergeable(repo, 5, deadline=5, base_delay=1)
+    assert repo.get_pull.call_count == 1
+
+
+def test_resolve_mergeable_deadline():
+    repo = unittest.mock.MagicMock()
+    repo.get_pull.return_value = _pr(None)
+
+    with unittest.mock.patch(
+        "conda_forge_automerge_action.automerge.random.uniform",
+        side_effect=lambda a, b: b,
+    ):
+        t0 = time.monotonic()
+        pr = _resolve_mergeable(repo, 5, deadline=0.3, base_delay=0.05, max_delay=0.1)
+        elapsed = time.monotonic() - t0
+
+    assert pr.mergeable is None
+    assert 0.3 <= elapsed < 0.6
+    # 0.05, 0.1, 0.1, then what is left of the deadline
+    assert repo.get_pull.call_count == 5
+
+
+def test_resolve_mergeable_fresh():
+    repo = unittest.mock.MagicMock()
+    fresh = []
+
+    def _get_pull(number):
+        fresh.append(_BYPASS_MEMO.get())
+        return _pr(True)
+
+    repo.get_pull.side_effect = _get_pull
+    _resolve_mergeable(repo, 5)
+    assert fresh == [True]
@@ -0,0 +1,353 @@
+import json
+import os
+import threading
+import time
+import unittest.mock
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+from github import BadCredentialsException
+
+from ..__main__ import _get_serve_token, cli
+from ..api_sessions import create_api_sessions, get_http_adapter
+from ..cache import LRUCache
+from ..server import AutomergeServer, sign_payload, verify_signature
+from .fake_github import repo_json
+from .test_async_automerge import _fake_feedstock
+
+PAYLOADS = os.path.join(os.path.dirname(__file__), "payloads")
+SECRET = "s3cr3t"
+
+
+def _payloads():
+    """the recorded payloads as a list of (event name, file name, body)"""
+    out = []
+    for fname in sorted(os.listdir(PAYLOADS)):
+        event_name = next(
+            name
+            for name in ["check_suite", "workflow_run", "pull_request", "status"]
+            if fname.startswith(name + "_")
+        )
+        with open(os.path.join(PAYLOADS, fname), "rb") as fp:
+            out.append((event_name, fname, fp.read()))
+    return out
+
+
+def _post(session, url, event_name, body, secret=SECRET):
+    return session.post(
+        url,
+        data=body,
+        headers={
+            "X-GitHub-Event": event_name,
+            "X-Hub-Signature-256": sign_payload(secret, body),
+            "Content-Type": "application/json",
+        },
+    )
+
+
+def test_verify_signature():
+    body = b'{"zen": "Keep it logically awesome."}'
+    sig = sign_payload(SECRET, body)
+    assert sig.startswith("sha256=")
+    assert verify_signature(SECRET, body, sig)
+    assert verify_signature(SECRET.encode("utf-8"), body, sig)
+    assert not verify_signature("other", body, sig)
+    assert not verify_signature(SECRET, body + b" ", sig)
+    assert not verify_signature(SECRET, body, None)
+
+
+def test_server_requires_secret():
+    with pytest.raises(ValueError):
+        AutomergeServer(unittest.mock.MagicMock(), "", port=0)
+
+
+@unittest.mock.patch("conda_forge_automerge_action.server._evaluate_event")
+def test_server_deliveries(eval_mock):
+    eval_mock.return_value = True
+    gh = unittest.mock.MagicMock()
+    with open(os.path.join(PAYLOADS, "status_success.json"), "rb") as fp:
+        body = fp.read()
+
+    with AutomergeServer(
+        gh, SECRET, port=0, window=0
+    ) as server, requests.Session() as s:
+        r = _post(s, server.url, "status", body, secret="wrong")
+        assert r.status_code == 401
+
+        r = _post(s, server.url, "ping", b"{}")
+        assert r.status_code == 200
+
+        r = _post(s, server.url, "status", b"not json")
+        assert r.status_code == 400
+
+        with open(os.path.join(PAYLOADS, "status_pending.json"), "rb") as fp:
+            r = _post(s, server.url, "status", fp.read())
+        assert r.status_code == 200
+        assert r.text.startswith("skipped")
+
+        r = _post(s, server.url, "status", body)
+        assert r.status_code == 202
+
+    # shutting down waits for the queued evaluations
+    eval_mock.assert_called_once_with(
+        gh, "status", json.loads(body), "conda-forge/blah-feedstock"
+    )
+    assert server.stats == {
+        "bad_signature": 1,
+        "ping": 1,
+        "bad_payload": 1,
+        "skipped": 1,
+        "accepted": 1,
+        "evaluated": 1,
+    }
+
+
+def _for_repo(fname, repo_name):
+    """a recorded payload for another repo"""
+    with open(os.path.join(PAYLOADS, fname)) as fp:
+        event_data = json.load(fp)
+    event_data["repository"]["full_name"] = repo_name
+    return json.dumps(event_data).encode("utf-8")
+
+
+@unittest.mock.patch("conda_forge_automerge_action.server._evaluate_event")
+def test_server_failed_evaluation(eval_mock):
+    eval_mock.side_effect = RuntimeError("blah")
+
+    with AutomergeServer(unittest.mock.MagicMock(), SECRET, port=0) as server:
+        with requests.Session() as s:
+            for name in ["a", "b"]:
+                body = _for_repo("status_success.json", "conda-forge/%s" % name)
+                assert _post(s, server.url, "status", body).status_code == 202
+
+    assert server.stats["failed"] == 2
+
+
+@unittest.mock.patch("conda_forge_automerge_action.server._evaluate_event")
+def test_server_refreshes_sessions(eval_mock):
+    old_gh = unittest.mock.MagicMock()
+    new_gh = unittest.mock.MagicMock()
+
+    def _eval(gh, *args):
+        if gh is old_gh:
+            raise BadCredentialsException(401, {"message": "Bad credentials"})
+        return True
+
+    eval_mock.side_effect = _eval
+    make_sessions = unittest.mock.MagicMock(return_value=new_gh)
+    body = _for_repo("status_success.json", "conda-forge/a")
+
+    with AutomergeServer(
+        old_gh, SECRET, port=0, window=0, make_sessions=make_sessions
+    ) as server, requests.Session() as s:
+        assert _post(s, server.url, "status", body).status_code == 202
+
+    # the evaluation is retried with new sessions
+    make_sessions.assert_called_once_with()
+    assert eval_mock.call_count == 2
+    assert server.gh is new_gh
+    assert server.stats["evaluated"] == 1
+    assert "failed" not in server.stats
+
+    # w/o a way to make new sessions the evaluation fails
+    eval_mock.reset_mock()
+    with AutomergeServer(
+        old_gh, SECRET, port=0, window=0
+    ) as server, requests.Session() as s:
+        assert _post(s, server.url, "status", body).status_code == 202
+    assert eval_mock.call_count == 1
+    assert server.stats["failed"] == 1
+
+    # old sessions are replaced before an evaluation
+    eval_mock.reset_mock()
+    make_sessions.reset_mock()
+    with AutomergeServer(
+        new_gh,
+        SECRET,
+        port=0,
+        window=0,
+        make_sessions=make_sessions,
+        refresh_seconds=0,
+    ) as server, requests.Session() as s:
+        assert _post(s, server.url, "status", body).status_code == 202
+    make_sessions.assert_called_once_with()
+    assert eval_mock.call_count == 1
+    assert server.stats["sessions_refreshed"] == 1
+
+
+def test_get_serve_token(tmp_path, monkeypatch):
+    monkeypatch.delenv("INPUT_RERENDERING_GITHUB_TOKEN", raising=False)
+    monkeypatch.setenv("INPUT_GITHUB_TOKEN", "env-token")
+    monkeypatch.delenv("AUTOMERGE_GITHUB_TOKEN_FILE", raising=False)
+    assert _get_serve_token() == "env-token"
+
+    path = tmp_path / "token"
+    path.write_text("file-token\n")
+    monkeypatch.setenv("AUTOMERGE_GITHUB_TOKEN_FILE", str(path))
+    assert _get_serve_token() == "file-token"
+    path.write_text("new-token\n")
+    assert _get_serve_token() == "new-token"
+
+
+@unittest.mock.patch("conda_forge_automerge_action.server._evaluate_event")
+def test_server_clears_memo(eval_mock, fake_github):
+    path = "/repos/conda-forge/blah-feedstock"
+    fake_github.routes[("GET", path)] = repo_json(fake_github)
+    gh = create_api_sessions(
+        "token", base_url=fake_github.url, http_cache=LRUCache(), memo_seconds=60
+    )
+
+    def _eval(gh, *args):
+        gh.get_repo("conda-forge/blah-feedstock")
+        gh.get_repo("conda-forge/blah-feedstock")
+        return True
+
+    eval_mock.side_effect = _eval
+
+    with AutomergeServer(gh, SECRET, port=0, window=0) as server:
+        with requests.Session() as s:
+            for name in ["a", "b"]:
+                body = _for_repo("status_success.json", "conda-forge/%s" % name)
+                assert _post(s, server.url, "status", body).status_code == 202
+
+    # the memo answers within an evaluation but not across deliveries
+    assert server.stats["evaluated"] == 2
+    assert get_http_adapter(gh).memo_hits == 2
+    assert fake_github.count("GET", path) == 2
+
+
+@unittest.mock.patch("conda_forge_automerge_action.server._evaluate_event")
+def test_server_coalesces(eval_mock):
+    eval_mock.return_value = True
+
+    with AutomergeServer(
+        unittest.mock.MagicMock(), SECRET, port=0, window=0.5
+    ) as server, requests.Session() as s:
+        for event_name, _, body in _payloads():
+            _post(s, server.url, event_name, body)
+
+        stats = s.get(server.url).json()
+        assert stats["deliveries"]["accepted"] == 5
+        assert stats["queue"]["depth"] == 1
+
+    # the burst of events for one SHA is evaluated once
+    assert eval_mock.call_count == 1
+    assert server.stats["evaluated"] == 1
+    assert server.queue.stats()["coalesce_ratio"] == 0.8
+
+
+@unittest.mock.patch("conda_forge_automerge_action.server._evaluate_event")
+def test_server_load(eval_mock):
+    """post the recorded payloads for many repos from several clients"""
+    threads = set()
+    # the evaluations wait until all deliveries are answered
+    posted = threading.Event()
+
+    def _eval(*args):
+        threads.add(threading.current_thread().name)
+        assert posted.wait(timeout=30)
+        time.sleep(0.01)
+        return True
+
+    eval_mock.side_effect = _eval
+    nrepos = 20
+    deliveries = [
+        (event_name, fname, _for_repo(fname, "conda-forge/pkg%d-feedstock" % i))
+        for i in range(nrepos)
+        for event_name, fname, _ in _payloads()
+    ]
+
+    local = threading.local()
+
+    def _send(delivery):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        event_name, fname, body = delivery
+        return fname, _post(local.session, server.url, event_name, body).status_code
+
+    with AutomergeServer(
+        unittest.mock.MagicMock(), SECRET, port=0, workers=4, window=0.01
+    ) as server:
+        t0 = time.monotonic()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(_send, deliveries))
+        post_time = time.monotonic() - t0
+        posted.set()
+    total_time = time.monotonic() - t0
+
+    naccepted = sum(1 for _, status in results if status == 202)
+    nskipped = sum(1 for _, status in results if status == 200)
+    assert naccepted + nskipped == len(deliveries)
+    # the pending, other-app, in-progress and closed PR payloads are skipped
+    assert nskipped == 6 * nrepos
+    assert server.stats["accepted"] == naccepted
+    assert "failed" not in server.stats
+    assert len(threads) == 4
+
+    # each repo is evaluated once, or twice if events came in while it ran
+    queue_stats = server.queue.stats()
+    assert nrepos <= eval_mock.call_count <= 2 * nrepos
+    assert server.stats["evaluated"] == eval_mock.call_count == queue_stats["runs"]
+    assert queue_stats["coalesced"] == naccepted - eval_mock.call_count
+    assert queue_stats["depth"] == 0
+
+    print(
+        "\n%d deliveries in %.2fs (%.0f/s), %d evaluations done in %.2fs, "
+        "coalesce ratio %.2f"
+        % (
+            len(deliveries),
+            post_time,
+            len(deliveries) / post_time,
+            eval_mock.call_count,
+            total_time,
+            queue_stats["coalesce_ratio"],
+        )
+    )
+
+
+@unittest.mock.patch("conda_forge_automerge_action.automerge._upsert_pr_comment")
+def test_server_end_to_end(comment_mock, fake_github, feedstock_repo, monkeypatch):
+    monkeypatch.setenv("INPUT_GIT_TRANSPORT", "partial")
+    name = "conda-forge/a-feedstock"
+    sha = feedstock_repo["head_sha"]
+    _fake_feedstock(fake_github, name, feedstock_repo)
+
+    gh = create_api_sessions(
+        "token", base_url=fake_github.url, http_cache=LRUCache(), pool_maxsize=8
+    )
+
+    with open(os.path.join(PAYLOADS, "check_suite_completed.json")) as fp:
+        event_data = json.load(fp)
+    repo_url = fake_github.url + "/repos/" + name
+    event_data["repository"]["full_name"] = name
+    event_data["check_suite"]["head_sha"] = sha
+    pr_data = event_data["check_suite"]["pull_requests"][0]
+    pr_data["number"] = 1
+    pr_data["head"]["sha"] = sha
+    pr_data["base"]["repo"]["url"] = repo_url
+    body = json.dumps(event_data).encode("utf-8")
+
+    with AutomergeServer(
+        gh, SECRET, port=0, window=0
+    ) as server, requests.Session() as s:
+        assert _post(s, server.url, "check_suite", body).status_code == 202
+        server.queue.shutdown()
+        budget = s.get(server.url).json()["rate_limit"]["core"]
+        assert budget["remaining"] == fake_github.rate_limit_remaining
+
+    assert server.stats["evaluated"] == 1
+    assert fake_github.count("PUT", "/repos/%s/pulls/1/merge" % name) == 1
+
+
+@unittest.mock.patch("conda_forge_automerge_action.__main__.main")
+@unittest.mock.patch("conda_forge_automerge_action.__main__.serve")
+def test_cli(serve_mock, main_mock):
+    cli(["serve", "--port", "9000", "--workers", "2", "--debounce-window", "0.5"])
+    serve_mock.assert_called_once_with(
+        host="127.0.0.1", port=9000, workers=2, window=0.5
+    )
+    main_mock.assert_not_called()
+
+    cli([])
+    main_mock.assert_called_once_with()
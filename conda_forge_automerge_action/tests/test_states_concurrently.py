@@ -0,0 +1,103 @@
+import threading
+import time
+import unittest.mock
+
+import pytest
+
+from ..automerge import _get_states_concurrently, automerge_pr
+
+
+def _slow(value, seconds, threads):
+    def _func(*args, **kwargs):
+        threads.add(threading.current_thread().name)
+        time.sleep(seconds)
+        return value
+
+    return _func
+
+
+@unittest.mock.patch(
+    "conda_forge_automerge_action.automerge._get_required_checks_and_statuses"
+)
+@unittest.mock.patch("conda_forge_automerge_action.automerge._get_github_checks")
+@unittest.mock.patch("conda_forge_automerge_action.automerge._get_github_statuses")
+def test_get_states_concurrently(stat_mock, check_mock, req_mock):
+    threads = set()
+    stat_mock.side_effect = _slow({"linter": True}, 0.3, threads)
+    check_mock.side_effect = _slow({"github-actions": True}, 0.3, threads)
+    req_mock.side_effect = _slow(["linter", "github-actions"], 0.3, threads)
+
+    t0 = time.monotonic()
+    out = _get_states_concurrently(1, 2, {}, snapshot=3, workspace=4)
+    assert time.monotonic() - t0 < 0.8
+
+    assert out == (
+        {"linter": True},
+        {"github-actions": True},
+        ["linter", "github-actions"],
+    )
+    assert len(threads) == 3
+    stat_mock.assert_called_once_with(1, 2, snapshot=3)
+    check_mock.assert_called_once_with(1, 2, snapshot=3)
+    req_mock.assert_called_once_with(2, {}, workspace=4)
+
+
+@unittest.mock.patch(
+    "conda_forge_automerge_action.automerge._get_required_checks_and_statuses"
+)
+@unittest.mock.patch("conda_forge_automerge_action.automerge._get_github_checks")
+@unittest.mock.patch("conda_forge_automerge_action.automerge._get_github_statuses")
+def test_get_states_concurrently_bounded(stat_mock, check_mock, req_mock):
+    threads = set()
+    stat_mock.side_effect = _slow({}, 0.01, threads)
+    check_mock.side_effect = _slow({}, 0.01, threads)
+    req_mock.side_effect = _slow([], 0.01, threads)
+
+    _get_states_concurrently(1, 2, {}, max_workers=1)
+    assert len(threads) == 1
+
+
+@unittest.mock.patch(
+    "conda_forge_automerge_action.automerge._get_required_checks_and_statuses"
+)
+@unittest.mock.patch("conda_forge_automerge_action.automerge._get_github_checks")
+@unittest.mock.patch("conda_forge_automerge_action.automerge._get_github_statuses")
+def test_get_states_concurrently_deadline(stat_mock, check_mock, req_mock):
+    threads = set()
+    done = threading.Event()
+
+    def _req(*args, **kwargs):
+        time.sleep(0.5)
+        done.set()
+        return []
+
+    stat_mock.side_effect = _slow({}, 0.01, threads)
+    check_mock.side_effect = _slow({}, 0.01, threads)
+    req_mock.side_effect = _req
+
+    with pytest.raises(TimeoutError):
+        _get_states_concurrently(1, 2, {}, deadline=0.1)
+    # the running work is finished before the workspace can be cleaned up
+    assert done.is_set()
+
+
+@unittest.mock.patch(
+    "conda_forge_automerge_action.automerge.get_pr_snapshot",
+    new=unittest.mock.MagicMock(return_value=None),
+)
+@unittest.mock.patch("conda_forge_automerge_action.automerge._get_conda_forge_config")
+@unittest.mock.patch("conda_forge_automerge_action.automerge._get_states_concurrently")
+def test_automerge_pr_deadline(states_mock, get_cfg_mock):
+    states_mock.side_effect = TimeoutError("blah")
+    get_cfg_mock.return_value = {"bot": {"automerge": True}}
+
+    repo = unittest.mock.MagicMock()
+    pr = unittest.mock.MagicMock()
+    pr.user.login = "regro-cf-autotick-bot"
+    pr.title = "[bot-automerge] blah"
+
+    did_merge, reason = automerge_pr(repo, pr)
+
+    assert not did_merge
+    assert "Timed out" in reason
+    pr.merge.assert_not_called()
@@ -0,0 +1,172 @@
+import datetime
+import re
+import unittest.mock
+from urllib.parse import parse_qs
+
+from ..__main__ import cli
+from ..api_sessions import create_api_sessions, get_rate_limit_governor
+from ..cache import LRUCache
+from ..sweep import _search_candidates, format_summary, sweep
+from .fake_github import paginated_route, pr_json
+from .test_async_automerge import _fake_feedstock
+
+
+def _search_item(fake, name, number, created_at="2024-01-01T00:00:00Z", **kwargs):
+    pr = pr_json(fake, number, "sha", full_name=name, **kwargs)
+    return {
+        "number": number,
+        "title": pr["title"],
+        "user": pr["user"],
+        "labels": pr["labels"],
+        "created_at": created_at,
+        "repository_url": fake.url + "/repos/" + name,
+    }
+
+
+def _search_route(fake, results):
+    """a /search/issues route with the results for each query by keyword"""
+
+    def _route(req):
+        query = parse_qs(req["query"])["q"][0]
+        items = next(v for k, v in results.items() if k in query)
+        created = re.search(r"created:(\S+)\.\.(\S+)", query)
+        if created is not None:
+            items = [
+                item
+                for item in items
+                if created.group(1) <= item["created_at"] <= created.group(2)
+            ]
+        status, headers, page = paginated_route(fake, lambda: items)(req)
+        return status, headers, {"total_count": len(items), "items": page}
+
+    return _route
+
+
+def _rate_limit_route(fake):
+    def _route(req):
+        core = {
+            "limit": 5000,
+            "remaining": fake.rate_limit_remaining,
+            "reset": fake.rate_limit_reset,
+            "used": 5000 - fake.rate_limit_remaining,
+        }
+        return {"resources": {"core": core}, "rate": core}
+
+    return _route
+
+
+@unittest.mock.patch("conda_forge_automerge_action.automerge._upsert_pr_comment")
+def test_sweep(comment_mock, fake_github, feedstock_repo, monkeypatch):
+    monkeypatch.setenv("INPUT_GIT_TRANSPORT", "partial")
+    _fake_feedstock(fake_github, "conda-forge/a-feedstock", feedstock_repo, (1, 2))
+    _fake_feedstock(fake_github, "conda-forge/b-feedstock", feedstock_repo)
+
+    title_items = [
+        _search_item(fake_github, "conda-forge/a-feedstock", 1),
+        _search_item(fake_github, "conda-forge/a-feedstock", 2),
+        _search_item(fake_github, "conda-forge/b-feedstock", 1),
+        # stopped by the pre-filter
+        _search_item(fake_github, "conda-forge/c-feedstock", 7, user="somebody"),
+    ]
+    label_items = [
+        # found by both searches
+        _search_item(fake_github, "conda-forge/b-feedstock", 1),
+    ]
+    fake_github.routes[("GET", "/search/issues")] = _search_route(
+        fake_github, {"in:title": title_items, "label:automerge": label_items}
+    )
+    fake_github.routes[("GET", "/rate_limit")] = _rate_limit_route(fake_github)
+
+    gh = create_api_sessions(
+        "token", base_url=fake_github.url, http_cache=LRUCache(), pool_maxsize=8
+    )
+
+    governor = get_rate_limit_governor(gh)
+
+    with unittest.mock.patch.object(
+        governor, "update", wraps=governor.update
+    ) as update_mock:
+        summary = sweep(gh, max_concurrency=4)
+
+    # all requests go through the shared adapter and governor
+    assert update_mock.call_count == fake_github.count()
+
+    assert summary["candidates"] == 3
+    assert summary["evaluated"] == 3
+    assert summary["merged"] == 3
+    assert summary["failed"] == 0
+    assert summary["repos"] == 2
+    assert summary["head SHAs"] == 2
+    assert summary["rate limit wait seconds"] == 0
+    # the requests after the search, w/o the two to /rate_limit and the 304s
+    assert summary["API requests"] == (
+        fake_github.count()
+        - fake_github.count("GET", "/search/issues")
+        - 2
+        - fake_github.count(status=304)
+    )
+
+    # the PRs are fetched once, without fetching their repos
+    assert fake_github.count("GET", "/repos/conda-forge/c-feedstock/pulls/7") == 0
+    for name in ["a-feedstock", "b-feedstock"]:
+        assert fake_github.count("GET", "/repos/conda-forge/" + name) == 0
+    # one evaluation per SHA of each repo
+    sha = feedstock_repo["head_sha"]
+    for name in ["a-feedstock", "b-feedstock"]:
+        path = "/repos/conda-forge/%s/commits/%s/status" % (name, sha)
+        assert fake_github.count("GET", path) == 1
+    for name, number in [("a", 1), ("a", 2), ("b", 1)]:
+        path = "/repos/conda-forge/%s-feedstock/pulls/%d/merge" % (name, number)
+        assert fake_github.count("PUT", path) == 1
+
+    out = format_summary(summary)
+    assert out.startswith("sweep summary:")
+    assert "merged" in out
+
+
+def test_sweep_search_pages(fake_github):
+    items = [
+        _search_item(fake_github, "conda-forge/f%d-feedstock" % i, 1)
+        for i in range(250)
+    ]
+    fake_github.routes[("GET", "/search/issues")] = _search_route(
+        fake_github, {"in:title": items, "label:automerge": items[:10]}
+    )
+    gh = create_api_sessions("token", base_url=fake_github.url, http_cache=LRUCache())
+
+    candidates = _search_candidates(gh.requester, "conda-forge")
+
+    assert candidates == [("conda-forge/f%d-feedstock" % i, 1) for i in range(250)]
+    assert fake_github.count("GET", "/search/issues") == 4
+
+
+@unittest.mock.patch("conda_forge_automerge_action.sweep.SEARCH_MAX_RESULTS", 10)
+def test_sweep_search_split(fake_github):
+    start = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    items = [
+        _search_item(
+            fake_github,
+            "conda-forge/f%d-feedstock" % i,
+            1,
+            created_at=(start + datetime.timedelta(days=7 * i)).strftime(
+                "%Y-%m-%dT%H:%M:%SZ"
+            ),
+        )
+        for i in range(35)
+    ]
+    fake_github.routes[("GET", "/search/issues")] = _search_route(
+        fake_github, {"in:title": items, "label:automerge": []}
+    )
+    gh = create_api_sessions("token", base_url=fake_github.url, http_cache=LRUCache())
+
+    candidates = _search_candidates(gh.requester, "conda-forge")
+
+    # all PRs are found, in creation order, from parts under the cap
+    assert candidates == [("conda-forge/f%d-feedstock" % i, 1) for i in range(35)]
+    assert fake_github.count("GET", "/search/issues") > 4
+
+
+@unittest.mock.patch("conda_forge_automerge_action.__main__.run_sweep")
+def test_cli_sweep(sweep_mock):
+    cli(["sweep", "--org", "blah", "--max-concurrency", "8"])
+    sweep_mock.assert_called_once_with(org="blah", max_concurrency=8)
@@ -0,0 +1,141 @@
+import unittest.mock
+
+import pytest
+
+from ..api_sessions import create_api_sessions
+from ..automerge import COMMENT_MARKER, _upsert_pr_comment
+from ..cache import LRUCache
+from .fake_github import paginated_route
+
+ISSUE = "/repos/conda-forge/blah-feedstock/issues/1"
+
+
+class FakeComments:
+    """the comments of an issue in the fake GitHub"""
+
+    def __init__(self, fake):
+        self.fake = fake
+        self.comments = []
+        self.next_id = 1
+        self.before_create = None
+        self.after_create = None
+        fake.routes[("GET", ISSUE + "/comments")] = paginated_route(
+            fake, lambda: self.comments
+        )
+        fake.routes[("POST", ISSUE + "/comments")] = self._create
+
+    def add(self, body):
+        path = "/repos/conda-forge/blah-feedstock/issues/comments/%d" % self.next_id
+        item = {"id": self.next_id, "url": self.fake.url + path, "body": body}
+        self.next_id += 1
+        self.comments.append(item)
+        self.fake.routes[("PATCH", path)] = lambda req: self._edit(item, req)
+        self.fake.routes[("DELETE", path)] = lambda req: self._delete(item)
+        return item
+
+    def _create(self, req):
+        if self.before_create is not None:
+            self.before_create()
+        item = self.add(req["json"]["body"])
+        if self.after_create is not None:
+            self.after_create()
+        return 201, {}, item
+
+    def _edit(self, item, req):
+        item["body"] = req["json"]["body"]
+        return item
+
+    def _delete(self, item):
+        self.comments.remove(item)
+        return 204, {}, None
+
+
+@pytest.fixture
+def pr(fake_github):
+    gh = create_api_sessions("token", base_url=fake_github.url, http_cache=LRUCache())
+    pr = unittest.mock.MagicMock()
+    pr.requester = gh.requester
+    pr.issue_url = fake_github.url + ISSUE
+    return pr
+
+
+def _body(text, kind="statuses"):
+    return text + "\n" + COMMENT_MARKER % kind
+
+
+def test_upsert_pr_comment(fake_github, pr):
+    comments = FakeComments(fake_github)
+    comments.add("hi")
+
+    assert _upsert_pr_comment(pr, "blah", "statuses") == "created"
+    assert [c["body"] for c in comments.comments] == ["hi", _body("blah")]
+
+    assert _upsert_pr_comment(pr, "blah", "statuses") == "unchanged"
+    assert fake_github.count("PATCH") == 0
+
+    assert _upsert_pr_comment(pr, "blah blah", "statuses") == "edited"
+    assert [c["body"] for c in comments.comments] == ["hi", _body("blah blah")]
+
+    # other kinds of comments are separate
+    assert _upsert_pr_comment(pr, "blah", "non-bot-commits") == "created"
+    assert len(comments.comments) == 3
+
+
+def test_upsert_pr_comment_newest_first(fake_github, pr):
+    comments = FakeComments(fake_github)
+    comments.add(_body("old", kind="non-bot-commits"))
+    for i in range(250):
+        comments.add("comment %d" % i)
+    comments.add(_body("blah"))
+    comments.add("comment")
+
+    assert _upsert_pr_comment(pr, "blah", "statuses") == "unchanged"
+    # the first page for the links, then only the last page
+    assert fake_github.count("GET", ISSUE + "/comments") == 2
+
+
+def test_upsert_pr_comment_legacy(fake_github, pr):
+    comments = FakeComments(fake_github)
+    comments.add("I considered the following status checks")
+
+    assert (
+        _upsert_pr_comment(
+            pr, "blah", "statuses", legacy_slug="I considered the following"
+        )
+        == "edited"
+    )
+    assert [c["body"] for c in comments.comments] == [_body("blah")]
+
+
+def test_upsert_pr_comment_race_lost(fake_github, pr):
+    comments = FakeComments(fake_github)
+    comments.add("hi")
+
+    # another run creates its comment just before ours
+    def _race():
+        comments.before_create = None
+        comments.add(_body("other"))
+
+    comments.before_create = _race
+
+    assert _upsert_pr_comment(pr, "blah", "statuses") == "edited"
+    assert [c["body"] for c in comments.comments] == ["hi", _body("blah")]
+    assert comments.comments[1]["id"] == 2
+    assert fake_github.count("DELETE") == 1
+
+
+def test_upsert_pr_comment_race_won(fake_github, pr):
+    comments = FakeComments(fake_github)
+    comments.add("hi")
+
+    # another run creates its comment just after ours
+    def _race():
+        comments.after_create = None
+        comments.add(_body("other"))
+
+    comments.after_create = _race
+
+    assert _upsert_pr_comment(pr, "blah", "statuses") == "created"
+    assert fake_github.count("DELETE") == 0
+    # the other run deletes its comment when it checks
+    assert comments.comments[1]["body"] == _body("blah")
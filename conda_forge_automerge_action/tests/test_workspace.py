@@ -0,0 +1,185 @@
+import os
+import unittest.mock
+
+import pytest
+
+from ..automerge import _get_conda_forge_config, _get_required_checks_and_statuses
+from ..git_utils import (
+    GitTransport,
+    RepoWorkspace,
+    _run_git_command,
+    get_git_transport,
+)
+
+
+def _make_pr(feedstock_repo, number=1, head_sha=None):
+    pr = unittest.mock.MagicMock()
+    pr.number = number
+    pr.base.ref = "main"
+    pr.base.repo.clone_url = feedstock_repo["clone_url"]
+    pr.head.repo.clone_url = feedstock_repo["clone_url"]
+    pr.head.sha = head_sha or feedstock_repo["head_sha"]
+    return pr
+
+
+@unittest.mock.patch(
+    "conda_forge_automerge_action.git_utils._run_git_command",
+    wraps=_run_git_command,
+)
+def test_workspace_clones_once(git_mock, feedstock_repo):
+    pr = _make_pr(feedstock_repo)
+    with RepoWorkspace(pr) as ws:
+        cfg = _get_conda_forge_config(pr, workspace=ws)
+        req = _get_required_checks_and_statuses(pr, cfg, workspace=ws)
+
+    assert cfg["bot"]["automerge"] is True
+    assert req == ["linter", "azure", "circle"]
+
+    clones = [c for c in git_mock.call_args_list if c.args[0] == "clone"]
+    assert len(clones) == 1
+    fetches = [c for c in git_mock.call_args_list if "fetch" in c.args]
+    assert len(fetches) == 1
+    assert "refs/pull/1/head" in fetches[0].args
+
+
+def test_workspace_head_fallback_to_sha(feedstock_repo):
+    # no PR ref with this number so we have to fetch the commit directly
+    pr = _make_pr(feedstock_repo, number=2)
+    with RepoWorkspace(pr) as ws:
+        assert ws.head_sha == feedstock_repo["head_sha"]
+        assert "dummy" in ws.read_file(ws.head_sha, "azure-pipelines.yml")
+
+
+def test_workspace_head_missing(feedstock_repo):
+    pr = _make_pr(feedstock_repo, number=2, head_sha="0" * 40)
+    with RepoWorkspace(pr) as ws:
+        with pytest.raises(RuntimeError):
+            ws.head_sha
+
+
+def test_workspace_is_lazy():
+    pr = unittest.mock.MagicMock()
+    with RepoWorkspace(pr) as ws:
+        pass
+    assert ws.path is None
+
+
+def test_required_checks_from_tree_reads_no_blobs(feedstock_repo):
+    pr = _make_pr(feedstock_repo)
+    with RepoWorkspace(pr) as ws:
+        req = _get_required_checks_and_statuses(pr, {}, workspace=ws)
+        objs = _run_git_command(
+            "-C", ws.path, "rev-list", "--objects", "--missing=print", ws.head_sha
+        ).splitlines()
+        circle_blob = _run_git_command(
+            "-C", ws.path, "rev-parse", f"{ws.head_sha}:.circleci/config.yml"
+        ).strip()
+
+        # nothing was checked out
+        assert os.listdir(ws.path) == [".git"]
+
+    assert req == ["linter", "azure", "circle"]
+    missing = {o[1:] for o in objs if o.startswith("?")}
+    # everything but the circle config is still missing
+    assert circle_blob not in missing
+    assert len(missing) == 3
+
+
+@pytest.mark.parametrize("mode", ["full", "partial", "sparse"])
+def test_workspace_transport_modes(feedstock_repo, mode):
+    pr = _make_pr(feedstock_repo)
+    transport = GitTransport(mode)
+    with RepoWorkspace(pr, transport=transport) as ws:
+        cfg = _get_conda_forge_config(pr, workspace=ws)
+        req = _get_required_checks_and_statuses(pr, cfg, workspace=ws)
+        files = sorted(os.listdir(ws.path))
+
+    assert cfg["bot"]["automerge"] is True
+    assert req == ["linter", "azure", "circle"]
+    if mode == "full":
+        assert "big.bin" in files
+    elif mode == "sparse":
+        assert files == [".circleci", ".git", "azure-pipelines.yml"]
+    else:
+        assert files == [".git"]
+
+    summary = transport.summary()
+    assert summary["mode"] == mode
+    assert summary["bytes"] > 0
+    assert summary["seconds"] > 0
+    assert {s["op"] for s in transport.stats} >= {"clone", "fetch"}
+
+
+def test_git_transport_bad_mode(monkeypatch):
+    with pytest.raises(ValueError):
+        GitTransport("blah")
+
+    monkeypatch.setenv("INPUT_GIT_TRANSPORT", "Sparse")
+    assert get_git_transport().mode == "sparse"
+    monkeypatch.setenv("INPUT_GIT_TRANSPORT", "")
+    assert get_git_transport().mode == "partial"
+
+
+@pytest.mark.parametrize("mode", ["full", "partial"])
+def test_workspace_mirror(tmp_path, feedstock_repo, mode):
+    pr = _make_pr(feedstock_repo)
+    pr.base.repo.full_name = "conda-forge/blah-feedstock"
+    mirror_dir = str(tmp_path / "mirrors")
+
+    def _run():
+        transport = GitTransport(mode, mirror_dir=mirror_dir)
+        with RepoWorkspace(pr, transport=transport) as ws:
+            cfg = _get_conda_forge_config(pr, workspace=ws)
+            req = _get_required_checks_and_statuses(pr, cfg, workspace=ws)
+            alternates = open(
+                os.path.join(ws.path, ".git", "objects", "info", "alternates")
+            ).read()
+        assert cfg["bot"]["automerge"] is True
+        assert req == ["linter", "azure", "circle"]
+        assert alternates.strip() == os.path.join(
+            mirror_dir, "conda-forge", "blah-feedstock.git", "objects"
+        )
+        return transport
+
+    transport = _run()
+    mirror_stats = [s for s in transport.stats if s["op"] == "mirror"]
+    assert len(mirror_stats) == 1
+    assert mirror_stats[0]["bytes"] > 0
+
+    # the second time around the mirror is refreshed and nothing is cloned
+    transport = _run()
+    ops = {s["op"]: s for s in transport.stats}
+    assert "mirror" not in ops
+    assert ops["fetch"]["bytes"] == 0
+    assert ops["clone"]["bytes"] < 1000
+
+
+def test_workspace_mirror_refresh(tmp_path, feedstock_repo):
+    pr = _make_pr(feedstock_repo)
+    pr.base.repo.full_name = "conda-forge/blah-feedstock"
+    transport = GitTransport(mirror_dir=str(tmp_path / "mirrors"))
+    with RepoWorkspace(pr, transport=transport) as ws:
+        assert "# version 2" in ws.read_file(ws.base_sha, "conda-forge.yml")
+
+    # push a new commit to the feedstock
+    bare = feedstock_repo["clone_url"][len("file://") :]
+    src = str(tmp_path / "new")
+    _run_git_command("clone", "--quiet", bare, src)
+    with open(os.path.join(src, "conda-forge.yml"), "w") as fp:
+        fp.write("bot:\n  automerge: false\n")
+    _run_git_command(
+        "-C",
+        src,
+        "-c",
+        "user.name=test",
+        "-c",
+        "user.email=test@test.com",
+        "commit",
+        "--quiet",
+        "-am",
+        "new",
+    )
+    _run_git_command("-C", src, "push", "--quiet", "origin", "main")
+
+    with RepoWorkspace(pr, transport=transport) as ws:
+        assert "false" in ws.read_file(ws.base_sha, "conda-forge.yml")
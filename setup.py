@@ -6,7 +6,7 @@ setup(
     packages=find_packages(),
     entry_points={
         "console_scripts": [
-            "run-automerge-action=conda_forge_automerge_action.__main__:main",
+            "run-automerge-action=conda_forge_automerge_action.__main__:cli",
         ],
     },
 )